@@ -0,0 +1,4 @@
+from etl.cli import cli
+
+# Allows `python -m etl <command>` without installing the package.
+cli(prog_name="master-contact")
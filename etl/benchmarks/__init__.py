@@ -0,0 +1 @@
+# Benchmarks for the ETL pipeline. These are standalone scripts, run from the project root.
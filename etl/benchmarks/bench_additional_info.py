@@ -0,0 +1,74 @@
+import glob
+import json
+import os
+import sys
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+# Add project root to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from etl.scripts.transform import orjson, serialize_rows_to_json
+
+
+def legacy_serialize(df: pd.DataFrame) -> list:
+    """The row-by-row serialization apply_transformations used before."""
+    raw_json_df = df.replace({np.nan: None})
+    return raw_json_df.apply(lambda row: row.to_dict(), axis=1).apply(json.dumps).tolist()
+
+
+def load_sample(pattern: str, rows: int) -> pd.DataFrame:
+    """Reads the sample files and repeats them until the frame has `rows` rows."""
+    files = sorted(glob.glob(pattern))
+    if not files:
+        raise click.ClickException(f"No sample files match {pattern}")
+    sample = pd.concat([pd.read_csv(path) for path in files], ignore_index=True)
+    repeats = -(-rows // len(sample))
+    return pd.concat([sample] * repeats, ignore_index=True).iloc[:rows]
+
+
+def time_it(func, df: pd.DataFrame, repeat: int):
+    """Returns the best wall time of `repeat` runs and the last result."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+@click.command()
+@click.option('--pattern', default="etl/processed_data/SalesOutreachReport_*.csv", help="Glob of sample files to serialize.")
+@click.option('--rows', default=100_000, help="Number of rows to serialize.")
+@click.option('--repeat', default=3, help="Runs per serializer; the best time is reported.")
+def main(pattern, rows, repeat):
+    """Compares the throughput of additional_info serializers."""
+    df = load_sample(pattern, rows)
+    print(f"Serializing {len(df)} rows x {df.shape[1]} columns (best of {repeat}).")
+
+    serializers = [
+        ("legacy apply + json.dumps", legacy_serialize),
+        ("columnar + json.dumps", lambda frame: serialize_rows_to_json(frame, use_fast_backend=False)),
+    ]
+    if orjson is not None:
+        serializers.append(("columnar + orjson", serialize_rows_to_json))
+    else:
+        print("orjson is not installed; skipping the fast backend.")
+
+    baseline_seconds, expected = time_it(serializers[0][1], df, repeat)
+    expected = [json.loads(doc) for doc in expected]
+    print(f"{'serializer':<28} {'seconds':>9} {'rows/sec':>12} {'speedup':>8}")
+    for name, func in serializers:
+        seconds, result = (baseline_seconds, None) if func is serializers[0][1] else time_it(func, df, repeat)
+        if result is not None and [json.loads(doc) for doc in result] != expected:
+            raise click.ClickException(f"{name} produced different documents than the legacy serializer.")
+        print(f"{name:<28} {seconds:>9.3f} {len(df) / seconds:>12,.0f} {baseline_seconds / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
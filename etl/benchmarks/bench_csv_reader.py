@@ -0,0 +1,73 @@
+import glob
+import os
+import sys
+import time
+from pathlib import Path
+
+import click
+import pandas as pd
+
+# Add project root to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from etl.scripts.csv_reader import pa, read_csv, sniff_csv
+from etl.scripts.utils import load_config
+
+
+def legacy_read(path: Path, config: dict) -> pd.DataFrame:
+    """The plain read extract_data used before."""
+    return pd.read_csv(path)
+
+
+def with_engine(engine: str):
+    """Returns a reader that uses csv_reader.read_csv with the given engine."""
+    def read(path: Path, config: dict) -> pd.DataFrame:
+        return read_csv(path, {**config, "extract": {**(config.get("extract", {}) or {}), "csv_engine": engine}})
+    return read
+
+
+def time_it(func, files: list, config: dict, repeat: int):
+    """Returns the best wall time of `repeat` passes over all files and the rows read."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = sum(len(func(path, config)) for path in files)
+        best = min(best, time.perf_counter() - start)
+    return best, rows
+
+
+@click.command()
+@click.option('--pattern', default="etl/processed_data/SalesOutreachReport_*.csv", help="Glob of sample files to read.")
+@click.option('--copies', default=20, help="Times each sample file is read per pass.")
+@click.option('--repeat', default=3, help="Passes per reader; the best time is reported.")
+def main(pattern, copies, repeat):
+    """Compares the throughput of the legacy and the shared CSV readers."""
+    files = [Path(path) for path in sorted(glob.glob(pattern))]
+    if not files:
+        raise click.ClickException(f"No sample files match {pattern}")
+    config = load_config()
+    files = files * copies
+    megabytes = sum(path.stat().st_size for path in files) / 1024 / 1024
+    print(f"Reading {len(files)} files, {megabytes:.1f} MB per pass (best of {repeat}).")
+
+    readers = [
+        ("legacy pd.read_csv", legacy_read),
+        ("sniff only", lambda path, _: sniff_csv(path).columns),
+        ("read_csv, C engine", with_engine("c")),
+    ]
+    if pa is not None:
+        readers.append(("read_csv, pyarrow engine", with_engine("pyarrow")))
+    else:
+        print("pyarrow is not installed; skipping the pyarrow engine.")
+
+    baseline_seconds, _ = time_it(legacy_read, files, config, repeat)
+    print(f"{'reader':<26} {'seconds':>9} {'MB/sec':>9} {'speedup':>8}")
+    for name, func in readers:
+        seconds = baseline_seconds if func is legacy_read else time_it(func, files, config, repeat)[0]
+        print(f"{name:<26} {seconds:>9.3f} {megabytes / seconds:>9.1f} {baseline_seconds / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
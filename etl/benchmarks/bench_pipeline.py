@@ -0,0 +1,528 @@
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import click
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine, make_url
+
+# Add project root to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from etl.scripts.database import get_db_engine, get_pool_stats
+from etl.scripts.dedup_index import CompanyNameIndex, DatabaseNameIndex
+from etl.scripts.instrumentation import StageRecorder, peak_rss_mb, recording, stage
+from etl.scripts.main import deduplicate_chunks, load_file, prepare_file
+from etl.scripts.phone_filter import DatabasePhoneFilter
+from etl.scripts.phone_index import PhoneIndex
+from etl.scripts.setup_database import setup_database
+from etl.scripts.transform import resolve_profile
+from etl.scripts.utils import load_config, setup_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESULTS_DIRECTORY = os.path.join(project_root, "etl", "benchmarks", "results")
+# Rows generated and written to the synthetic file at a time.
+WRITE_BLOCK_ROWS = 100_000
+
+SYLLABLES = np.array([consonant + vowel for consonant in "bdfgklmnprstvz" for vowel in "aeiou"])
+LEGAL_FORMS = np.array(["GmbH", "AG", "SA", "Sàrl", "KG", "GmbH & Co. KG", "Holding", "Group"])
+INDUSTRIES = np.array([
+    "information technology & services", "marketing & advertising", "construction", "hospital & health care",
+    "financial services", "real estate", "events services", "logistics & supply chain", "retail",
+    "mechanical or industrial engineering", "management consulting", "staffing & recruiting",
+])
+SEGMENTS = np.array([
+    "Small and medium-sized businesses", "Large enterprises", "Public sector", "Healthcare providers",
+    "Real estate owners", "Retailers and e-commerce", "Manufacturers",
+])
+TEXTS = np.array([
+    "The company offers services to other businesses, including consulting, implementation and support for "
+    "customers across the region.",
+    "Ich rufe Sie an, weil wir bereits sehr erfolgreich ein ähnliches Projekt für ein Unternehmen aus Ihrer "
+    "Branche umgesetzt haben.",
+    "The website describes products for private customers only; no business offering was found.",
+    "Family-owned business with several locations, serving local companies and public institutions since 1987.",
+    "",
+])
+
+# Columns of the real exports that are not promoted, so the synthetic rows
+# are as wide as the production files. The kind selects the generated values.
+EXTRA_COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    "Apollo": [
+        ("# Employees", "count"), ("Keywords", "text"), ("Company City", "text"),
+        ("Company Country", "text"), ("Short Description", "text"),
+    ],
+    "SalesOutreachReport": [
+        ("is_b2b_reason", "text"), ("serves_1000", "yes_no"), ("serves_1000_reason", "text"),
+        ("sales_pitch", "text"), ("description", "text"), ("matched_golden_partner", "text"),
+        ("match_reasoning", "text"), ("Rank", "count"), ("Original Row Number", "count"), ("ScrapeStatus", "text"),
+    ],
+    "Regeneration": [
+        ("# Employees", "count"), ("original_index", "count"), ("serves_1000", "yes_no"),
+        ("sales_pitch", "text"), ("matched_golden_partner", "text"), ("match_reasoning", "text"),
+    ],
+}
+DEFAULT_EXTRA_COLUMNS = [("description", "text")]
+
+# The generated values of each promoted column.
+TARGET_KINDS = {
+    "company_name": "company_name",
+    "url": "url",
+    "phone_number": "phone_number",
+    "industry": "industry",
+    "is_b2b": "yes_no",
+    "customer_target_segments": "segment",
+}
+
+
+def parse_size(value: str) -> int:
+    """Parses a row count such as 10000, 10k or 1M."""
+    match = re.fullmatch(r"\s*(\d+)\s*([kKmM]?)\s*", value)
+    if not match:
+        raise click.BadParameter(f"Invalid size '{value}'. Use e.g. 10000, 10k or 1M.")
+    return int(match.group(1)) * {"": 1, "k": 1_000, "m": 1_000_000}[match.group(2).lower()]
+
+
+def size_label(rows: int) -> str:
+    for factor, suffix in ((1_000_000, "M"), (1_000, "k")):
+        if rows >= factor and rows % factor == 0:
+            return f"{rows // factor}{suffix}"
+    return str(rows)
+
+
+def random_names(rng: np.random.Generator, count: int) -> np.ndarray:
+    """
+    Returns random company names of three pronounceable words and a legal
+    form. Two random names are practically never similar enough to be
+    taken for duplicates.
+    """
+    syllables = SYLLABLES[rng.integers(0, len(SYLLABLES), size=(count, 3, 3))]
+    words = np.char.capitalize(np.char.add(np.char.add(syllables[..., 0], syllables[..., 1]), syllables[..., 2]))
+    names = np.char.add(np.char.add(words[:, 0], " "), np.char.add(np.char.add(words[:, 1], " "), words[:, 2]))
+    return np.char.add(np.char.add(names, " "), LEGAL_FORMS[rng.integers(0, len(LEGAL_FORMS), size=count)]).astype(object)
+
+
+def near_duplicates(rng: np.random.Generator, names: np.ndarray) -> np.ndarray:
+    """Changes one letter of each name, which keeps it above the fuzzy matching threshold."""
+    result = names.copy()
+    for i, name in enumerate(names):
+        # Only the words are edited, not the legal form, and never their
+        # first letter, which would change the order of the sorted tokens.
+        position = int(rng.integers(1, name.rfind(" ")))
+        while name[position] == " " or name[position - 1] == " ":
+            position += 1
+        replacement = "x" if name[position] != "x" else "q"
+        result[i] = name[:position] + replacement + name[position + 1:]
+    return result
+
+
+def phone_numbers(ids: np.ndarray) -> np.ndarray:
+    """
+    Returns a distinct phone number for each id below 10**8, formatted like
+    the source files ("'+49 30 12345678"). Ids are scrambled so that
+    consecutive rows do not get consecutive numbers.
+    """
+    scrambled = (ids.astype(np.int64) * 2_654_435_761) % 100_000_000
+    return np.char.add("'+49 30 ", np.char.zfill(scrambled.astype(str), 8)).astype(object)
+
+
+def column_values(kind: str, rng: np.random.Generator, names: np.ndarray, phones: np.ndarray) -> np.ndarray:
+    count = len(names)
+    if kind == "company_name":
+        return names
+    if kind == "phone_number":
+        return phones
+    if kind == "url":
+        domains = np.char.lower(np.char.partition(names.astype(str), " ")[:, 0])
+        return np.char.add(np.char.add("http://www.", domains), ".de").astype(object)
+    if kind == "industry":
+        return INDUSTRIES[rng.integers(0, len(INDUSTRIES), size=count)]
+    if kind == "segment":
+        return SEGMENTS[rng.integers(0, len(SEGMENTS), size=count)]
+    if kind == "yes_no":
+        return np.where(rng.random(count) < 0.7, "Yes", "No").astype(object)
+    if kind == "count":
+        return rng.integers(1, 5_000, size=count)
+    return TEXTS[rng.integers(0, len(TEXTS), size=count)]
+
+
+def profile_columns(profile_name: str, config: Dict) -> List[Tuple[str, str]]:
+    """
+    Returns the header of a synthetic file of a profile, with the kind of
+    values of each column: the first source column of each promotion rule,
+    followed by the profile's unpromoted columns.
+    """
+    rules = config["data_source_profiles"][profile_name].get("promotion_rules", {}) or {}
+    columns = [(sources[0], TARGET_KINDS.get(target, "text")) for target, sources in rules.items() if sources]
+    taken = {column for column, _ in columns}
+    extra = EXTRA_COLUMNS.get(profile_name, DEFAULT_EXTRA_COLUMNS)
+    return columns + [(column, kind) for column, kind in extra if column not in taken]
+
+
+def build_rows(
+    columns: List[Tuple[str, str]], rng: np.random.Generator, names: np.ndarray, phones: np.ndarray
+) -> pd.DataFrame:
+    data = {column: column_values(kind, rng, names, phones) for column, kind in columns}
+    return pd.DataFrame(data)
+
+
+class SyntheticSource:
+    """
+    The seed contacts of a benchmark case and the source file loaded on top
+    of them.
+
+    A share of the file's rows repeats the phone number of a seed contact
+    (dropped by the phone check), and another share carries the name of a
+    seed contact with one letter changed (flagged by fuzzy matching). Each
+    such row uses a different seed contact. All other phone numbers and
+    names are new.
+    """
+
+    def __init__(self, profile_name: str, config: Dict, rows: int, seed_rows: int,
+                 duplicate_rate: float, near_duplicate_rate: float, random_seed: int):
+        self.profile_name = profile_name
+        self.columns = profile_columns(profile_name, config)
+        self.rows = rows
+        self.duplicates = int(round(rows * duplicate_rate))
+        self.near_duplicates = int(round(rows * near_duplicate_rate))
+        self.seed_rows = max(seed_rows, self.duplicates + self.near_duplicates)
+        self.random_seed = random_seed
+        rng = np.random.default_rng(random_seed)
+        self.seed_names = random_names(rng, self.seed_rows)
+        self.seed_phones = phone_numbers(np.arange(self.seed_rows))
+
+    def seed_frame(self) -> pd.DataFrame:
+        rng = np.random.default_rng(self.random_seed + 1)
+        return build_rows(self.columns, rng, self.seed_names, self.seed_phones)
+
+    def write_file(self, path: Path):
+        """Writes the source file as CSV, one block of rows at a time."""
+        rng = np.random.default_rng(self.random_seed + 2)
+        seed_picks = rng.choice(self.seed_rows, size=self.duplicates + self.near_duplicates, replace=False)
+        row_picks = rng.choice(self.rows, size=self.duplicates + self.near_duplicates, replace=False)
+        duplicate_rows = pd.Series(seed_picks[:self.duplicates], index=row_picks[:self.duplicates])
+        near_rows = pd.Series(seed_picks[self.duplicates:], index=row_picks[self.duplicates:])
+
+        for start in range(0, self.rows, WRITE_BLOCK_ROWS):
+            ids = np.arange(start, min(start + WRITE_BLOCK_ROWS, self.rows))
+            names = random_names(rng, len(ids))
+            phones = phone_numbers(ids + self.seed_rows)
+
+            duplicates = duplicate_rows[(duplicate_rows.index >= start) & (duplicate_rows.index < ids[-1] + 1)]
+            phones[duplicates.index - start] = self.seed_phones[duplicates.to_numpy()]
+            near = near_rows[(near_rows.index >= start) & (near_rows.index < ids[-1] + 1)]
+            names[near.index - start] = near_duplicates(rng, self.seed_names[near.to_numpy()])
+
+            block = build_rows(self.columns, rng, names, phones)
+            block.to_csv(path, index=False, mode="w" if start == 0 else "a", header=start == 0)
+
+
+def create_database(server_url: str) -> str:
+    """Creates an empty database on the server and returns its URL."""
+    url = make_url(server_url)
+    name = f"etl_bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+    server = create_engine(url, isolation_level="AUTOCOMMIT")
+    try:
+        with server.connect() as connection:
+            connection.execute(text(f'CREATE DATABASE "{name}"'))
+    finally:
+        server.dispose()
+    return url.set(database=name).render_as_string(hide_password=False)
+
+
+def drop_database(server_url: str, database_url: str):
+    name = make_url(database_url).database
+    server = create_engine(make_url(server_url), isolation_level="AUTOCOMMIT")
+    try:
+        with server.connect() as connection:
+            connection.execute(text(f'DROP DATABASE IF EXISTS "{name}"'))
+    finally:
+        server.dispose()
+
+
+def reset_database(engine: Engine):
+    with engine.begin() as connection:
+        connection.execute(text("TRUNCATE contacts, contact_profiles RESTART IDENTITY CASCADE"))
+
+
+def run_file(file_path: Path, config: Dict, engine: Engine, chunk_size: Optional[int]) -> Optional[int]:
+    """
+    Runs one file through the pipeline as `main.py` does: the phone and
+    name lookups are built from the database, then the file is extracted,
+    transformed, cleaned, deduplicated and loaded.
+    """
+    dedup_config = config.get("deduplication", {})
+    fuzzy_enabled = dedup_config.get("enable_fuzzy_matching", True)
+    name_index = None
+    if fuzzy_enabled and dedup_config.get("fuzzy_backend", "index") == "database" and DatabaseNameIndex.is_available(engine):
+        name_index = DatabaseNameIndex(engine)
+    if dedup_config.get("phone_backend", "index") == "database":
+        phone_index = DatabasePhoneFilter(engine)
+    else:
+        phone_index = PhoneIndex.from_config(dedup_config)
+        with stage("phone_index_refresh"):
+            phone_index.refresh(engine)
+    if fuzzy_enabled and name_index is None:
+        name_index = CompanyNameIndex.from_config(dedup_config)
+        with stage("load_existing_names") as measurement:
+            existing_names = pd.read_sql("SELECT company_name FROM contacts", engine)
+            name_index.add(existing_names["company_name"])
+            measurement.rows_out = len(existing_names)
+
+    prepared = prepare_file(file_path, config, chunk_size=chunk_size)
+    deduplicated = deduplicate_chunks(file_path, prepared, config, phone_index, name_index)
+    return load_file(file_path, deduplicated, config, engine, False, phone_index, name_index)
+
+
+def run_case(source: SyntheticSource, config: Dict, engine: Engine, workdir: Path,
+             chunk_size: Optional[int], repeat: int) -> Dict:
+    """Generates the files of a case, runs it `repeat` times and returns the fastest run."""
+    marker = config["data_source_profiles"][source.profile_name].get("file_name_contains", "")
+    label = size_label(source.rows)
+    seed_path = workdir / f"{marker.rstrip('_')}_bench_seed_{label}.csv"
+    file_path = workdir / f"{marker.rstrip('_')}_bench_{label}.csv"
+    for path in (seed_path, file_path):
+        resolved = resolve_profile(path.name, sorted(column for column, _ in source.columns), config)
+        if resolved != source.profile_name:
+            raise click.ClickException(
+                f"Synthetic file {path.name} resolves to profile '{resolved}' instead of '{source.profile_name}'."
+            )
+
+    click.echo(f"[{source.profile_name} {label}] Generating {source.rows:,} rows and {source.seed_rows:,} seed contacts...")
+    started = time.perf_counter()
+    source.seed_frame().to_csv(seed_path, index=False)
+    source.write_file(file_path)
+    file_mb = file_path.stat().st_size / 1024 / 1024
+    click.echo(f"[{source.profile_name} {label}] Generated {file_mb:.1f} MB in {time.perf_counter() - started:.1f}s.")
+
+    best = None
+    processed = Path(config["processed_directory"])
+    for attempt in range(repeat):
+        reset_database(engine)
+        shutil.rmtree(config["deduplication"]["phone_index"]["directory"], ignore_errors=True)
+        # The seed contacts are loaded without deduplication and untimed.
+        load_file(seed_path, prepare_file(seed_path, config), config, engine, False, None, None)
+        (processed / seed_path.name).rename(seed_path)
+
+        recorder = StageRecorder()
+        pool_before = get_pool_stats(engine)
+        started = time.perf_counter()
+        with recording(recorder):
+            loaded = run_file(file_path, config, engine, chunk_size)
+        seconds = time.perf_counter() - started
+        pool_after = get_pool_stats(engine)
+        (processed / file_path.name).rename(file_path)
+
+        totals = {record.stage: record for record in recorder.totals()}
+        phone_check = totals.get("dedup_phone")
+        fuzzy_check = totals.get("dedup_fuzzy")
+        result = {
+            "profile": source.profile_name,
+            "rows": source.rows,
+            "seed_rows": source.seed_rows,
+            "file_mb": round(file_mb, 2),
+            "seconds": round(seconds, 4),
+            "rows_per_second": round(source.rows / seconds, 1),
+            "loaded": loaded or 0,
+            "phone_duplicates": phone_check.rows_in - phone_check.rows_out if phone_check else 0,
+            "near_duplicates": fuzzy_check.rows_in - fuzzy_check.rows_out if fuzzy_check else 0,
+            "peak_rss_mb": peak_rss_mb(),
+            "pool": {
+                "checkouts": pool_after.checkouts - pool_before.checkouts,
+                "connects": pool_after.connects - pool_before.connects,
+                "wait_seconds": round(pool_after.wait_seconds - pool_before.wait_seconds, 4),
+            } if pool_before is not None else None,
+            "stages": [
+                {**record._asdict(), "rows_per_second": record.rows_per_second}
+                for record in recorder.totals()
+                if record.calls
+            ],
+        }
+        click.echo(
+            f"[{source.profile_name} {label}] Run {attempt + 1}/{repeat}: {seconds:.2f}s, "
+            f"{result['rows_per_second']:,.0f} rows/s, {result['loaded']:,} loaded, "
+            f"{result['phone_duplicates']:,} existing phone numbers, {result['near_duplicates']:,} near duplicates."
+        )
+        if best is None or seconds < best["seconds"]:
+            best = result
+
+    seed_path.unlink()
+    file_path.unlink()
+    return best
+
+
+def print_case(case: Dict):
+    click.echo(f"\n{case['profile']} {size_label(case['rows'])}: {case['seconds']:.2f}s, {case['rows_per_second']:,.0f} rows/s")
+    click.echo(f"  {'stage':<22} {'calls':>6} {'seconds':>9} {'share':>6} {'rows/s':>12}")
+    for record in case["stages"]:
+        share = record["seconds"] / case["seconds"] if case["seconds"] else 0
+        rate = f"{record['rows_per_second']:,.0f}" if record["rows_per_second"] else "-"
+        click.echo(f"  {record['stage']:<22} {record['calls']:>6} {record['seconds']:>9.3f} {share:>6.1%} {rate:>12}")
+
+
+def compare_results(baseline: Dict, cases: List[Dict], tolerance: float) -> List[str]:
+    """
+    Compares the cases with the same profile and size in a baseline results
+    file and returns the cases whose throughput dropped by more than the
+    tolerance. Per-stage changes are printed for information only, because
+    short stages are noisy.
+    """
+    baseline_cases = {(case["profile"], case["rows"]): case for case in baseline.get("cases", [])}
+    regressions = []
+    click.echo(f"\nCompared with {baseline.get('git_commit') or 'the baseline'} (tolerance {tolerance:.0%}):")
+    for case in cases:
+        old = baseline_cases.get((case["profile"], case["rows"]))
+        name = f"{case['profile']} {size_label(case['rows'])}"
+        if old is None:
+            click.echo(f"  {name}: not in the baseline")
+            continue
+        change = case["rows_per_second"] / old["rows_per_second"] - 1
+        regressed = change < -tolerance
+        click.echo(f"  {name}: {old['rows_per_second']:,.0f} -> {case['rows_per_second']:,.0f} rows/s ({change:+.1%})"
+                   f"{'  REGRESSION' if regressed else ''}")
+        old_stages = {record["stage"]: record for record in old["stages"]}
+        for record in case["stages"]:
+            before = old_stages.get(record["stage"])
+            if before and before["seconds"] and record["seconds"]:
+                click.echo(f"    {record['stage']:<22} {before['seconds']:>9.3f}s -> {record['seconds']:>9.3f}s "
+                           f"({record['seconds'] / before['seconds'] - 1:+.1%})")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=project_root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option('--config', 'config_path', type=click.Path(exists=True, dir_okay=False), default=os.path.join(project_root, "config.yaml"), help="Pipeline configuration to benchmark, e.g. a copy of config.yaml with other deduplication settings.")
+@click.option('--profiles', default=None, help="Comma-separated data source profiles to generate. Defaults to all profiles in config.yaml.")
+@click.option('--sizes', default="10k,100k", help="Comma-separated rows per file, e.g. 10k,100k,1M,10M.")
+@click.option('--seed-rows', type=click.IntRange(min=0), default=None, help="Contacts in the database before each file is loaded. Defaults to a tenth of the file.")
+@click.option('--duplicate-rate', type=click.FloatRange(0, 1), default=0.05, help="Share of rows whose phone number already exists in the database.")
+@click.option('--near-duplicate-rate', type=click.FloatRange(0, 1), default=0.01, help="Share of rows whose company name is a one-letter variant of an existing name.")
+@click.option('--chunk-size', type=click.IntRange(min=1), default=None, help="Stream each file in chunks of this many rows, as with main.py --chunk-size. Needed for 1M+ rows.")
+@click.option('--repeat', type=click.IntRange(min=1), default=1, help="Runs per case; the fastest is reported.")
+@click.option('--random-seed', default=42, help="Seed of the data generator, so that runs on different commits load identical files.")
+@click.option('--database-url', envvar="BENCH_DATABASE_URL", required=True, help="A PostgreSQL server to create the throwaway benchmark database on (or set BENCH_DATABASE_URL).")
+@click.option('--keep-database', is_flag=True, help="Do not drop the benchmark database at the end.")
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help="Results file. Defaults to etl/benchmarks/results/pipeline_<timestamp>.json.")
+@click.option('--compare', 'baseline_path', type=click.Path(exists=True, dir_okay=False), default=None, help="Results file of an earlier run; exits with an error if throughput dropped.")
+@click.option('--tolerance', type=click.FloatRange(0, 1), default=0.10, help="Throughput drop allowed by --compare.")
+@click.option('--verbose', is_flag=True, help="Show the pipeline's log output.")
+def main(config_path, profiles, sizes, seed_rows, duplicate_rate, near_duplicate_rate, chunk_size, repeat, random_seed,
+         database_url, keep_database, output, baseline_path, tolerance, verbose):
+    """Benchmarks the whole ETL on synthetic files against a throwaway PostgreSQL database."""
+    config = load_config(config_path)
+    profile_names = [name.strip() for name in profiles.split(",")] if profiles else list(config["data_source_profiles"])
+    unknown = [name for name in profile_names if name not in config["data_source_profiles"]]
+    if unknown:
+        raise click.BadParameter(f"Unknown profiles: {', '.join(unknown)}", param_hint="--profiles")
+    row_counts = [parse_size(size) for size in sizes.split(",")]
+    if max(row_counts) > 50_000_000:
+        raise click.BadParameter("At most 50M rows per file are supported.", param_hint="--sizes")
+    baseline = json.loads(Path(baseline_path).read_text()) if baseline_path else None
+    output = output or os.path.join(DEFAULT_RESULTS_DIRECTORY, f"pipeline_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    output = os.path.abspath(output)
+
+    bench_url = create_database(database_url)
+    click.echo(f"Created benchmark database {make_url(bench_url).database}.")
+    previous_cwd = os.getcwd()
+    previous_url = os.environ.get("DATABASE_URL")
+    cases = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="etl_bench_") as workdir:
+            workdir = Path(workdir)
+            # Every file the pipeline writes (processed files, review and
+            # rejected rows, the phone index) goes to the temporary directory.
+            os.chdir(workdir)
+            setup_logging(str(workdir / "benchmark.log"))
+            logging.getLogger().setLevel(logging.INFO if verbose else logging.ERROR)
+            config["source_directory"] = str(workdir / "input")
+            config["processed_directory"] = str(workdir / "processed")
+            config["review_directory"] = str(workdir / "review")
+            config["deduplication"]["phone_index"]["directory"] = str(workdir / "phone_index")
+            config.setdefault("extract", {})["xlsx_cache"] = {"enabled": False}
+            config["tag"] = "benchmark"
+
+            os.environ["DATABASE_URL"] = bench_url
+            setup_database()
+            engine = get_db_engine()
+            try:
+                for profile_name in profile_names:
+                    for rows in row_counts:
+                        source = SyntheticSource(
+                            profile_name, config, rows, seed_rows if seed_rows is not None else rows // 10,
+                            duplicate_rate, near_duplicate_rate, random_seed,
+                        )
+                        cases.append(run_case(source, config, engine, workdir, chunk_size, repeat))
+            finally:
+                engine.dispose()
+    finally:
+        os.chdir(previous_cwd)
+        if previous_url is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = previous_url
+        if keep_database:
+            click.echo(f"Kept benchmark database {make_url(bench_url).database}.")
+        else:
+            drop_database(database_url, bench_url)
+
+    for case in cases:
+        print_case(case)
+
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "parameters": {
+            "config": os.path.abspath(config_path),
+            "duplicate_rate": duplicate_rate,
+            "near_duplicate_rate": near_duplicate_rate,
+            "seed_rows": seed_rows,
+            "chunk_size": chunk_size,
+            "repeat": repeat,
+            "random_seed": random_seed,
+            "phone_backend": config["deduplication"].get("phone_backend", "index"),
+            "fuzzy_matching": config["deduplication"].get("enable_fuzzy_matching", True),
+            "fuzzy_backend": config["deduplication"].get("fuzzy_backend", "index"),
+        },
+        "cases": cases,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    Path(output).write_text(json.dumps(results, indent=2))
+    click.echo(f"\nWrote results to {output}")
+
+    if baseline is not None:
+        regressions = compare_results(baseline, cases, tolerance)
+        if regressions:
+            raise click.ClickException(f"Throughput regressed for: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
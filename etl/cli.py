@@ -0,0 +1,69 @@
+import importlib
+import os
+import sys
+from typing import Dict, Optional, Tuple
+
+import click
+
+# Add project root to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Subcommand name -> ("module:attribute" of its click command, short help).
+# The help text is kept here so that `master-contact --help` does not have
+# to import every module.
+COMMANDS: Dict[str, Tuple[str, str]] = {
+    "etl": ("etl.scripts.main:main", "Run the ETL pipeline on the files in the source directory."),
+    "update-status": ("etl.scripts.update_status:update_contacts", "Mark the contacts in a phone number list as used."),
+    "batch-update": ("etl.scripts.batch_update_from_csv:batch_update", "Mark the contacts in a directory of CSV files as used."),
+    "report": ("etl.scripts.reporting:cli", "Query, export and manage the contacts database."),
+    "setup": ("etl.scripts.setup_database:setup", "Create the database schema and apply pending migrations."),
+    "migrate": ("etl.scripts.migrations:migrate", "Apply or list schema migrations."),
+}
+
+
+class LazyGroup(click.Group):
+    """
+    A command group that imports a subcommand's module only when the
+    subcommand is run. Most subcommands pull in pandas, SQLAlchemy and the
+    database drivers; commands that only look at the filesystem, and
+    `--help`, start without them.
+    """
+
+    def __init__(self, *args, lazy_commands: Optional[Dict[str, Tuple[str, str]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx: click.Context):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx: click.Context, name: str) -> Optional[click.Command]:
+        if name in self.lazy_commands and name not in self.commands:
+            module_name, attribute = self.lazy_commands[name][0].split(":")
+            self.add_command(getattr(importlib.import_module(module_name), attribute), name)
+        return super().get_command(ctx, name)
+
+    def format_commands(self, ctx: click.Context, formatter: click.HelpFormatter):
+        rows = []
+        for name in self.list_commands(ctx):
+            if name in self.commands:
+                rows.append((name, self.commands[name].get_short_help_str(formatter.width)))
+            else:
+                rows.append((name, self.lazy_commands[name][1]))
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+
+@click.group(cls=LazyGroup, lazy_commands=COMMANDS)
+def cli():
+    """
+    Tools for the master contacts database.
+
+    Run from the project directory, where config.yaml and .env are read.
+    """
+
+
+if __name__ == "__main__":
+    cli()
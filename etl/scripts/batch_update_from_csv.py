@@ -1,50 +1,185 @@
+import json
 import logging
 import os
 import sys
+import time
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 import glob
-import pandas as pd
-from sqlalchemy import text
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
 import click
+import pandas as pd
+from sqlalchemy.engine import Engine
 
 # Add project root to the Python path
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from etl.scripts.load import get_db_engine
-from etl.scripts.utils import setup_logging
+from etl.scripts.csv_reader import read_csv, sniff_csv
+from etl.scripts.database import get_db_engine
+from etl.scripts.load import copy_dataframe
+from etl.scripts.manifest import compute_file_hash
+from etl.scripts.phones import normalize_phone_numbers
+from etl.scripts.status_updates import mark_used
+from etl.scripts.utils import load_config, setup_logging
 
-# --- Configuration ---
-setup_logging("etl/logs/batch_update.log")
 logger = logging.getLogger(__name__)
 
-def clean_phone_number(phone):
-    """Removes common characters and whitespace from a phone number."""
-    if not isinstance(phone, str):
-        return None
-    return phone.replace(" ", "").replace("(", "").replace(")", "").replace("-", "")
-
-def find_phone_column(df):
-    """Finds the correct phone number column in a DataFrame."""
+def find_phone_column(columns):
+    """Finds the correct phone number column among a file's columns."""
     possible_columns = ["Company Phone", "Number"]
     for col in possible_columns:
-        if col in df.columns:
+        if col in columns:
             return col
     return None
 
+def read_phones(file_path: str, config: Dict) -> Optional[List[str]]:
+    """
+    Reads the phone column of a CSV file and returns its normalized numbers,
+    distinct and sorted, or None if the file has no phone column.
+    """
+    # The delimiter is sniffed, so each file is parsed once, and only the
+    # phone column is read, as text.
+    csv_format = sniff_csv(Path(file_path))
+    phone_col = find_phone_column(csv_format.columns)
+    if not phone_col:
+        return None
+
+    df = read_csv(file_path, config, usecols=[phone_col], csv_format=csv_format, dtypes={phone_col: "str"})
+    logger.info(f"Extracted phone numbers from '{phone_col}' column in {file_path}.")
+    phones = normalize_phone_numbers(df[phone_col], config.get("phone_normalization"))
+    return sorted(phones.dropna().unique())
+
+def iter_file_phones(files: List[str], config: Dict, workers: int) -> Iterator[Tuple[str, Future]]:
+    """
+    Reads files in a pool of threads and yields the future of each file's
+    phone numbers, in the order of `files`. At most two files per thread
+    are read ahead, which bounds the memory held by numbers not yet applied.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        files_iter = iter(files)
+        pending = deque((path, pool.submit(read_phones, path, config)) for path in islice(files_iter, workers * 2))
+        while pending:
+            file_path, future = pending.popleft()
+            next_file = next(files_iter, None)
+            if next_file is not None:
+                pending.append((next_file, pool.submit(read_phones, next_file, config)))
+            yield file_path, future
+
+class PhoneReport:
+    """
+    Counts the distinct phone numbers of several files, and how many of
+    them belong to a contact, for `--report-only`.
+
+    The numbers are collected in a temporary table keyed by the number, so
+    a number that appears in several files is counted once, as it is
+    applied once by a real run, without holding all numbers in the ETL.
+    Use as a context manager; the transaction holding the table is rolled
+    back on exit, so the database is not changed.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+
+    def __enter__(self) -> "PhoneReport":
+        self._connection = self.engine.connect()
+        self._cursor = self._connection.connection.cursor()
+        self._cursor.execute("CREATE TEMP TABLE report_phones (phone_number TEXT PRIMARY KEY) ON COMMIT DROP")
+        self._cursor.execute("CREATE TEMP TABLE report_batch (phone_number TEXT) ON COMMIT DROP")
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self._cursor.close()
+            self._connection.connection.rollback()
+        finally:
+            self._connection.close()
+
+    def add(self, phones: List[str]):
+        """Adds a file's numbers; numbers already added are ignored."""
+        self._cursor.execute("TRUNCATE report_batch")
+        copy_dataframe(self._cursor, pd.DataFrame({"phone_number": phones}), "report_batch")
+        self._cursor.execute(
+            "INSERT INTO report_phones SELECT DISTINCT phone_number FROM report_batch ON CONFLICT DO NOTHING"
+        )
+
+    def counts(self) -> Tuple[int, int]:
+        """Returns the number of distinct numbers added and how many of them are in the contacts table."""
+        self._cursor.execute(
+            "SELECT COUNT(*), COUNT(*) FILTER (WHERE EXISTS "
+            "(SELECT 1 FROM contacts c WHERE c.phone_number = r.phone_number)) FROM report_phones r"
+        )
+        total, found = self._cursor.fetchone()
+        return total, found
+
+def _checkpoint_path(checkpoint_directory: str, file_path: str, tag: str) -> Path:
+    """The checkpoint of a file is keyed by its content and the tag applied."""
+    return Path(checkpoint_directory) / f"{compute_file_hash(Path(file_path))}_{tag}.json"
+
+def load_checkpoint(path: Path) -> Dict:
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_checkpoint(path: Path, checkpoint: Dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def report_phones(engine: Engine, files: List[str], config: Dict, workers: int):
+    """Prints how many distinct numbers the files contain and how many of them belong to a contact."""
+    with PhoneReport(engine) as report:
+        for file_path, future in iter_file_phones(files, config, workers):
+            try:
+                phones = future.result()
+            except Exception as e:
+                logger.error(f"Failed to process file {file_path}: {e}")
+                continue
+            if phones is None:
+                logger.warning(f"No recognized phone number column found in {file_path}. Skipping.")
+                continue
+            report.add(phones)
+        total_phones, found_count = report.counts()
+
+    print("\n--- Dry Run Report ---")
+    print(f"Unique phone numbers in source files: {total_phones}")
+    print(f"Phone numbers found in the database: {found_count}")
+    print("----------------------")
+
 @click.command()
 @click.argument('input_dir', type=click.Path(exists=True))
 @click.option('--report-only', is_flag=True, help="Run in report-only mode without updating the database.")
 @click.option('--tag', default='used', help="The tag to apply to the updated contacts.")
-def batch_update(input_dir, report_only, tag):
+@click.option('--batch-size', type=click.IntRange(min=1), default=None, help="Phone numbers updated and committed per transaction (default: batch_update.batch_size).")
+@click.option('--workers', type=click.IntRange(min=1), default=None, help="Threads reading files in parallel (default: batch_update.workers).")
+@click.option('--restart', is_flag=True, help="Ignore checkpoints and apply every file from the start.")
+def batch_update(input_dir, report_only, tag, batch_size, workers, restart):
     """
     Scans a directory for CSV files, extracts phone numbers, and updates their status.
+
+    Files are read in parallel. The numbers of each file are sorted and
+    applied in batches of neighbouring keys, each committed on its own, so
+    no transaction locks large parts of the contacts table. After each
+    batch, the last applied number is checkpointed; an interrupted run
+    resumes after it, and files already applied are skipped.
     """
+    setup_logging("etl/logs/batch_update.log")
     logger.info(f"--- Starting Batch Contact Status Update from directory: {input_dir} ---")
-    
-    all_phones = set()
-    source_files = glob.glob(os.path.join(input_dir, "*.csv"))
+
+    config = load_config()
+    settings = config.get("batch_update", {}) or {}
+    batch_size = batch_size or settings.get("batch_size", 10_000)
+    workers = workers or settings.get("workers", 4)
+    checkpoint_directory = settings.get("checkpoint_directory", "etl/cache/batch_update")
+    source_files = sorted(glob.glob(os.path.join(input_dir, "*.csv")))
 
     if not source_files:
         logger.warning(f"No CSV files found in directory: {input_dir}")
@@ -52,79 +187,75 @@ def batch_update(input_dir, report_only, tag):
 
     logger.info(f"Found {len(source_files)} CSV files to process.")
 
-    for file_path in source_files:
-        try:
-            try:
-                # First, try to read as a standard comma-separated CSV
-                df = pd.read_csv(file_path)
-            except Exception:
-                # If that fails, try reading as a tab-separated file
-                logger.info(f"Could not parse {file_path} as standard CSV, trying tab-separated...")
-                df = pd.read_csv(file_path, sep='\t')
-
-            phone_col = find_phone_column(df)
-            
-            if not phone_col:
-                logger.warning(f"No recognized phone number column found in {file_path}. Skipping.")
-                continue
+    engine = get_db_engine()
+    if report_only:
+        logger.info("--- Running in Report-Only Mode ---")
+        report_phones(engine, source_files, config, workers)
+        return
+
+    used_at = datetime.now()
+    started = time.perf_counter()
+    total_phones = matched = updated_count = batches = skipped_files = 0
+    lock_seconds = max_lock_seconds = 0.0
 
-            logger.info(f"Extracting phone numbers from '{phone_col}' column in {file_path}...")
-            phones_in_file = df[phone_col].dropna().tolist()
-            for phone in phones_in_file:
-                cleaned = clean_phone_number(str(phone))
-                if cleaned:
-                    all_phones.add(cleaned)
+    for file_path, future in iter_file_phones(source_files, config, workers):
+        try:
+            phones = future.result()
         except Exception as e:
             logger.error(f"Failed to process file {file_path}: {e}")
             continue
-            
-    if not all_phones:
+        if phones is None:
+            logger.warning(f"No recognized phone number column found in {file_path}. Skipping.")
+            continue
+
+        checkpoint_path = _checkpoint_path(checkpoint_directory, file_path, tag)
+        checkpoint = {} if restart else load_checkpoint(checkpoint_path)
+        if checkpoint.get("completed"):
+            logger.info(f"Skipping {file_path}: a checkpoint records it as already applied with tag '{tag}'.")
+            skipped_files += 1
+            continue
+        if checkpoint.get("last_phone") is not None:
+            done = bisect_right(phones, checkpoint["last_phone"])
+            logger.info(f"Resuming {file_path} after {done} of {len(phones)} phone numbers applied by an earlier run.")
+            phones = phones[done:]
+        total_phones += len(phones)
+
+        try:
+            for start in range(0, len(phones), batch_size):
+                batch = phones[start:start + batch_size]
+                result = mark_used(engine, batch, tag=tag, used_at=used_at)
+                save_checkpoint(checkpoint_path, {"file": os.path.basename(file_path), "last_phone": batch[-1]})
+                matched += result.matched
+                updated_count += result.updated
+                batches += 1
+                lock_seconds += result.lock_seconds
+                max_lock_seconds = max(max_lock_seconds, result.lock_seconds)
+                logger.info(
+                    f"{os.path.basename(file_path)}: committed {start + len(batch)}/{len(phones)} phone numbers "
+                    f"({result.matched} matched, {result.updated} updated)."
+                )
+        except Exception as e:
+            logger.error(
+                f"An error occurred during the database update of {file_path}. Committed batches are kept; "
+                f"run the update again to resume. Error: {e}"
+            )
+            raise
+        save_checkpoint(checkpoint_path, {"file": os.path.basename(file_path), "completed": True})
+
+    elapsed = time.perf_counter() - started
+    if not total_phones and not skipped_files:
         logger.warning("No valid phone numbers found across all files.")
         return
-        
-    logger.info(f"Found a total of {len(all_phones)} unique phone numbers to update.")
 
-    engine = get_db_engine()
-    
-    if report_only:
-        logger.info("--- Running in Report-Only Mode ---")
-        with engine.connect() as connection:
-            try:
-                # Use a single, parameterized query for security and efficiency
-                query = text("SELECT COUNT(id) FROM contacts WHERE phone_number = ANY(:phones)")
-                result = connection.execute(query, {"phones": list(all_phones)}).scalar_one_or_none()
-                found_count = result if result is not None else 0
-                
-                print("\n--- Dry Run Report ---")
-                print(f"Total unique phone numbers in source files: {len(all_phones)}")
-                print(f"Phone numbers found in the database: {found_count}")
-                print("----------------------")
-
-            except Exception as e:
-                logger.error(f"An error occurred during the database query: {e}")
-    else:
-        updated_count = 0
-        with engine.connect() as connection:
-            with connection.begin():
-                try:
-                    # Use a single, parameterized query to update all contacts at once
-                    update_sql = text("""
-                        UPDATE contacts
-                        SET
-                            status = 'used',
-                            last_used = :current_time,
-                            tags = array_append(tags, :tag)
-                        WHERE phone_number = ANY(:phones) AND (tags IS NULL OR NOT (tags @> ARRAY[:tag]));
-                    """)
-                    result = connection.execute(
-                        update_sql,
-                        {"current_time": datetime.now(), "phones": list(all_phones), "tag": tag}
-                    )
-                    updated_count = result.rowcount
-                except Exception as e:
-                    logger.error(f"An error occurred during the database update. Rolling back. Error: {e}")
-                    raise
-        logger.info(f"--- Batch update finished. Successfully updated {updated_count} contacts. ---")
+    throughput = total_phones / elapsed if elapsed else 0.0
+    logger.info(
+        f"Applied {total_phones} phone numbers in {batches} batches in {elapsed:.1f}s ({throughput:,.0f} numbers/s): "
+        f"{matched} matched, {updated_count} updated, {matched - updated_count} already tagged. "
+        f"Row locks held {lock_seconds:.2f}s in total, at most {max_lock_seconds:.3f}s per batch."
+    )
+    if skipped_files:
+        logger.info(f"Skipped {skipped_files} files that were already applied.")
+    logger.info(f"--- Batch update finished. Successfully updated {updated_count} contacts. ---")
 
 if __name__ == "__main__":
-    batch_update()
\ No newline at end of file
+    batch_update()
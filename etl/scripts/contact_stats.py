@@ -0,0 +1,223 @@
+import logging
+from typing import List, Optional
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Contacts are counted in total and per value of each dimension. A contact
+# is counted once for each tag it carries.
+STATS_DIMENSIONS = ("status", "tag", "profile", "industry")
+
+# NULL values are counted under an empty string, because `value` is part of
+# the primary key.
+CREATE_CONTACT_STATS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS contact_stats (
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    contacts BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, value)
+)
+"""
+
+# The counts contributed by a set of rows `changes`, where n is +1 for a row
+# added and -1 for a row removed. `deltas` turns the rows into (dimension,
+# value, n) triples.
+_STATS_DELTAS_SQL = """
+WITH changes AS ({changes}),
+deltas AS ({deltas})
+SELECT dimension, value, SUM(n)::bigint AS contacts FROM deltas GROUP BY dimension, value
+"""
+
+# Deltas of contacts rows with columns (n, status, profile_id, industry).
+_CONTACT_DELTAS = """
+    SELECT 'total' AS dimension, '' AS value, n FROM changes
+    UNION ALL SELECT 'status', COALESCE(status, ''), n FROM changes
+    UNION ALL SELECT 'profile', COALESCE(profile_id::text, ''), n FROM changes
+    UNION ALL SELECT 'industry', COALESCE(industry, ''), n FROM changes
+"""
+
+# Deltas of contact_tags rows with columns (n, tag).
+_TAG_DELTAS = "SELECT 'tag' AS dimension, tag AS value, n FROM changes"
+
+# Until migration 6, tags were stored in the contacts.tags array.
+_ARRAY_TAG_DELTAS = _CONTACT_DELTAS + """
+    UNION ALL
+    SELECT 'tag', t.tag, c.n
+    FROM changes c CROSS JOIN LATERAL (SELECT DISTINCT tag FROM unnest(c.tags) AS tag WHERE tag IS NOT NULL) t
+"""
+
+_PROFILE_DELTAS_SQL = """
+WITH changes AS ({changes})
+SELECT profile_id, SUM(n)::bigint AS contacts FROM changes WHERE profile_id IS NOT NULL GROUP BY profile_id
+"""
+
+_CONTACT_COLUMNS = "status, profile_id, industry"
+_ARRAY_TAG_CONTACT_COLUMNS = "status, tags, profile_id, industry"
+
+
+def _apply_changes_sql(changes: str, deltas: str, profiles: bool = True) -> str:
+    # Rows are upserted in key order, so concurrent writers lock the shared
+    # counters in the same order and cannot deadlock on them.
+    sql = f"""
+        INSERT INTO contact_stats (dimension, value, contacts)
+        SELECT * FROM ({_STATS_DELTAS_SQL.format(changes=changes, deltas=deltas)}) d
+        WHERE d.contacts <> 0 ORDER BY d.dimension, d.value
+        ON CONFLICT (dimension, value) DO UPDATE SET contacts = contact_stats.contacts + EXCLUDED.contacts;
+    """
+    if profiles:
+        sql += f"""
+        UPDATE contact_profiles p SET contact_count = p.contact_count + d.contacts
+        FROM ({_PROFILE_DELTAS_SQL.format(changes=changes)}) d
+        WHERE p.id = d.profile_id AND d.contacts <> 0;
+        """
+    return sql
+
+
+def _stats_triggers_sql(
+    table: str, name: str, columns: str, deltas: str, on_truncate: str, profiles: bool = True
+) -> List[str]:
+    new_rows = f"SELECT 1 AS n, {columns} FROM new_rows"
+    old_rows = f"SELECT -1 AS n, {columns} FROM old_rows"
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {name}_apply() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                {_apply_changes_sql(new_rows, deltas, profiles)}
+            ELSIF TG_OP = 'DELETE' THEN
+                {_apply_changes_sql(old_rows, deltas, profiles)}
+            ELSIF TG_OP = 'UPDATE' THEN
+                {_apply_changes_sql(f"{new_rows} UNION ALL {old_rows}", deltas, profiles)}
+            ELSE
+                {on_truncate}
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS trg_{name}_insert ON {table}",
+        f"DROP TRIGGER IF EXISTS trg_{name}_update ON {table}",
+        f"DROP TRIGGER IF EXISTS trg_{name}_delete ON {table}",
+        f"DROP TRIGGER IF EXISTS trg_{name}_truncate ON {table}",
+        f"""
+        CREATE TRIGGER trg_{name}_insert AFTER INSERT ON {table}
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION {name}_apply()
+        """,
+        f"""
+        CREATE TRIGGER trg_{name}_update AFTER UPDATE ON {table}
+        REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION {name}_apply()
+        """,
+        f"""
+        CREATE TRIGGER trg_{name}_delete AFTER DELETE ON {table}
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION {name}_apply()
+        """,
+        f"""
+        CREATE TRIGGER trg_{name}_truncate AFTER TRUNCATE ON {table}
+        FOR EACH STATEMENT EXECUTE FUNCTION {name}_apply()
+        """,
+    ]
+
+
+_RESET_ALL_STATS = """
+                DELETE FROM contact_stats;
+                UPDATE contact_profiles SET contact_count = 0 WHERE contact_count <> 0;
+"""
+
+# Statement-level triggers see every row a statement (INSERT, COPY, UPDATE or
+# DELETE) changed through their transition tables, so the counters are
+# updated once per statement and in the same transaction as the change.
+# Tag counts are maintained by the triggers on contact_tags.
+CREATE_CONTACT_STATS_TRIGGERS_SQL = [
+    *_stats_triggers_sql("contacts", "contact_stats", _CONTACT_COLUMNS, _CONTACT_DELTAS, _RESET_ALL_STATS),
+    *_stats_triggers_sql(
+        "contact_tags", "contact_tag_stats", "tag", _TAG_DELTAS,
+        "DELETE FROM contact_stats WHERE dimension = 'tag';", profiles=False,
+    ),
+]
+
+# Blocks writers while the contacts are counted, so that no change is
+# counted twice or missed.
+LOCK_CONTACTS_SQL = "LOCK TABLE contacts, contact_tags IN SHARE MODE"
+
+# Rebuilds the counters from the contacts and contact_tags tables; run
+# after LOCK_CONTACTS_SQL.
+RECOMPUTE_CONTACT_STATS_SQL = [
+    "DELETE FROM contact_stats",
+    f"""INSERT INTO contact_stats (dimension, value, contacts)
+    {_STATS_DELTAS_SQL.format(changes=f"SELECT 1 AS n, {_CONTACT_COLUMNS} FROM contacts", deltas=_CONTACT_DELTAS)}""",
+    f"""INSERT INTO contact_stats (dimension, value, contacts)
+    {_STATS_DELTAS_SQL.format(changes="SELECT 1 AS n, tag FROM contact_tags", deltas=_TAG_DELTAS)}""",
+    "UPDATE contact_profiles p SET contact_count = (SELECT COUNT(*) FROM contacts c WHERE c.profile_id = p.id)",
+]
+
+# The counters as migration 4 set them up, counting tags from the
+# contacts.tags array. Migration 6 replaces its triggers.
+CONTACT_STATS_V4_SQL = [
+    CREATE_CONTACT_STATS_TABLE_SQL,
+    *_stats_triggers_sql("contacts", "contact_stats", _ARRAY_TAG_CONTACT_COLUMNS, _ARRAY_TAG_DELTAS, _RESET_ALL_STATS),
+    "LOCK TABLE contacts IN SHARE MODE",
+    "DELETE FROM contact_stats",
+    f"""INSERT INTO contact_stats (dimension, value, contacts)
+    {_STATS_DELTAS_SQL.format(changes=f"SELECT 1 AS n, {_ARRAY_TAG_CONTACT_COLUMNS} FROM contacts", deltas=_ARRAY_TAG_DELTAS)}""",
+    "UPDATE contact_profiles p SET contact_count = (SELECT COUNT(*) FROM contacts c WHERE c.profile_id = p.id)",
+]
+
+
+def get_total(engine: Engine) -> int:
+    """Returns the number of contacts, from the maintained counters."""
+    with engine.connect() as connection:
+        total = connection.execute(
+            text("SELECT contacts FROM contact_stats WHERE dimension = 'total'")
+        ).scalar()
+    return int(total or 0)
+
+
+def get_stats(engine: Engine, dimension: str, limit: Optional[int] = None) -> pd.DataFrame:
+    """
+    Returns the number of contacts per value of a dimension, largest first.
+
+    Args:
+        engine (Engine): The SQLAlchemy database engine.
+        dimension (str): One of STATS_DIMENSIONS.
+        limit (Optional[int]): Return at most this many values.
+
+    Returns:
+        pd.DataFrame: Columns `value` and `contacts`. Contacts without a
+        value are counted under an empty string.
+    """
+    if dimension not in STATS_DIMENSIONS:
+        raise ValueError(f"Unknown dimension '{dimension}'. Expected one of: {', '.join(STATS_DIMENSIONS)}.")
+    query = "SELECT value, contacts FROM contact_stats WHERE dimension = :dimension AND contacts <> 0 ORDER BY contacts DESC, value"
+    params = {"dimension": dimension}
+    if limit is not None:
+        query += " LIMIT :limit"
+        params["limit"] = limit
+    return pd.read_sql(text(query), engine, params=params)
+
+
+def recompute_contact_stats(engine: Engine) -> pd.DataFrame:
+    """
+    Recounts the contacts and replaces the maintained counters, including
+    `contact_profiles.contact_count`.
+
+    Returns:
+        pd.DataFrame: The counters that were wrong, with columns
+        `dimension`, `value`, `stored` and `actual`. Empty if the counters
+        matched the table.
+    """
+    with engine.begin() as connection:
+        connection.execute(text(LOCK_CONTACTS_SQL))
+        stored = pd.read_sql(text("SELECT dimension, value, contacts AS stored FROM contact_stats WHERE contacts <> 0"), connection)
+        for statement in RECOMPUTE_CONTACT_STATS_SQL:
+            connection.execute(text(statement))
+        actual = pd.read_sql(text("SELECT dimension, value, contacts AS actual FROM contact_stats"), connection)
+
+    drift = stored.merge(actual, on=["dimension", "value"], how="outer")
+    drift[["stored", "actual"]] = drift[["stored", "actual"]].fillna(0).astype("int64")
+    drift = drift[drift["stored"] != drift["actual"]].sort_values(["dimension", "value"]).reset_index(drop=True)
+    logger.info(f"Recomputed contact statistics: {len(drift)} counters were out of date.")
+    return drift
+
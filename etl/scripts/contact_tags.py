@@ -0,0 +1,78 @@
+# The view that presents contacts with the columns tags and last_used, which
+# migration 6 moved out of the contacts table.
+CONTACTS_VIEW = "contacts_with_tags"
+
+# The event recorded when a contact is marked as used.
+USED_EVENT = "used"
+
+# One row per tag of a contact. Adding a tag inserts a row instead of
+# rewriting the contact, whose additional_info can be large. `tagged_at` is
+# the start time of the inserting transaction, like contacts.updated_at, so
+# export-delta can pick up contacts that were tagged since its watermark.
+# The primary key serves tag filters; the contact_id index serves the view.
+CREATE_CONTACT_TAGS_TABLE_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS contact_tags (
+        contact_id INTEGER NOT NULL REFERENCES contacts (id) ON DELETE CASCADE,
+        tag TEXT NOT NULL,
+        tagged_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (tag, contact_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_contact_tags_contact_id ON contact_tags (contact_id)",
+    "CREATE INDEX IF NOT EXISTS idx_contact_tags_tagged_at ON contact_tags (tagged_at)",
+]
+
+# An append-only log of what happened to a contact, e.g. being marked as
+# used with a tag. `occurred_at` is the time given by the writer.
+CREATE_CONTACT_EVENTS_TABLE_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS contact_events (
+        id BIGSERIAL PRIMARY KEY,
+        contact_id INTEGER NOT NULL REFERENCES contacts (id) ON DELETE CASCADE,
+        event TEXT NOT NULL,
+        tag TEXT,
+        occurred_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_contact_events_contact_id ON contact_events (contact_id, event, occurred_at)",
+]
+
+# Copies the contacts.tags arrays and last_used timestamps into the new
+# tables. Backfilled tags keep the contact's updated_at, so contacts that
+# were already exported are not exported again by export-delta.
+BACKFILL_CONTACT_TAGS_SQL = [
+    """
+    INSERT INTO contact_tags (contact_id, tag, tagged_at)
+    SELECT c.id, t.tag, COALESCE(c.updated_at, c.created_at, NOW())
+    FROM contacts c CROSS JOIN LATERAL unnest(c.tags) AS t (tag)
+    WHERE t.tag IS NOT NULL
+    ON CONFLICT (tag, contact_id) DO NOTHING
+    """,
+    f"""
+    INSERT INTO contact_events (contact_id, event, occurred_at)
+    SELECT id, '{USED_EVENT}', last_used FROM contacts WHERE last_used IS NOT NULL
+    """,
+]
+
+DROP_CONTACTS_TAG_COLUMNS_SQL = "ALTER TABLE contacts DROP COLUMN IF EXISTS tags, DROP COLUMN IF EXISTS last_used"
+
+# The contacts table as it was before migration 6, for readers that expect
+# the tags array and last_used. A contact's updated_at includes the time it
+# was last tagged.
+CREATE_CONTACTS_VIEW_SQL = f"""
+CREATE OR REPLACE VIEW {CONTACTS_VIEW} AS
+SELECT
+    c.id, c.company_name, c.url, c.phone_number, c.is_b2b, c.industry, c.customer_target_segments,
+    c.additional_info, COALESCE(t.tags, '{{}}'::text[]) AS tags, c.status, u.last_used, c.created_at,
+    GREATEST(c.updated_at, t.tagged_at) AS updated_at, c.profile_id
+FROM contacts c
+LEFT JOIN LATERAL (
+    SELECT array_agg(ct.tag ORDER BY ct.tagged_at, ct.tag) AS tags, MAX(ct.tagged_at) AS tagged_at
+    FROM contact_tags ct WHERE ct.contact_id = c.id
+) t ON TRUE
+LEFT JOIN LATERAL (
+    SELECT MAX(e.occurred_at) AS last_used
+    FROM contact_events e WHERE e.contact_id = c.id AND e.event = '{USED_EVENT}'
+) u ON TRUE
+"""
@@ -0,0 +1,260 @@
+import codecs
+import csv
+import logging
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from etl.scripts.transform import resolve_profile
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pyarrow is optional; without it the C parser is used
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_SIZE = 64 * 1024
+CANDIDATE_DELIMITERS = ",;\t|"
+
+# The values pandas reads as missing by default.
+NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+_TEXT_DTYPES = ("str", "string", "object", str, object)
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+class CsvFormat(NamedTuple):
+    """The layout of a CSV file, as detected by `sniff_csv`."""
+    encoding: str
+    delimiter: str
+    columns: List[str]
+    has_header: bool
+
+
+def _is_number(value: str) -> bool:
+    try:
+        float(value.replace(" ", ""))
+        return True
+    except ValueError:
+        return False
+
+
+def _detect_encoding(sample: bytes) -> str:
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # The sample may end in the middle of a multi-byte character.
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+def sniff_csv(file_path: Path, sample_size: int = SAMPLE_SIZE) -> CsvFormat:
+    """
+    Detects the encoding, delimiter and header of a CSV file from its first
+    few kilobytes, so the file only has to be parsed once.
+
+    The encoding is taken from a byte order mark, or is UTF-8 if the sample
+    decodes as UTF-8, and Windows-1252 otherwise. The delimiter is one of
+    comma, semicolon, tab and pipe. The first row is treated as a header
+    unless all of its values are numbers.
+
+    Args:
+        file_path (Path): The CSV file.
+        sample_size (int): The number of bytes to inspect.
+
+    Returns:
+        CsvFormat: The detected layout. If the file has no header, the
+        columns are named "Unnamed: 0", "Unnamed: 1", ... like the columns
+        of a workbook without a header.
+    """
+    with open(file_path, "rb") as f:
+        raw_sample = f.read(sample_size)
+    encoding = _detect_encoding(raw_sample)
+    sample = codecs.getincrementaldecoder(encoding)(errors="replace").decode(raw_sample, final=False)
+
+    # Only sniff whole lines, a cut-off last line can mislead the sniffer.
+    lines = sample.splitlines(keepends=True)
+    sniff_sample = "".join(lines[:-1]) if len(lines) > 1 else sample
+    try:
+        delimiter = csv.Sniffer().sniff(sniff_sample, delimiters=CANDIDATE_DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = ","
+
+    first_row = next(csv.reader(sniff_sample.splitlines(), delimiter=delimiter), [])
+    # Headers may contain numbers (e.g. a column "2024"), so only a row of
+    # nothing but numbers is taken for data.
+    values = [value for value in first_row if value.strip()]
+    has_header = bool(first_row) and not (values and all(_is_number(value) for value in values))
+    columns = first_row if has_header else [f"Unnamed: {i}" for i in range(len(first_row))]
+    return CsvFormat(encoding, delimiter, columns, has_header)
+
+
+def profile_dtypes(file_path: Path, columns: List[str], config: Optional[Dict]) -> Dict[str, str]:
+    """
+    Returns the column types to read a file with, from its data source
+    profile in config.yaml.
+
+    The source columns of the profile's `phone_number` promotion rule are
+    always read as strings, so numbers are never turned into floats (e.g.
+    "41562040888.0"). A profile's `dtypes` mapping can declare the types of
+    further columns.
+
+    Args:
+        file_path (Path): The source file.
+        columns (List[str]): The column names of the file.
+        config (Optional[Dict]): The pipeline configuration.
+
+    Returns:
+        Dict[str, str]: The dtype of each declared column present in the file.
+    """
+    if not config:
+        return {}
+    profile_name = resolve_profile(file_path.name, sorted(columns), config)
+    profile = config.get("data_source_profiles", {}).get(profile_name, {}) or {}
+
+    dtypes = {column: "str" for column in profile.get("promotion_rules", {}).get("phone_number", []) or []}
+    dtypes.update(profile.get("dtypes", {}) or {})
+    return {column: dtype for column, dtype in dtypes.items() if column in columns}
+
+
+def read_csv(
+    file_path: Path,
+    config: Optional[Dict] = None,
+    chunksize: Optional[int] = None,
+    usecols: Optional[List[str]] = None,
+    csv_format: Optional[CsvFormat] = None,
+    dtypes: Optional[Dict[str, str]] = None,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Reads a CSV file with a sniffed layout and profile-driven column types.
+
+    Whole files are parsed with the multithreaded pyarrow CSV reader when
+    pyarrow is installed (configurable with `extract.csv_engine`: "auto",
+    "pyarrow" or "c"). Chunked reads always use the C parser, which is the
+    only one that can stream. Missing values come back as NaN with either
+    engine.
+
+    Raises:
+        ValueError: If `extract.csv_engine` is "pyarrow" and pyarrow is not
+            installed.
+
+    Args:
+        file_path (Path): The CSV file.
+        config (Optional[Dict]): The pipeline configuration, used for the
+            column types and the engine.
+        chunksize (Optional[int]): If given, an iterator of DataFrames of at
+            most this many rows is returned instead of a single DataFrame.
+        usecols (Optional[List[str]]): Only read these columns.
+        csv_format (Optional[CsvFormat]): A layout already sniffed by the
+            caller.
+        dtypes (Optional[Dict[str, str]]): Column types that override those
+            of the profile.
+
+    Returns:
+        Union[pd.DataFrame, Iterator[pd.DataFrame]]: The rows, or the chunks.
+    """
+    file_path = Path(file_path)
+    csv_format = csv_format or sniff_csv(file_path)
+    dtypes = {**profile_dtypes(file_path, csv_format.columns, config), **(dtypes or {})}
+    if usecols is not None:
+        dtypes = {column: dtype for column, dtype in dtypes.items() if column in usecols}
+
+    options = {
+        "sep": csv_format.delimiter,
+        "encoding": csv_format.encoding,
+        "dtype": dtypes or None,
+        "usecols": usecols,
+    }
+    if not csv_format.has_header:
+        options.update(header=None, names=csv_format.columns)
+
+    engine = ((config or {}).get("extract", {}) or {}).get("csv_engine", "auto")
+    if engine == "pyarrow" and pa is None:
+        raise ValueError("csv_engine 'pyarrow' requires the 'pyarrow' package.")
+    use_arrow = (
+        chunksize is None
+        and engine != "c"
+        and pa is not None
+        and len(set(csv_format.columns)) == len(csv_format.columns)
+    )
+    if use_arrow:
+        return _read_csv_arrow(file_path, csv_format, dtypes, usecols)
+    return pd.read_csv(file_path, chunksize=chunksize, **options)
+
+
+def _read_csv_arrow(
+    file_path: Path, csv_format: CsvFormat, dtypes: Dict[str, str], usecols: Optional[List[str]]
+) -> pd.DataFrame:
+    """
+    Reads a whole CSV file with the multithreaded pyarrow parser, producing
+    the same DataFrame as the C parser would.
+
+    Text columns are declared to pyarrow up front; casting after the parse
+    (as pandas' own pyarrow engine does) would first turn "+41..." into a
+    float. pyarrow also infers dates, times and timestamps, which the C
+    parser leaves as text; such columns are read again as strings, so that
+    e.g. a "Created" column keeps its original text.
+    """
+    text_columns = [column for column, dtype in dtypes.items() if dtype in _TEXT_DTYPES]
+    table = _arrow_table(file_path, csv_format, text_columns, usecols)
+    temporal_columns = [field.name for field in table.schema if pa.types.is_temporal(field.type)]
+    if temporal_columns:
+        text_table = _arrow_table(file_path, csv_format, temporal_columns, temporal_columns)
+        for column in temporal_columns:
+            table = table.set_column(
+                table.schema.get_field_index(column), column, text_table.column(column)
+            )
+        text_columns += [column for column in temporal_columns if column not in text_columns]
+
+    # Columns without any value have no type; pandas reads them as float.
+    schema = table.schema
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.float64()))
+    df = table.cast(schema).to_pandas()
+
+    other_dtypes = {column: dtype for column, dtype in dtypes.items() if column not in text_columns}
+    if other_dtypes:
+        df = df.astype(other_dtypes)
+    # pyarrow returns None for missing text; the C parser gives NaN.
+    for column in df.columns[df.dtypes == object]:
+        missing = df[column].isna()
+        if missing.any():
+            df[column] = df[column].where(~missing, np.nan)
+    return df
+
+
+def _arrow_table(
+    file_path: Path, csv_format: CsvFormat, text_columns: List[str], usecols: Optional[List[str]]
+) -> "pa.Table":
+    """Parses a CSV file with pyarrow, reading `text_columns` as strings."""
+    return pa_csv.read_csv(
+        file_path,
+        read_options=pa_csv.ReadOptions(
+            # pyarrow skips a UTF-8 byte order mark itself.
+            encoding="utf8" if csv_format.encoding == "utf-8-sig" else csv_format.encoding,
+            column_names=None if csv_format.has_header else csv_format.columns,
+        ),
+        parse_options=pa_csv.ParseOptions(delimiter=csv_format.delimiter),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={column: pa.string() for column in text_columns},
+            null_values=NA_VALUES,
+            strings_can_be_null=True,
+            include_columns=usecols or [],
+        ),
+    )
@@ -0,0 +1,230 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+from dotenv import find_dotenv, load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+from etl.scripts.utils import load_config
+
+logger = logging.getLogger(__name__)
+
+# Used for settings missing from the 'database' section of config.yaml.
+DEFAULT_DATABASE_SETTINGS = {
+    "pool_size": 5,
+    "max_overflow": 5,
+    "pool_timeout": 30,
+    "pool_recycle": 1800,
+    "pool_pre_ping": True,
+    "statement_timeout_ms": 0,
+    "lock_timeout_ms": 0,
+    "application_name": "master-contact",
+    "executemany_mode": "values_plus_batch",
+    "insertmanyvalues_page_size": 1000,
+    "executemany_batch_page_size": 100,
+    "query_cache_size": 500,
+}
+
+# Engines created by get_db_engine, one per database URL and process.
+_engines: Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+
+class PoolStats(NamedTuple):
+    """Connection pool activity of an engine since it was created."""
+    checkouts: int
+    connects: int
+    timeouts: int
+    checked_out: int
+    peak_checked_out: int
+    wait_seconds: float
+    max_wait_seconds: float
+
+    @property
+    def average_wait_ms(self) -> float:
+        return self.wait_seconds / self.checkouts * 1000 if self.checkouts else 0.0
+
+
+class PoolMetrics:
+    """Counts the checkouts of a pool and the time callers waited for a connection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = self.connects = self.timeouts = 0
+        self.checked_out = self.peak_checked_out = 0
+        self.wait_seconds = self.max_wait_seconds = 0.0
+
+    def record_checkout(self, wait_seconds: Optional[float]):
+        """Records a checkout that took `wait_seconds`, or a timeout if None."""
+        with self._lock:
+            if wait_seconds is None:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+            self.wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def record_checkin(self):
+        with self._lock:
+            self.checked_out -= 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def snapshot(self) -> PoolStats:
+        with self._lock:
+            return PoolStats(
+                self.checkouts, self.connects, self.timeouts, self.checked_out,
+                self.peak_checked_out, self.wait_seconds, self.max_wait_seconds,
+            )
+
+
+class MeteredQueuePool(QueuePool):
+    """
+    A QueuePool that measures how long each checkout takes: the wait for a
+    free connection when the pool is exhausted, plus opening a new
+    connection when the pool grows.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.metrics.record_checkout(None)
+            raise
+        self.metrics.record_checkout(time.perf_counter() - started)
+        return connection
+
+    def _do_return_conn(self, record):
+        self.metrics.record_checkin()
+        super()._do_return_conn(record)
+
+    def _create_connection(self):
+        self.metrics.record_connect()
+        return super()._create_connection()
+
+    def recreate(self):
+        # Engine.dispose() replaces the pool; the new pool keeps counting.
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def _database_settings() -> Dict:
+    try:
+        settings = load_config().get("database", {}) or {}
+    except FileNotFoundError:
+        settings = {}
+    return {**DEFAULT_DATABASE_SETTINGS, **settings}
+
+
+def create_db_engine(database_url: str, settings: Optional[Dict] = None) -> Engine:
+    """
+    Creates an engine with the pool, timeout and driver settings of the
+    'database' section of config.yaml.
+
+    Args:
+        database_url (str): The SQLAlchemy database URL.
+        settings (Optional[Dict]): Settings overriding DEFAULT_DATABASE_SETTINGS.
+
+    Returns:
+        Engine: The SQLAlchemy database engine.
+    """
+    settings = {**DEFAULT_DATABASE_SETTINGS, **(settings or {})}
+    url = make_url(database_url)
+    kwargs = {
+        "query_cache_size": settings["query_cache_size"],
+        "insertmanyvalues_page_size": settings["insertmanyvalues_page_size"],
+        "pool_pre_ping": settings["pool_pre_ping"],
+    }
+
+    if url.get_backend_name() == "postgresql":
+        kwargs.update(
+            poolclass=MeteredQueuePool,
+            pool_size=settings["pool_size"],
+            max_overflow=settings["max_overflow"],
+            pool_timeout=settings["pool_timeout"],
+            pool_recycle=settings["pool_recycle"],
+        )
+        # Timeouts are set for the session, so they apply to every statement.
+        options = [
+            f"-c statement_timeout={int(settings['statement_timeout_ms'])}",
+            f"-c lock_timeout={int(settings['lock_timeout_ms'])}",
+        ]
+        connect_args = {"options": " ".join(options)}
+        if settings["application_name"]:
+            connect_args["application_name"] = settings["application_name"]
+        kwargs["connect_args"] = connect_args
+        if url.get_driver_name() == "psycopg2":
+            kwargs.update(
+                executemany_mode=settings["executemany_mode"],
+                executemany_batch_page_size=settings["executemany_batch_page_size"],
+            )
+
+    return create_engine(url, **kwargs)
+
+
+def get_db_engine() -> Engine:
+    """
+    Returns the engine for the DATABASE_URL environment variable. If it is
+    not set, it is read from the .env file of the working directory (or a
+    parent), so every script and command finds it without loading .env
+    itself.
+
+    The engine is created on the first call and shared by later calls in
+    the same process, so all scripts and commands use one connection pool.
+
+    Returns:
+        Engine: The SQLAlchemy database engine.
+    """
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        load_dotenv(find_dotenv(usecwd=True))
+        database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        logger.error("DATABASE_URL environment variable not set.")
+        raise ValueError("DATABASE_URL is not configured.")
+
+    with _engines_lock:
+        engine = _engines.get(database_url)
+        if engine is not None:
+            return engine
+        try:
+            engine = create_db_engine(database_url, _database_settings())
+            logger.info("Database engine created successfully.")
+        except Exception as e:
+            logger.error(f"Failed to create database engine: {e}")
+            raise
+        _engines[database_url] = engine
+        return engine
+
+
+def get_pool_stats(engine: Engine) -> Optional[PoolStats]:
+    """Returns the pool activity of an engine from `get_db_engine`, or None if its pool is not metered."""
+    metrics = getattr(engine.pool, "metrics", None)
+    return metrics.snapshot() if metrics is not None else None
+
+
+def log_pool_stats(engine: Engine):
+    """Logs the pool activity of an engine."""
+    stats = get_pool_stats(engine)
+    if stats is None:
+        return
+    logger.info(
+        f"Connection pool: {stats.checkouts} checkouts, {stats.connects} connections opened, "
+        f"peak {stats.peak_checked_out} in use, waited {stats.wait_seconds:.2f}s in total "
+        f"(average {stats.average_wait_ms:.1f} ms, max {stats.max_wait_seconds * 1000:.0f} ms), "
+        f"{stats.timeouts} timeouts."
+    )
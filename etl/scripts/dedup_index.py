@@ -0,0 +1,352 @@
+import copy
+import logging
+import re
+import threading
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from etl.scripts.load import copy_dataframe
+
+logger = logging.getLogger(__name__)
+
+_NON_ALNUM_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+DEFAULT_BLOCKING_KEYS = ("token", "prefix")
+
+
+class NameMatch(NamedTuple):
+    """The best existing match for an incoming company name."""
+    company_name: str
+    score: float
+    contact_id: Optional[int] = None
+
+
+def normalize_company_name(name) -> str:
+    """
+    Normalizes a company name for fuzzy comparison.
+
+    Lowercases the name, replaces punctuation with spaces and collapses
+    whitespace, so that "ACME, Inc." and "acme inc" compare as equal.
+
+    Args:
+        name: The raw company name (any type, missing values allowed).
+
+    Returns:
+        str: The normalized name, or an empty string if nothing is left.
+    """
+    if name is None or (isinstance(name, float) and np.isnan(name)):
+        return ""
+    return " ".join(_NON_ALNUM_RE.sub(" ", str(name).lower()).split())
+
+
+class CompanyNameIndex:
+    """
+    An incrementally updated index of company names for fuzzy deduplication.
+
+    Names are normalized and registered under a set of blocking keys (whole
+    tokens, a prefix of the sorted tokens, and optionally character n-grams).
+    Lookups only score an incoming name against the names that share at least
+    one key with it. The (incoming name, candidate) pairs of a batch of names
+    are scored at once with `rapidfuzz.process.cpdist`, so each name is only
+    compared with its own candidates, never with those of the other names in
+    the batch. A batch holds at most `batch_size` names and `max_pairs`
+    pairs, which bounds the memory of a scoring call.
+    """
+
+    def __init__(
+        self,
+        blocking_keys: Sequence[str] = DEFAULT_BLOCKING_KEYS,
+        prefix_length: int = 4,
+        ngram_size: int = 3,
+        min_token_length: int = 3,
+        max_block_size: int = 5000,
+        batch_size: int = 512,
+        max_pairs: int = 1_000_000,
+    ):
+        unknown_keys = set(blocking_keys) - {"token", "prefix", "ngram"}
+        if unknown_keys:
+            raise ValueError(f"Unknown blocking keys: {sorted(unknown_keys)}")
+
+        self.blocking_keys = tuple(blocking_keys)
+        self.prefix_length = prefix_length
+        self.ngram_size = ngram_size
+        self.min_token_length = min_token_length
+        self.max_block_size = max_block_size
+        self.batch_size = batch_size
+        self.max_pairs = max_pairs
+
+        # Position in these lists is the internal id of a name.
+        self._names: List[str] = []
+        self._originals: List[str] = []
+        self._blocks: Dict[str, array] = defaultdict(lambda: array("q"))
+
+    @classmethod
+    def from_config(cls, dedup_config: Dict) -> "CompanyNameIndex":
+        """
+        Builds an index from the 'deduplication' section of config.yaml.
+        """
+        blocking = dedup_config.get("blocking", {}) or {}
+        return cls(
+            blocking_keys=blocking.get("keys", DEFAULT_BLOCKING_KEYS),
+            prefix_length=blocking.get("prefix_length", 4),
+            ngram_size=blocking.get("ngram_size", 3),
+            min_token_length=blocking.get("min_token_length", 3),
+            max_block_size=blocking.get("max_block_size", 5000),
+            batch_size=dedup_config.get("match_batch_size", 512),
+            max_pairs=dedup_config.get("match_max_pairs", 1_000_000),
+        )
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _block_keys(self, normalized: str) -> List[str]:
+        """Returns the blocking keys a normalized name is filed under."""
+        tokens = normalized.split()
+        compact = "".join(sorted(tokens))
+        keys = []
+        if "token" in self.blocking_keys:
+            keys.extend(f"t:{token}" for token in tokens if len(token) >= self.min_token_length)
+        if "prefix" in self.blocking_keys and compact:
+            keys.append(f"p:{compact[:self.prefix_length]}")
+        if "ngram" in self.blocking_keys:
+            n = self.ngram_size
+            keys.extend(f"g:{compact[i:i + n]}" for i in range(max(len(compact) - n + 1, 0)))
+        return list(dict.fromkeys(keys))
+
+    def add(self, names: Iterable) -> int:
+        """
+        Adds names to the index. Empty names are ignored.
+
+        Args:
+            names (Iterable): Raw company names, e.g. a DataFrame column.
+
+        Returns:
+            int: The number of names added.
+        """
+        added = 0
+        for original in names:
+            normalized = normalize_company_name(original)
+            if not normalized:
+                continue
+            name_id = len(self._names)
+            self._names.append(normalized)
+            self._originals.append(str(original).lower())
+            for key in self._block_keys(normalized):
+                self._blocks[key].append(name_id)
+            added += 1
+        return added
+
+    def _candidates(self, normalized: str) -> set:
+        """Collects the ids of indexed names sharing a usable block with `normalized`."""
+        candidate_ids = set()
+        for key in self._block_keys(normalized):
+            block = self._blocks.get(key)
+            if block is not None and len(block) <= self.max_block_size:
+                candidate_ids.update(block)
+        return candidate_ids
+
+    def match(self, names: Sequence, threshold: float) -> List[Optional[NameMatch]]:
+        """
+        Finds the best indexed match for each of the given names.
+
+        Args:
+            names (Sequence): The incoming company names to check.
+            threshold (float): The minimum similarity score (0-100) for a match.
+
+        Returns:
+            List[Optional[NameMatch]]: For each input name, either None or the
+            matched name and similarity score. The index does not know
+            contact ids, so `contact_id` is None.
+        """
+        results: List[Optional[NameMatch]] = [None] * len(names)
+        if not self._names:
+            return results
+
+        normalized = [normalize_company_name(name) for name in names]
+        batch: List[Tuple[int, List[int]]] = []
+        pair_count = 0
+        for pos, name in enumerate(normalized):
+            if not name:
+                continue
+            candidate_ids = sorted(self._candidates(name))
+            if not candidate_ids:
+                continue
+            if batch and (len(batch) >= self.batch_size or pair_count + len(candidate_ids) > self.max_pairs):
+                self._score_batch(normalized, batch, threshold, results)
+                batch, pair_count = [], 0
+            batch.append((pos, candidate_ids))
+            pair_count += len(candidate_ids)
+        if batch:
+            self._score_batch(normalized, batch, threshold, results)
+
+        return results
+
+    def _score_batch(
+        self,
+        normalized: List[str],
+        batch: List[Tuple[int, List[int]]],
+        threshold: float,
+        results: List[Optional[NameMatch]],
+    ) -> None:
+        """
+        Scores each (position, candidate ids) entry of a batch against its own
+        candidates and stores the best match above the threshold in `results`.
+        """
+        queries = []
+        choices = []
+        for pos, candidate_ids in batch:
+            queries.extend([normalized[pos]] * len(candidate_ids))
+            choices.extend(self._names[i] for i in candidate_ids)
+        scores = process.cpdist(
+            queries,
+            choices,
+            scorer=fuzz.token_sort_ratio,
+            score_cutoff=threshold,
+            dtype=np.float32,
+            workers=-1,
+        )
+
+        offset = 0
+        for pos, candidate_ids in batch:
+            row_scores = scores[offset:offset + len(candidate_ids)]
+            offset += len(candidate_ids)
+            # Ties go to the earliest indexed name.
+            best = int(row_scores.argmax())
+            score = float(row_scores[best])
+            if score >= threshold and score > 0:
+                results[pos] = NameMatch(self._originals[candidate_ids[best]], round(score, 2))
+
+
+class DatabaseNameIndex:
+    """
+    Fuzzy company name matching inside PostgreSQL with the pg_trgm extension,
+    so the ETL does not have to hold every existing company name.
+
+    Incoming names are copied into a temporary table and joined against
+    `contacts` with the trigram similarity operator `%`, which uses the GIN
+    index on `lower(company_name)` created by migration 8. For each
+    name, the most similar contact above the threshold comes back with its
+    id and score.
+
+    Scores are trigram similarities scaled to 0-100. They are lower than
+    the `token_sort_ratio` scores of `CompanyNameIndex` for the same pair of
+    names, so `company_name_threshold` may need to be lowered when
+    switching backends.
+
+    Like `DatabasePhoneFilter`, a match never changes the database. In dry
+    runs, names that would have been loaded are remembered with `add` and
+    matched as well.
+    """
+
+    def __init__(self, engine: Engine, dry_run: bool = False):
+        self.engine = engine
+        self.dry_run = dry_run
+        self.max_contact_id: Optional[int] = None
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_available(engine: Engine) -> bool:
+        """Checks that the pg_trgm extension is installed in the database."""
+        with engine.connect() as connection:
+            return connection.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def snapshot(self) -> "DatabaseNameIndex":
+        """
+        Returns a matcher that only sees the contacts that exist now. Match
+        the chunks of a file with a snapshot taken before loading it, so
+        that, as with `CompanyNameIndex`, names are only matched against
+        other files and not against earlier chunks of the same file.
+        """
+        view = copy.copy(self)
+        with self.engine.connect() as connection:
+            view.max_contact_id = connection.execute(text("SELECT COALESCE(MAX(id), 0) FROM contacts")).scalar_one()
+        return view
+
+    def add(self, names: Iterable) -> int:
+        """
+        Remembers names that a dry run would have loaded. In a live run the
+        loaded names are already in the contacts table, so nothing is done.
+
+        Returns:
+            int: The number of names remembered.
+        """
+        if not self.dry_run:
+            return 0
+        names = [str(name) for name in names if normalize_company_name(name)]
+        with self._lock:
+            self._pending.extend(names)
+        return len(names)
+
+    def match(self, names: Sequence, threshold: float) -> List[Optional[NameMatch]]:
+        """
+        Finds the most similar existing contact for each of the given names.
+
+        Args:
+            names (Sequence): The incoming company names to check.
+            threshold (float): The minimum similarity score (0-100) for a match.
+
+        Returns:
+            List[Optional[NameMatch]]: For each input name, either None or the
+            matched contact's name, similarity score and id. Names that
+            would have been loaded by a dry run have no id.
+        """
+        results: List[Optional[NameMatch]] = [None] * len(names)
+        positions = [pos for pos, name in enumerate(names) if normalize_company_name(name)]
+        if not positions:
+            return results
+        candidates = pd.DataFrame({"position": positions, "company_name": [str(names[pos]) for pos in positions]})
+        with self._lock:
+            pending = pd.DataFrame({"company_name": self._pending})
+
+        params = {"threshold": str(float(threshold) / 100)}
+        existing = "SELECT id, company_name FROM contacts"
+        if self.max_contact_id is not None:
+            existing += " WHERE id <= %(max_contact_id)s"
+            params["max_contact_id"] = int(self.max_contact_id)
+        if not pending.empty:
+            existing += " UNION ALL SELECT NULL, company_name FROM pending_names"
+
+        with self.engine.connect() as connection:
+            dbapi_connection = connection.connection
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute("CREATE TEMP TABLE name_candidates (position INTEGER, company_name TEXT) ON COMMIT DROP")
+                copy_dataframe(cursor, candidates, "name_candidates")
+                if not pending.empty:
+                    cursor.execute("CREATE TEMP TABLE pending_names (company_name TEXT) ON COMMIT DROP")
+                    copy_dataframe(cursor, pending, "pending_names")
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.execute("SELECT set_config('pg_trgm.similarity_threshold', %(threshold)s, true)", params)
+                cursor.execute(
+                    f"""
+                    SELECT DISTINCT ON (n.position) n.position, c.id, c.company_name,
+                           similarity(lower(c.company_name), lower(n.company_name)) AS score
+                    FROM name_candidates n
+                    JOIN ({existing}) c ON lower(c.company_name) %% lower(n.company_name)
+                    ORDER BY n.position, score DESC, c.id
+                    """,
+                    params,
+                )
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+                dbapi_connection.rollback()
+
+        for position, contact_id, company_name, score in rows:
+            results[position] = NameMatch(company_name, round(float(score) * 100, 2), contact_id)
+        return results
+
+
+# The company name lookups `main.deduplicate` accepts.
+NameLookup = Union[CompanyNameIndex, DatabaseNameIndex]
@@ -0,0 +1,420 @@
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import pandas as pd
+from openpyxl import Workbook
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from etl.scripts.contact_tags import CONTACTS_VIEW
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; only Parquet exports need it
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "parquet", "xlsx")
+
+# A worksheet holds 1,048,576 rows, one of which is the header.
+XLSX_MAX_DATA_ROWS = 1_048_575
+
+_INTEGER_TYPES = {"smallint", "integer", "bigint"}
+_FLOAT_TYPES = {"real", "double precision"}
+_TIMESTAMP_TYPES = {"timestamp without time zone", "timestamp with time zone"}
+
+# The tables whose write times decide which contacts a delta contains.
+DELTA_TABLES = ("contacts", "contact_tags", "contact_events")
+
+# Of the other transactions writing to the delta tables: how many hide their
+# start time from this role (pg_stat_activity only shows xact_start of other
+# roles' sessions to members of pg_read_all_stats), and (just before) the
+# start of the oldest one that does not, or NOW() if there is none.
+OPEN_WRITERS_SQL = f"""
+SELECT COUNT(DISTINCT l.pid) FILTER (WHERE a.xact_start IS NULL),
+       LEAST(NOW(), MIN(a.xact_start))::timestamp - INTERVAL '1 microsecond'
+FROM pg_locks l JOIN pg_stat_activity a ON a.pid = l.pid
+WHERE l.locktype = 'relation' AND l.mode = 'RowExclusiveLock' AND l.pid <> pg_backend_pid()
+  AND l.relation IN ({", ".join(f"'{table}'::regclass" for table in DELTA_TABLES)})
+"""
+
+
+class ExportColumn(NamedTuple):
+    """A column of the contacts view and its PostgreSQL `data_type`."""
+    name: str
+    data_type: str
+
+    @property
+    def is_array(self) -> bool:
+        return self.data_type == "ARRAY"
+
+    @property
+    def is_native(self) -> bool:
+        """Whether the column is exported with its own type rather than as text."""
+        return self.is_array or self.data_type in _INTEGER_TYPES | _FLOAT_TYPES | _TIMESTAMP_TYPES | {"boolean", "text", "character varying"}
+
+
+def get_export_columns(engine: Engine, columns: Optional[Sequence[str]] = None) -> List[ExportColumn]:
+    """
+    Looks up the columns of the contacts view (CONTACTS_VIEW), in view
+    order. The view adds `tags` and `last_used` to the contacts table.
+
+    Args:
+        engine (Engine): The SQLAlchemy database engine.
+        columns (Optional[Sequence[str]]): The columns to export, in the
+            order given. Defaults to all columns.
+
+    Raises:
+        ValueError: If a requested column does not exist.
+    """
+    with engine.connect() as connection:
+        rows = connection.execute(text("""
+            SELECT column_name, data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = :view
+            ORDER BY ordinal_position
+        """), {"view": CONTACTS_VIEW}).all()
+    available = {name: ExportColumn(name, data_type) for name, data_type in rows}
+    if not columns:
+        return list(available.values())
+    unknown = [name for name in columns if name not in available]
+    if unknown:
+        raise ValueError(f"Unknown contacts columns: {', '.join(unknown)}. Available: {', '.join(available)}.")
+    return [available[name] for name in columns]
+
+
+def build_export_query(
+    columns: List[ExportColumn],
+    tags: Sequence[str] = (),
+    status: Optional[str] = None,
+    profile_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+) -> Tuple[str, Dict]:
+    """
+    Builds the SELECT of an export and its psycopg2 parameters.
+
+    Column names come from `get_export_columns`, so they are safe to quote
+    into the statement; filter values are passed as parameters. JSONB and
+    other non-native columns are selected as text.
+
+    Args:
+        columns (List[ExportColumn]): The columns to select.
+        tags (Sequence[str]): Only contacts carrying all of these tags.
+        status (Optional[str]): Only contacts with this status.
+        profile_id (Optional[int]): Only contacts of this data profile.
+        since (Optional[datetime]): Only contacts created, updated, tagged or marked as used after this time.
+    """
+    select = ", ".join(
+        f'"{column.name}"' if column.is_native else f'"{column.name}"::text AS "{column.name}"'
+        for column in columns
+    )
+    conditions, params = [], {}
+    # Tags and changes are looked up in the indexed tables behind the view.
+    for i, tag in enumerate(dict.fromkeys(tags)):
+        conditions.append(f"id IN (SELECT contact_id FROM contact_tags WHERE tag = %(tag_{i})s)")
+        params[f"tag_{i}"] = tag
+    if status is not None:
+        conditions.append("status = %(status)s")
+        params["status"] = status
+    if profile_id is not None:
+        conditions.append("profile_id = %(profile_id)s")
+        params["profile_id"] = profile_id
+    if since is not None:
+        conditions.append(
+            "id IN (SELECT id FROM contacts WHERE updated_at > %(since)s "
+            "UNION SELECT contact_id FROM contact_tags WHERE tagged_at > %(since)s "
+            "UNION SELECT contact_id FROM contact_events WHERE recorded_at > %(since)s)"
+        )
+        params["since"] = since
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"SELECT {select} FROM {CONTACTS_VIEW}{where} ORDER BY id", params
+
+
+def iter_contact_chunks(
+    connection: Connection, columns: List[ExportColumn], query: str, params: Dict, chunk_size: int
+) -> Iterator[pd.DataFrame]:
+    """
+    Runs the export query through a named (server-side) cursor and yields
+    the result in DataFrames of at most `chunk_size` rows, so only one chunk
+    is held in memory at a time. The cursor lives in the connection's
+    current transaction.
+    """
+    cursor = connection.connection.cursor(name="contacts_export")
+    try:
+        cursor.itersize = chunk_size
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            df = pd.DataFrame.from_records(rows, columns=[column.name for column in columns])
+            for column in columns:
+                # Keep integer columns integral when they contain NULLs.
+                if column.data_type in _INTEGER_TYPES:
+                    df[column.name] = df[column.name].astype("Int64")
+            yield df
+    finally:
+        cursor.close()
+
+
+def _arrays_to_json(df: pd.DataFrame, columns: List[ExportColumn]) -> pd.DataFrame:
+    """Renders array columns as JSON text for the text-based formats."""
+    for column in columns:
+        if column.is_array:
+            df[column.name] = df[column.name].map(lambda value: json.dumps(value) if isinstance(value, list) else value)
+    return df
+
+
+def _parquet_type(column: ExportColumn):
+    if column.data_type == "smallint":
+        return pa.int16()
+    if column.data_type == "integer":
+        return pa.int32()
+    if column.data_type == "bigint":
+        return pa.int64()
+    if column.data_type in _FLOAT_TYPES:
+        return pa.float64()
+    if column.data_type == "boolean":
+        return pa.bool_()
+    if column.data_type == "timestamp without time zone":
+        return pa.timestamp("us")
+    if column.data_type == "timestamp with time zone":
+        return pa.timestamp("us", tz="UTC")
+    if column.is_array:
+        return pa.list_(pa.string())
+    return pa.string()
+
+
+class CsvExportWriter:
+    def __init__(self, path: str, columns: List[ExportColumn]):
+        self.path = path
+        self.columns = columns
+        self.header = True
+
+    def write(self, df: pd.DataFrame):
+        _arrays_to_json(df, self.columns).to_csv(self.path, mode="w" if self.header else "a", header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        if self.header:  # No rows: still write the header.
+            pd.DataFrame(columns=[column.name for column in self.columns]).to_csv(self.path, index=False)
+
+
+class ParquetExportWriter:
+    def __init__(self, path: str, columns: List[ExportColumn]):
+        if pq is None:
+            raise ValueError("Exporting to Parquet requires the 'pyarrow' package.")
+        # The schema comes from the table definition, so a chunk in which a
+        # column is entirely NULL still has the column's type.
+        self.schema = pa.schema([(column.name, _parquet_type(column)) for column in columns])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, df: pd.DataFrame):
+        self.writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        self.writer.close()
+
+
+class XlsxExportWriter:
+    """
+    Writes a workbook in openpyxl's write-only mode, which streams rows to
+    disk instead of building the workbook in memory. A new sheet is started
+    whenever a sheet reaches Excel's row limit.
+    """
+
+    def __init__(self, path: str, columns: List[ExportColumn]):
+        self.path = path
+        self.columns = columns
+        self.workbook = Workbook(write_only=True)
+        self.sheet = None
+        self.sheet_rows = 0
+        self.sheets = 0
+
+    def _new_sheet(self):
+        self.sheets += 1
+        self.sheet = self.workbook.create_sheet(title="contacts" if self.sheets == 1 else f"contacts_{self.sheets}")
+        self.sheet.append([column.name for column in self.columns])
+        self.sheet_rows = 0
+
+    def write(self, df: pd.DataFrame):
+        df = _arrays_to_json(df, self.columns).astype(object)
+        df = df.where(df.notna(), None)
+        for row in df.itertuples(index=False, name=None):
+            if self.sheet is None or self.sheet_rows == XLSX_MAX_DATA_ROWS:
+                self._new_sheet()
+            self.sheet.append(row)
+            self.sheet_rows += 1
+
+    def close(self):
+        if self.sheet is None:
+            self._new_sheet()
+        self.workbook.save(self.path)
+
+
+_WRITERS = {"csv": CsvExportWriter, "parquet": ParquetExportWriter, "xlsx": XlsxExportWriter}
+
+
+def _write_export(
+    connection: Connection,
+    path: str,
+    export_format: str,
+    columns: List[ExportColumn],
+    query: str,
+    params: Dict,
+    chunk_size: int,
+) -> int:
+    """Streams the rows of an export query to a file and returns their number."""
+    writer = _WRITERS[export_format](path, columns)
+    exported = 0
+    try:
+        for df in iter_contact_chunks(connection, columns, query, params, chunk_size):
+            writer.write(df)
+            exported += len(df)
+            logger.info(f"Exported {exported} contacts...")
+    finally:
+        writer.close()
+    return exported
+
+
+def _check_format(export_format: str):
+    if export_format not in _WRITERS:
+        raise ValueError(f"Unknown export format '{export_format}'. Expected one of: {', '.join(EXPORT_FORMATS)}.")
+
+
+def export_contacts(
+    engine: Engine,
+    path: str,
+    export_format: str,
+    columns: Optional[Sequence[str]] = None,
+    tags: Sequence[str] = (),
+    status: Optional[str] = None,
+    profile_id: Optional[int] = None,
+    chunk_size: int = 10_000,
+) -> int:
+    """
+    Streams the selected contacts to a CSV, Parquet or XLSX file.
+
+    Rows are read in chunks through a server-side cursor and appended to the
+    output as they arrive, so memory use does not grow with the table.
+
+    Args:
+        engine (Engine): The SQLAlchemy database engine.
+        path (str): The output file.
+        export_format (str): One of EXPORT_FORMATS.
+        columns (Optional[Sequence[str]]): The columns to export. Defaults to all.
+        tags (Sequence[str]): Only contacts carrying all of these tags.
+        status (Optional[str]): Only contacts with this status.
+        profile_id (Optional[int]): Only contacts of this data profile.
+        chunk_size (int): Rows fetched per round trip.
+
+    Returns:
+        int: The number of contacts exported.
+    """
+    _check_format(export_format)
+    export_columns = get_export_columns(engine, columns)
+    query, params = build_export_query(export_columns, tags, status, profile_id)
+    with engine.connect() as connection:
+        exported = _write_export(connection, path, export_format, export_columns, query, params, chunk_size)
+        connection.rollback()
+    return exported
+
+
+class DeltaExport(NamedTuple):
+    """The outcome of an `export_delta` call."""
+    exported: int
+    since: Optional[datetime]
+    watermark: Optional[datetime]
+
+
+def get_watermark(engine: Engine, consumer: str) -> Optional[datetime]:
+    """Returns the watermark of a consumer's last delta export, or None if it has none."""
+    with engine.connect() as connection:
+        return connection.execute(
+            text("SELECT watermark FROM export_watermarks WHERE consumer = :consumer"), {"consumer": consumer}
+        ).scalar()
+
+
+def export_delta(
+    engine: Engine,
+    consumer: str,
+    path: str,
+    export_format: str,
+    columns: Optional[Sequence[str]] = None,
+    chunk_size: int = 10_000,
+) -> DeltaExport:
+    """
+    Exports the contacts created, updated, tagged or marked as used since
+    the consumer's last delta.
+
+    A consumer without a watermark gets all contacts. The new watermark is
+    stored only after the file has been written, so a failed export is
+    simply repeated by the next call.
+
+    `contacts.updated_at`, `contact_tags.tagged_at` and
+    `contact_events.recorded_at` hold the time a row was written (migration
+    12), never earlier than its transaction started. A transaction writing
+    these tables while the export runs can still commit rows older than
+    the newest row exported, so the watermark is held back to just before
+    the oldest such transaction; a transaction that writes later stamps its
+    rows after the export started. PostgreSQL only shows the start time of
+    other roles' transactions to members of pg_read_all_stats; while such a
+    writer is open, the watermark stays where it was. Rows changed around
+    the time of an export may appear in two consecutive deltas; consumers
+    should upsert them by `id`.
+
+    Args:
+        engine (Engine): The SQLAlchemy database engine.
+        consumer (str): The name the watermark is stored under, e.g. 'dialer'.
+        path (str): The output file.
+        export_format (str): One of EXPORT_FORMATS.
+        columns (Optional[Sequence[str]]): The columns to export. Defaults to all.
+        chunk_size (int): Rows fetched per round trip.
+
+    Returns:
+        DeltaExport: The number of contacts exported, the previous watermark
+        and the new one.
+    """
+    _check_format(export_format)
+    export_columns = get_export_columns(engine, columns)
+    since = get_watermark(engine, consumer)
+
+    # Read before the export's snapshot is taken, so any transaction that
+    # commits unseen by the export started after this bound.
+    with engine.connect() as connection:
+        hidden, open_since = connection.execute(text(OPEN_WRITERS_SQL)).one()
+
+    query, params = build_export_query(export_columns, since=since)
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+        newest = connection.execute(text("""
+            SELECT GREATEST(
+                (SELECT MAX(updated_at) FROM contacts WHERE CAST(:since AS TIMESTAMP) IS NULL OR updated_at > :since),
+                (SELECT MAX(tagged_at) FROM contact_tags WHERE CAST(:since AS TIMESTAMP) IS NULL OR tagged_at > :since),
+                (SELECT MAX(recorded_at) FROM contact_events WHERE CAST(:since AS TIMESTAMP) IS NULL OR recorded_at > :since)
+            )
+        """), {"since": since}).scalar()
+        exported = _write_export(connection, path, export_format, export_columns, query, params, chunk_size)
+        connection.rollback()
+
+    watermark = since if newest is None else min(newest, open_since)
+    if hidden:
+        logger.warning(
+            f"{hidden} transaction(s) of other roles writing contacts hide their start time; the watermark "
+            f"of '{consumer}' stays at {since}. Grant the exporting role pg_read_all_stats to let it advance."
+        )
+        watermark = since
+    if since is not None and watermark < since:
+        watermark = since
+    if watermark is not None:
+        with engine.begin() as connection:
+            connection.execute(text("""
+                INSERT INTO export_watermarks (consumer, watermark, rows_exported, exported_at)
+                VALUES (:consumer, :watermark, :rows, NOW())
+                ON CONFLICT (consumer) DO UPDATE
+                SET watermark = EXCLUDED.watermark, rows_exported = EXCLUDED.rows_exported, exported_at = NOW()
+            """), {"consumer": consumer, "watermark": watermark, "rows": exported})
+    return DeltaExport(exported, since, watermark)
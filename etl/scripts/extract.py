@@ -1,7 +1,10 @@
 import logging
 from pathlib import Path
 import pandas as pd
-from typing import List
+from typing import Dict, Iterator, List, Optional
+
+from etl.scripts.csv_reader import read_csv
+from etl.scripts.xlsx_cache import XlsxCache
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +16,8 @@ def find_files(source_directory: str) -> List[Path]:
         source_directory (str): The path to the directory containing source files.
 
     Returns:
-        List[Path]: A list of Path objects for each found file.
+        List[Path]: A list of Path objects for each found file, sorted by
+                    name so that every run processes files in the same order.
     """
     source_path = Path(source_directory)
     if not source_path.is_dir():
@@ -22,18 +26,28 @@ def find_files(source_directory: str) -> List[Path]:
 
     csv_files = list(source_path.glob("*.csv"))
     xlsx_files = list(source_path.glob("*.xlsx"))
-    all_files = csv_files + xlsx_files
+    all_files = sorted(csv_files + xlsx_files)
     
     logger.info(f"Found {len(all_files)} files (CSV and XLSX) in {source_directory}.")
     return all_files
 
 
-def extract_data(file_path: Path) -> pd.DataFrame:
+def extract_data(file_path: Path, config: Optional[Dict] = None, content_hash: Optional[str] = None) -> pd.DataFrame:
     """
     Reads a single CSV or XLSX file into a pandas DataFrame.
 
+    CSV files are read with `csv_reader.read_csv`, which detects their
+    layout and applies the column types of their profile. Workbooks are
+    read from the XLSX cache if it is enabled, and added to it otherwise.
+    With `extract.xlsx_reader: "streaming"` in the config, workbooks are
+    parsed with the read-only openpyxl reader instead of `pd.read_excel`,
+    which uses less memory on large workbooks.
+
     Args:
         file_path (Path): The path to the file.
+        config (Optional[Dict]): The pipeline configuration.
+        content_hash (Optional[str]): The file's content hash, if known. It
+            keys the XLSX cache; without it a cached workbook is hashed.
 
     Returns:
         pd.DataFrame: The extracted data as a DataFrame, or an empty
@@ -42,9 +56,10 @@ def extract_data(file_path: Path) -> pd.DataFrame:
     try:
         logger.info(f"Extracting data from {file_path.name}...")
         if file_path.suffix == '.csv':
-            df = pd.read_csv(file_path)
+            df = read_csv(file_path, config)
         elif file_path.suffix == '.xlsx':
-            df = pd.read_excel(file_path)
+            streaming = ((config or {}).get("extract", {}) or {}).get("xlsx_reader") == "streaming"
+            df = _read_excel(file_path, XlsxCache.from_config(config or {}), streaming, content_hash)
         else:
             logger.warning(f"Unsupported file type: {file_path.suffix}. Skipping file.")
             return pd.DataFrame()
@@ -56,4 +71,140 @@ def extract_data(file_path: Path) -> pd.DataFrame:
     except Exception as e:
         logger.error(f"An error occurred during extraction from {file_path}: {e}")
     
-    return pd.DataFrame()
\ No newline at end of file
+    return pd.DataFrame()
+
+
+def _read_excel(
+    file_path: Path, xlsx_cache: Optional[XlsxCache], streaming: bool, content_hash: Optional[str] = None
+) -> pd.DataFrame:
+    """Reads a whole workbook, from the cache if possible."""
+    key = xlsx_cache.key(file_path, content_hash) if xlsx_cache is not None else None
+    if key is not None:
+        df = xlsx_cache.read(key)
+        if df is not None:
+            logger.info(f"Read {file_path.name} from the XLSX cache.")
+            return df
+
+    if streaming:
+        df = next(_iter_excel_chunks(file_path, None), pd.DataFrame())
+    else:
+        df = pd.read_excel(file_path)
+
+    if key is not None:
+        xlsx_cache.write(key, df)
+    return df
+
+
+def iter_data_chunks(
+    file_path: Path,
+    chunk_size: int,
+    skip_rows: int = 0,
+    config: Optional[Dict] = None,
+    content_hash: Optional[str] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Reads a single CSV or XLSX file as a stream of DataFrames of at most
+    `chunk_size` rows, so that only one chunk is held in memory at a time.
+
+    Args:
+        file_path (Path): The path to the file.
+        chunk_size (int): The maximum number of rows per chunk.
+        skip_rows (int): The number of leading data rows to drop, e.g. rows
+                         already loaded by an interrupted run. Row numbers
+                         in the index still count from the start of the file.
+        config (Optional[Dict]): The pipeline configuration. CSV files are
+                         read with the column types of their profile, and
+                         workbooks found in the XLSX cache are read from it.
+                         Other workbooks are streamed and not cached.
+        content_hash (Optional[str]): The file's content hash, if known. It
+                         keys the XLSX cache; without it a workbook is
+                         hashed to look it up.
+
+    Yields:
+        pd.DataFrame: The next chunk of rows. Nothing is yielded if the file
+                      cannot be read.
+    """
+    total_rows = 0
+    try:
+        logger.info(f"Streaming data from {file_path.name} in chunks of {chunk_size} rows...")
+        if file_path.suffix == '.csv':
+            chunks = read_csv(file_path, config, chunksize=chunk_size)
+        elif file_path.suffix == '.xlsx':
+            chunks = None
+            xlsx_cache = XlsxCache.from_config(config or {})
+            if xlsx_cache is not None:
+                chunks = xlsx_cache.iter_chunks(xlsx_cache.key(file_path, content_hash), chunk_size)
+                if chunks is not None:
+                    logger.info(f"Reading {file_path.name} from the XLSX cache.")
+            if chunks is None:
+                chunks = _iter_excel_chunks(file_path, chunk_size)
+        else:
+            logger.warning(f"Unsupported file type: {file_path.suffix}. Skipping file.")
+            return
+
+        skipped = 0
+        for chunk in chunks:
+            if skipped < skip_rows:
+                drop = min(skip_rows - skipped, len(chunk))
+                chunk = chunk.iloc[drop:]
+                skipped += drop
+                if chunk.empty:
+                    continue
+            total_rows += len(chunk)
+            yield chunk
+
+        if skipped:
+            logger.info(f"Skipped {skipped} rows of {file_path.name} that were already loaded.")
+
+        logger.info(f"Successfully extracted {total_rows} rows from {file_path.name}.")
+    except FileNotFoundError:
+        logger.error(f"File not found during extraction: {file_path}")
+    except Exception as e:
+        logger.error(f"An error occurred during extraction from {file_path} after {total_rows} rows: {e}")
+        # Earlier chunks have already been passed on, so the file must not be
+        # treated as fully processed.
+        if total_rows:
+            raise
+
+
+def _iter_excel_chunks(file_path: Path, chunk_size: Optional[int]) -> Iterator[pd.DataFrame]:
+    """
+    Reads the first worksheet of a workbook in read-only mode, row by row,
+    and yields DataFrames of at most `chunk_size` rows (all rows in a single
+    DataFrame if `chunk_size` is None).
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+
+        buffer = []
+        start = 0
+        for row in rows:
+            buffer.append(row)
+            if chunk_size and len(buffer) == chunk_size:
+                yield _excel_rows_to_frame(buffer, columns, start)
+                start += len(buffer)
+                buffer = []
+        if buffer:
+            yield _excel_rows_to_frame(buffer, columns, start)
+    finally:
+        workbook.close()
+
+
+def _excel_rows_to_frame(rows: list, columns: List[str], start: int) -> pd.DataFrame:
+    """Builds a chunk DataFrame, numbering rows continuously across chunks."""
+    chunk = pd.DataFrame.from_records(rows, columns=columns)
+    chunk.index = pd.RangeIndex(start, start + len(chunk))
+    # Let pandas infer column types the way read_excel would; empty cells
+    # come back as None, so all-empty columns become float NaN columns.
+    chunk = chunk.infer_objects()
+    empty_columns = [col for col in chunk.columns[chunk.dtypes == object] if chunk[col].isna().all()]
+    if empty_columns:
+        chunk[empty_columns] = chunk[empty_columns].astype(float)
+    return chunk
@@ -0,0 +1,244 @@
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak RSS is not recorded there
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class StageRecord(NamedTuple):
+    """The totals of one stage for one file (`file_name` is '' for run-wide stages)."""
+    file_name: str
+    stage: str
+    calls: int
+    seconds: float
+    rows_in: Optional[int]
+    rows_out: Optional[int]
+    # The largest change of the process's resident set size during one
+    # call. In pipelined runs it includes what other threads allocated
+    # meanwhile.
+    rss_growth_mb: Optional[float]
+    # The process's peak resident set size when the stage last finished.
+    # It never decreases, so it is the same for all later stages.
+    process_peak_rss_mb: Optional[float]
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        rows = self.rows_in if self.rows_in is not None else self.rows_out
+        if rows is None or not self.seconds:
+            return None
+        return rows / self.seconds
+
+
+def current_rss_mb() -> Optional[float]:
+    """Returns the current resident set size of this process in MB, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Returns the peak resident set size of this process so far, in MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class StageMeasurement:
+    """Collects the row counts of a stage while it runs."""
+
+    def __init__(self, rows_in: Optional[int] = None):
+        self.rows_in = rows_in
+        self.rows_out: Optional[int] = None
+        self.calls = 1
+
+
+class StageRecorder:
+    """
+    Accumulates stage timings per file and stage. Safe to use from the
+    pipeline's background threads.
+    """
+
+    def __init__(self):
+        self._records: Dict[Tuple[str, str], StageRecord] = {}
+        self._lock = threading.Lock()
+
+    def record(self, record: StageRecord):
+        key = (record.file_name, record.stage)
+        with self._lock:
+            previous = self._records.get(key)
+            if previous is not None:
+                record = StageRecord(
+                    record.file_name,
+                    record.stage,
+                    previous.calls + record.calls,
+                    previous.seconds + record.seconds,
+                    _add(previous.rows_in, record.rows_in),
+                    _add(previous.rows_out, record.rows_out),
+                    _max(previous.rss_growth_mb, record.rss_growth_mb),
+                    _max(previous.process_peak_rss_mb, record.process_peak_rss_mb),
+                )
+            self._records[key] = record
+
+    def merge(self, records: Iterable[StageRecord]):
+        """Adds records collected elsewhere, e.g. in a worker process."""
+        for record in records:
+            self.record(record)
+
+    def records(self) -> List[StageRecord]:
+        with self._lock:
+            return list(self._records.values())
+
+    def totals(self) -> List[StageRecord]:
+        """The records summed over all files, one per stage, in first-seen order."""
+        totals = StageRecorder()
+        for record in self.records():
+            totals.record(record._replace(file_name=""))
+        return totals.records()
+
+
+def _add(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    if a is None:
+        return b
+    return a if b is None else a + b
+
+
+def _max(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    if a is None:
+        return b
+    return a if b is None else max(a, b)
+
+
+# Stages report to the recorder of the current run, if one is active, so
+# that the pipeline functions need no extra arguments. Measuring is a no-op
+# without one.
+_active_recorder: Optional[StageRecorder] = None
+
+
+def start_recording(recorder: StageRecorder) -> Optional[StageRecorder]:
+    """Makes `recorder` receive the stages measured in this process and returns the previous recorder."""
+    global _active_recorder
+    previous, _active_recorder = _active_recorder, recorder
+    return previous
+
+
+def stop_recording(previous: Optional[StageRecorder] = None):
+    """Restores the recorder that was active before `start_recording`."""
+    global _active_recorder
+    _active_recorder = previous
+
+
+@contextmanager
+def recording(recorder: StageRecorder) -> Iterator[StageRecorder]:
+    """Makes `recorder` receive the stages measured in this process within the block."""
+    previous = start_recording(recorder)
+    try:
+        yield recorder
+    finally:
+        stop_recording(previous)
+
+
+def add_records(records: Iterable[StageRecord]):
+    """Adds records measured in another process, e.g. a worker, to the active recorder."""
+    if _active_recorder is not None:
+        _active_recorder.merge(records)
+
+
+@contextmanager
+def stage(name: str, file_name: str = "", rows_in: Optional[int] = None) -> Iterator[StageMeasurement]:
+    """
+    Measures the wall time of a block of work as one call of a stage.
+
+    The block can set `rows_in` and `rows_out` on the yielded measurement.
+    """
+    measurement = StageMeasurement(rows_in)
+    recorder = _active_recorder
+    if recorder is None:
+        yield measurement
+        return
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    try:
+        yield measurement
+    finally:
+        seconds = time.perf_counter() - started
+        rss_after = current_rss_mb()
+        rss_growth = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        recorder.record(StageRecord(
+            file_name, name, measurement.calls, seconds,
+            measurement.rows_in, measurement.rows_out, rss_growth, peak_rss_mb(),
+        ))
+
+
+def timed_iter(name: str, file_name: str, items: Iterable[T]) -> Iterator[T]:
+    """
+    Yields from `items`, measuring the time spent producing each item (not
+    the time the caller spends on it) as a call of a stage. Items with a
+    length count as its output rows.
+    """
+    iterator = iter(items)
+    while True:
+        with stage(name, file_name) as measurement:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                measurement.calls = 0
+                return
+            measurement.rows_out = len(item) if hasattr(item, "__len__") else None
+        yield item
+
+
+def log_summary(recorder: StageRecorder):
+    """Logs the totals of each stage."""
+    for record in recorder.totals():
+        throughput = f", {record.rows_per_second:,.0f} rows/s" if record.rows_per_second else ""
+        rows = "".join(
+            f", {count} rows {direction}"
+            for count, direction in ((record.rows_in, "in"), (record.rows_out, "out"))
+            if count is not None
+        )
+        rss = ""
+        if record.rss_growth_mb is not None:
+            rss += f", RSS {record.rss_growth_mb:+.0f} MB in its largest call"
+        if record.process_peak_rss_mb is not None:
+            rss += f", process peak RSS {record.process_peak_rss_mb:.0f} MB"
+        logger.info(f"Stage '{record.stage}': {record.seconds:.2f}s in {record.calls} calls{rows}{throughput}{rss}.")
+
+
+def save_run_stages(engine: Engine, run_id: int, recorder: StageRecorder):
+    """Stores the stage records of an ETL run in the `etl_run_stages` table."""
+    records = recorder.records()
+    if not records:
+        return
+    with engine.begin() as connection:
+        connection.execute(
+            text("""
+                INSERT INTO etl_run_stages
+                    (run_id, file_name, stage, calls, seconds, rows_in, rows_out, rows_per_second,
+                     rss_growth_mb, process_peak_rss_mb)
+                VALUES (:run_id, :file_name, :stage, :calls, :seconds, :rows_in, :rows_out, :rows_per_second,
+                        :rss_growth_mb, :process_peak_rss_mb)
+            """),
+            [
+                {**record._asdict(), "run_id": run_id, "rows_per_second": record.rows_per_second}
+                for record in records
+            ],
+        )
@@ -1,35 +1,37 @@
+import csv
+import io
+import json
 import logging
-import os
 from pathlib import Path
-import hashlib
-from typing import List, Optional
+from contextlib import nullcontext
+from typing import List, Optional, Tuple
 import pandas as pd
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
 from sqlalchemy.dialects.postgresql import JSONB
 
+from etl.scripts.migrations import current_version
+from etl.scripts.transform import header_fingerprint
+
 logger = logging.getLogger(__name__)
 
-def get_db_engine() -> Engine:
-    """
-    Creates and returns a SQLAlchemy database engine using the DATABASE_URL
-    from the environment variables.
+# Loads write tags to contact_tags, which migration 6 created when it moved
+# them out of contacts.tags.
+REQUIRED_SCHEMA_VERSION = 6
 
-    Returns:
-        Engine: The SQLAlchemy database engine.
+def check_schema_version(engine: Engine):
     """
-    database_url = os.getenv("DATABASE_URL")
-    if not database_url:
-        logger.error("DATABASE_URL environment variable not set.")
-        raise ValueError("DATABASE_URL is not configured.")
+    Checks that the database schema is recent enough to load contacts into.
 
-    try:
-        engine = create_engine(database_url)
-        logger.info("Database engine created successfully.")
-        return engine
-    except Exception as e:
-        logger.error(f"Failed to create database engine: {e}")
-        raise
+    Raises:
+        RuntimeError: If migrations up to REQUIRED_SCHEMA_VERSION are not applied.
+    """
+    version = current_version(engine)
+    if version < REQUIRED_SCHEMA_VERSION:
+        raise RuntimeError(
+            f"The database schema is at version {version}, but loading contacts requires version "
+            f"{REQUIRED_SCHEMA_VERSION}. Run setup_database.py or migrations.py first."
+        )
 
 def get_or_create_profile_id(json_keys: List[str], engine: Engine) -> Optional[int]:
     """
@@ -43,9 +45,7 @@ def get_or_create_profile_id(json_keys: List[str], engine: Engine) -> Optional[i
     sorted_keys = sorted(json_keys)
     
     # Create a stable hash
-    m = hashlib.md5()
-    m.update(str(sorted_keys).encode('utf-8'))
-    profile_hash = m.hexdigest()
+    profile_hash = header_fingerprint(sorted_keys)
 
     with engine.connect() as connection:
         # Check if profile exists
@@ -55,13 +55,9 @@ def get_or_create_profile_id(json_keys: List[str], engine: Engine) -> Optional[i
         ).fetchone()
 
         if result:
+            # contact_count is maintained by the contact_stats trigger as
+            # contacts are loaded.
             profile_id = result[0]
-            # Increment the count for this profile
-            connection.execute(
-                text("UPDATE contact_profiles SET contact_count = contact_count + 1 WHERE id = :id"),
-                {"id": profile_id}
-            )
-            connection.commit()  # Commit the transaction
             logger.info(f"Found existing profile_id: {profile_id} for hash: {profile_hash}")
             return profile_id
         else:
@@ -80,24 +76,156 @@ def get_or_create_profile_id(json_keys: List[str], engine: Engine) -> Optional[i
                 logger.error("Failed to create a new profile, insert operation returned no ID.")
                 return None
 
-def load_to_db(df: pd.DataFrame, table_name: str, engine: Engine, json_keys: List[str]):
+def _to_pg_array(values) -> Optional[str]:
+    """Formats a list as a PostgreSQL array literal for COPY."""
+    if values is None or (not isinstance(values, (list, tuple)) and pd.isna(values)):
+        return None
+    items = []
+    for value in values:
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        items.append(f'"{escaped}"')
+    return "{" + ",".join(items) + "}"
+
+def copy_dataframe(cursor, df: pd.DataFrame, table_name: str, batch_size: int = 50_000):
+    """
+    Streams the rows of a DataFrame into a table with COPY FROM STDIN.
+
+    Rows are serialized to CSV one batch at a time, so only a single batch
+    is held as text in memory. List columns (e.g. 'tags') are written as
+    PostgreSQL array literals and missing values as NULL.
+
+    Args:
+        cursor: A psycopg2 cursor.
+        df (pd.DataFrame): The rows to copy. Column names must match the table.
+        table_name (str): The target table.
+        batch_size (int): The number of rows serialized per COPY batch.
+    """
+    columns = ", ".join(f'"{col}"' for col in df.columns)
+    copy_sql = f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    list_columns = [
+        col for col in df.columns
+        if df[col].dtype == object and df[col].first_valid_index() is not None
+        and isinstance(df[col].loc[df[col].first_valid_index()], (list, tuple))
+    ]
+
+    for start in range(0, len(df), batch_size):
+        batch = df.iloc[start:start + batch_size]
+        if list_columns:
+            batch = batch.assign(**{col: batch[col].map(_to_pg_array) for col in list_columns})
+        buffer = io.StringIO()
+        batch.to_csv(buffer, index=False, header=False, na_rep='\\N', quoting=csv.QUOTE_MINIMAL)
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+
+def _copy_load(
+    df: pd.DataFrame, table_name: str, engine: Engine, connection: Optional[Connection] = None
+) -> Tuple[int, int]:
+    """
+    Loads rows through a staging table: the rows are streamed with COPY into
+    a temporary table (temporary tables are not WAL-logged and are private to
+    the session, so concurrent loads cannot collide), then moved into the
+    target table with a single INSERT ... SELECT that skips phone numbers
+    that already exist, including ones inserted concurrently by other runs.
+
+    A 'tags' column is not stored in the target table: the tags of the
+    inserted rows are added to `contact_tags` in the same statement.
+
+    Runs in its own transaction unless a `connection` with an open
+    transaction is given; the staging table is then dropped when the
+    caller commits.
+
+    Returns:
+        Tuple[int, int]: The number of rows inserted and skipped.
+    """
+    staging_table = f"staging_{table_name}"
+    has_tags = "tags" in df.columns
+    columns = ", ".join(f'"{col}"' for col in df.columns if col != "tags")
+
+    with nullcontext(connection) if connection is not None else engine.begin() as connection:
+        cursor = connection.connection.cursor()
+        try:
+            # Only copy the column definitions, not the defaults, so the
+            # staging rows do not consume ids from the contacts sequence.
+            cursor.execute(
+                f"CREATE TEMP TABLE {staging_table} ON COMMIT DROP AS "
+                f"SELECT {columns}{', NULL::text[] AS tags' if has_tags else ''} FROM {table_name} WITH NO DATA"
+            )
+            copy_dataframe(cursor, df, staging_table)
+            insert_sql = (
+                f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {staging_table} "
+                f"ON CONFLICT (phone_number) DO NOTHING"
+            )
+            if has_tags:
+                # Phone numbers are unique within a file, and at most one
+                # row per file has none, so rows are matched by phone number.
+                cursor.execute(f"""
+                    WITH inserted AS ({insert_sql} RETURNING id, phone_number),
+                    inserted_tags AS (
+                        SELECT i.id, s.tags FROM inserted i JOIN {staging_table} s ON s.phone_number = i.phone_number
+                        UNION ALL
+                        SELECT i.id, s.tags FROM inserted i JOIN {staging_table} s ON i.phone_number IS NULL AND s.phone_number IS NULL
+                    ),
+                    tagged AS (
+                        INSERT INTO contact_tags (contact_id, tag)
+                        SELECT it.id, t.tag FROM inserted_tags it CROSS JOIN LATERAL unnest(it.tags) AS t (tag)
+                        WHERE t.tag IS NOT NULL
+                        ON CONFLICT (tag, contact_id) DO NOTHING
+                    )
+                    SELECT COUNT(*) FROM inserted
+                """)
+                inserted = cursor.fetchone()[0]
+            else:
+                cursor.execute(insert_sql)
+                inserted = cursor.rowcount
+        finally:
+            cursor.close()
+
+    return inserted, len(df) - inserted
+
+def load_to_db(
+    df: pd.DataFrame,
+    table_name: str,
+    engine: Engine,
+    json_keys: List[str],
+    profile_id: Optional[int] = None,
+    connection: Optional[Connection] = None,
+) -> Tuple[int, int]:
     """
     Loads a DataFrame into a specified database table after assigning a profile ID.
 
+    On PostgreSQL (psycopg2) the rows are bulk loaded with COPY through a
+    staging table, and rows whose phone number already exists are skipped
+    instead of failing the whole load. The lists in a 'tags' column are
+    stored in `contact_tags`. Other databases fall back to
+    `DataFrame.to_sql`, without the tags. Either way, `additional_info`
+    holds the JSON text of each row and is stored as a JSON object.
+
     Args:
         df (pd.DataFrame): The DataFrame to load.
         table_name (str): The name of the target table.
         engine (Engine): The SQLAlchemy database engine.
         json_keys (List[str]): The list of keys in the additional_info JSON.
+        profile_id (Optional[int]): A profile ID already resolved for these
+            keys, e.g. by an earlier chunk of the same file. Looked up from
+            `json_keys` if not given.
+        connection (Optional[Connection]): A connection with an open
+            transaction to load the rows in, so the caller can commit them
+            together with its own bookkeeping. By default the rows are
+            committed in a transaction of their own.
+
+    Returns:
+        Tuple[int, int]: The number of rows inserted, and the number skipped
+        because their phone number already exists.
     """
     if df.empty:
         logger.info("DataFrame is empty. Nothing to load to the database.")
-        return
+        return 0, 0
 
     try:
         # Get the profile ID for this batch of data
-        profile_id = get_or_create_profile_id(json_keys, engine)
-        df['profile_id'] = profile_id
+        if profile_id is None:
+            profile_id = get_or_create_profile_id(json_keys, engine)
+        df = df.assign(profile_id=profile_id)
 
         logger.info(f"Loading {len(df)} rows with profile_id {profile_id} into '{table_name}' table...")
         
@@ -105,15 +233,31 @@ def load_to_db(df: pd.DataFrame, table_name: str, engine: Engine, json_keys: Lis
         if 'profile_id' in df.columns:
             df['profile_id'] = df['profile_id'].astype('Int64') # Use nullable integer
 
-        # Using 'append' to add new records.
-        df.to_sql(
-            table_name,
-            engine,
-            if_exists="append",
-            index=False,
-            dtype={'additional_info': JSONB}
+        if engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2":
+            inserted, skipped = _copy_load(df, table_name, engine, connection=connection)
+        else:
+            # Using 'append' to add new records. Tags are kept in
+            # contact_tags, which only the COPY path writes.
+            df = df.drop(columns="tags", errors="ignore")
+            if 'additional_info' in df.columns:
+                # JSONB serializes the value it is given, so the JSON text
+                # would be stored as a string scalar instead of an object.
+                df['additional_info'] = df['additional_info'].map(
+                    lambda value: json.loads(value) if isinstance(value, str) else value
+                )
+            df.to_sql(
+                table_name,
+                connection if connection is not None else engine,
+                if_exists="append",
+                index=False,
+                dtype={'additional_info': JSONB}
+            )
+            inserted, skipped = len(df), 0
+        logger.info(
+            f"Successfully loaded data into '{table_name}': {inserted} rows inserted, "
+            f"{skipped} skipped as existing phone numbers."
         )
-        logger.info(f"Successfully loaded data into '{table_name}'.")
+        return inserted, skipped
     except Exception as e:
         logger.error(f"Failed to load data into '{table_name}': {e}")
         # Re-raise the exception to be handled by the main orchestrator
@@ -1,12 +1,16 @@
+import cProfile
 import logging
 import os
 import pandas as pd
-import yaml
 from dotenv import load_dotenv
-from rapidfuzz import fuzz, process
 from sqlalchemy.engine import Engine
 from sqlalchemy import text
 from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
 import sys
 import click
 
@@ -15,20 +19,520 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from etl.scripts.extract import find_files, extract_data
+from etl.scripts.extract import find_files, extract_data, iter_data_chunks
 from etl.scripts.transform import apply_transformations, clean_data
-from etl.scripts.load import get_db_engine, load_to_db, move_processed_file
-from etl.scripts.utils import setup_logging
+from etl.scripts.database import get_db_engine, log_pool_stats
+from etl.scripts.load import check_schema_version, get_or_create_profile_id, load_to_db, move_processed_file
+from etl.scripts.manifest import STATE_COMPLETED, ManifestEntry, check_file, complete_file, record_progress, start_file
+from etl.scripts.instrumentation import (
+    StageRecord, StageRecorder, add_records, log_summary, recording, save_run_stages, stage,
+    start_recording, stop_recording, timed_iter,
+)
+from etl.scripts.dedup_index import CompanyNameIndex, DatabaseNameIndex, NameLookup
+from etl.scripts.phone_filter import DatabasePhoneFilter, PhoneLookup
+from etl.scripts.phone_index import PhoneIndex
+from etl.scripts.pipeline import END_OF_GROUP, Gate, Pipeline, iter_groups
+from etl.scripts.utils import load_config, setup_logging
+
+logger = logging.getLogger(__name__)
+
+def deduplicate(
+    cleaned_df: pd.DataFrame,
+    config: Dict,
+    phone_index: Optional[PhoneLookup],
+    name_index: Optional[NameLookup],
+    file_name: str = "",
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Removes rows that already exist in the database.
+
+    Rows whose phone number already exists (in the phone index, or in the
+    database with the "database" backend) are dropped. Rows whose company
+    name fuzzy-matches an existing name are set aside for review, with the
+    matched name, the similarity score and, with the "database" fuzzy
+    backend, the id of the matched contact.
+
+    Args:
+        cleaned_df (pd.DataFrame): The cleaned rows of a file (or chunk).
+        config (Dict): The pipeline configuration.
+        phone_index (Optional[PhoneLookup]): Existing phone numbers, if available.
+        name_index (Optional[NameLookup]): Existing company names, if
+            fuzzy matching is enabled.
+        file_name (str): The source file, under which the stages are timed.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: The rows to load, and the potential
+        duplicates to review.
+    """
+    logger.info("Starting deduplication...")
+    pre_dedupe_rows = len(cleaned_df)
+    if phone_index is not None:
+        with stage("dedup_phone", file_name, rows_in=pre_dedupe_rows) as measurement:
+            cleaned_df = cleaned_df[~phone_index.contains(cleaned_df['phone_number'])]
+            measurement.rows_out = len(cleaned_df)
+    rows_after_phone_check = len(cleaned_df)
+    logger.info(f"Removed {pre_dedupe_rows - rows_after_phone_check} rows with existing phone numbers.")
+
+    potential_duplicates_to_review = cleaned_df.iloc[0:0]
+    if name_index is not None:
+        logger.info("Fuzzy matching for company names is enabled.")
+        threshold = config["deduplication"]["company_name_threshold"]
+        with stage("dedup_fuzzy", file_name, rows_in=len(cleaned_df)) as measurement:
+            matches = name_index.match(cleaned_df["company_name"].tolist(), threshold)
+            measurement.rows_out = sum(match is None for match in matches)
+        duplicate_mask = pd.Series([match is not None for match in matches], index=cleaned_df.index, dtype=bool)
+        for company_name, match in zip(cleaned_df["company_name"], matches):
+            if match:
+                logger.warning(
+                    f"Potential duplicate for '{company_name}'. Similarity: {match.score}%. "
+                    f"Matched: '{match.company_name}'. Skipping."
+                )
+        found = [match for match in matches if match is not None]
+        potential_duplicates_to_review = cleaned_df[duplicate_mask].assign(
+            matched_company_name=[match.company_name for match in found],
+            match_score=[match.score for match in found],
+            matched_contact_id=pd.array([match.contact_id for match in found], dtype="Int64"),
+        )
+        cleaned_df = cleaned_df[~duplicate_mask]
+    else:
+        logger.info("Fuzzy matching for company names is disabled.")
+
+    logger.info(f"Deduplication complete. {len(cleaned_df)} rows remaining.")
+    return cleaned_df, potential_duplicates_to_review
+
+def prepare_file(
+    file_path: Path,
+    config: Dict,
+    chunk_size: Optional[int] = None,
+    skip_rows: int = 0,
+    content_hash: Optional[str] = None,
+) -> Iterator[Tuple[pd.DataFrame, List[str], int]]:
+    """
+    Runs a single source file through extract, transform and clean. These
+    stages need no database access, so they can run in a worker process.
+
+    With a chunk size, the file is streamed through the stages one chunk at
+    a time, so memory use is bounded by the chunk size rather than the file
+    size. Phone numbers are tracked across chunks so that in-file
+    deduplication gives the same result as processing the whole file at once.
+
+    Args:
+        file_path (Path): The source file.
+        config (Dict): The pipeline configuration.
+        chunk_size (Optional[int]): The number of rows per chunk, or None to
+            read the whole file at once.
+        skip_rows (int): The number of leading source rows to skip because an
+            interrupted run already loaded them.
+        content_hash (Optional[str]): The file's content hash from the
+            ingestion manifest, so the XLSX cache does not hash it again.
+
+    Yields:
+        Tuple[pd.DataFrame, List[str], int]: The cleaned rows of each chunk,
+        the JSON keys (sorted source columns) of the file, and the number of
+        source rows the chunk was built from. Nothing is yielded if no data
+        could be extracted.
+    """
+    source_name = f"{file_path.stem}_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}"
+    if chunk_size:
+        chunks = timed_iter(
+            "extract", file_path.name, iter_data_chunks(
+                file_path, chunk_size, skip_rows=skip_rows, config=config, content_hash=content_hash
+            )
+        )
+        seen_phones = set()
+    else:
+        with stage("extract", file_path.name) as measurement:
+            raw_df = extract_data(file_path, config, content_hash=content_hash).iloc[skip_rows:]
+            measurement.rows_out = len(raw_df)
+        chunks = [raw_df] if not raw_df.empty else []
+        seen_phones = None
+        del raw_df
+
+    for raw_df in chunks:
+        source_rows = len(raw_df)
+        with stage("transform", file_path.name, rows_in=source_rows) as measurement:
+            transformed_df, json_keys = apply_transformations(raw_df, file_path.name, config)
+            measurement.rows_out = len(transformed_df)
+        del raw_df
+        with stage("clean", file_path.name, rows_in=len(transformed_df)) as measurement:
+            cleaned_df = clean_data(
+                transformed_df,
+                seen_phones=seen_phones,
+                source_name=source_name,
+                phone_settings=config.get("phone_normalization"),
+            )
+            measurement.rows_out = len(cleaned_df)
+        del transformed_df
+        yield cleaned_df, json_keys, source_rows
+
+def deduplicate_chunks(
+    file_path: Path,
+    prepared_chunks: Iterable[Tuple[pd.DataFrame, List[str], int]],
+    config: Dict,
+    phone_index: Optional[PhoneLookup],
+    name_index: Optional[NameLookup],
+) -> Iterator[Tuple[pd.DataFrame, List[str], int]]:
+    """
+    Deduplicates the prepared chunks of a file against the database and
+    writes potential duplicates to the file's review CSV.
+
+    Args:
+        file_path (Path): The source file.
+        prepared_chunks (Iterable[Tuple[pd.DataFrame, List[str], int]]): The
+            output of `prepare_file` for this file.
+        config (Dict): The pipeline configuration.
+        phone_index (Optional[PhoneLookup]): Existing phone numbers, if available.
+        name_index (Optional[NameLookup]): Existing company names, if
+            fuzzy matching is enabled.
+
+    Yields:
+        Tuple[pd.DataFrame, List[str], int]: Each chunk with the rows to load,
+        in the same form as the input.
+    """
+    review_path = os.path.join(config["review_directory"], f"review_{file_path.stem}.csv")
+    review_started = False
+    if isinstance(name_index, DatabaseNameIndex):
+        # Match against the contacts loaded before this file only.
+        name_index = name_index.snapshot()
+
+    for cleaned_df, json_keys, source_rows in prepared_chunks:
+        cleaned_df, potential_duplicates_to_review = deduplicate(
+            cleaned_df, config, phone_index, name_index, file_name=file_path.name
+        )
+
+        if not potential_duplicates_to_review.empty:
+            os.makedirs(config["review_directory"], exist_ok=True)
+            potential_duplicates_to_review.to_csv(
+                review_path, index=False, mode='a' if review_started else 'w', header=not review_started
+            )
+            review_started = True
+
+        yield cleaned_df, json_keys, source_rows
+
+def load_file(
+    file_path: Path,
+    deduplicated_chunks: Iterable[Tuple[pd.DataFrame, List[str], int]],
+    config: Dict,
+    engine: Engine,
+    dry_run: bool,
+    phone_index: Optional[PhoneLookup],
+    name_index: Optional[NameLookup],
+    manifest_entry: Optional[ManifestEntry] = None,
+    run_id: Optional[int] = None,
+) -> Optional[int]:
+    """
+    Loads the deduplicated chunks of a file, then moves the file to the
+    processed directory. This is the only stage that writes to the database,
+    so it always runs in the main process, one file at a time.
+
+    With a manifest entry, each chunk is committed together with the file's
+    row offset in the ingestion manifest, and the file is marked completed
+    once all chunks are loaded. A run that stops part-way through a file can
+    then resume after the last committed chunk.
+
+    Args:
+        file_path (Path): The source file.
+        deduplicated_chunks (Iterable[Tuple[pd.DataFrame, List[str], int]]):
+            The output of `deduplicate_chunks` for this file.
+        config (Dict): The pipeline configuration.
+        engine (Engine): The SQLAlchemy database engine.
+        dry_run (bool): If True, nothing is written to the database.
+        phone_index (Optional[PhoneLookup]): Refreshed after each load, if
+            given. In a dry run, it remembers the numbers that would be loaded.
+        name_index (Optional[NameLookup]): Receives the loaded company
+            names once the file is loaded, if given.
+        manifest_entry (Optional[ManifestEntry]): The file's entry in the
+            ingestion manifest, or None to load without tracking progress.
+        run_id (Optional[int]): The ID of the current ETL run.
+
+    Returns:
+        Optional[int]: The number of contacts loaded (or that would be loaded
+        in a dry run), or None if no data could be extracted from the file.
+    """
+    extracted_any = False
+    profile_id = None
+    loaded_names = []
+    contacts_added = 0
+    track_progress = manifest_entry is not None and not dry_run
+    if track_progress:
+        start_file(engine, manifest_entry, file_path, run_id)
+
+    for cleaned_df, json_keys, source_rows in deduplicated_chunks:
+        extracted_any = True
+        if dry_run:
+            logger.info(f"[DRY RUN] Would load {len(cleaned_df)} new contacts from {file_path.name}.")
+            if not cleaned_df.empty and contacts_added == 0:
+                print(f"\n--- [DRY RUN] Sample of Processed Data for {file_path.name} ---")
+                print(cleaned_df.head(1).to_string())
+                print("--- End of Sample ---\n")
+            contacts_added += len(cleaned_df)
+            # Later files are checked as if these rows had been loaded.
+            if phone_index is not None:
+                phone_index.add(cleaned_df['phone_number'])
+            if name_index is not None:
+                loaded_names.extend(cleaned_df['company_name'])
+        elif not cleaned_df.empty:
+            if profile_id is None:
+                profile_id = get_or_create_profile_id(json_keys, engine)
+            with stage("load", file_path.name, rows_in=len(cleaned_df)) as measurement:
+                with engine.begin() as connection:
+                    inserted, skipped = load_to_db(
+                        cleaned_df, "contacts", engine, json_keys, profile_id=profile_id, connection=connection
+                    )
+                    if track_progress:
+                        record_progress(connection, manifest_entry.content_hash, source_rows, inserted)
+                measurement.rows_out = inserted
+            if phone_index is not None:
+                with stage("phone_index_refresh", file_path.name):
+                    phone_index.refresh(engine)
+            if name_index is not None:
+                # Names are only matched against other files, not against
+                # earlier chunks of the same file.
+                loaded_names.extend(cleaned_df['company_name'])
+            contacts_added += inserted
+        elif track_progress:
+            with engine.begin() as connection:
+                record_progress(connection, manifest_entry.content_hash, source_rows, 0)
+
+    if not extracted_any and not (manifest_entry and manifest_entry.rows_committed):
+        return None
+
+    if not dry_run:
+        if track_progress:
+            complete_file(engine, manifest_entry.content_hash)
+        move_processed_file(file_path, config["processed_directory"])
+    if name_index is not None:
+        name_index.add(loaded_names)
+
+    return contacts_added
+
+def _iter_prepared_chunks(
+    file_path: Path,
+    prepared: Optional[Future],
+    config: Dict,
+    chunk_size: Optional[int],
+    manifest_entry: Optional[ManifestEntry],
+) -> Iterator[Tuple[pd.DataFrame, List[str], int]]:
+    """Yields the prepared chunks of a file, from a worker's future or prepared here."""
+    if prepared is not None:
+        chunks, stage_records = prepared.result()
+        add_records(stage_records)
+        yield from chunks
+    else:
+        entry = manifest_entry or ManifestEntry(None, None, 0)
+        yield from prepare_file(
+            file_path, config, chunk_size=chunk_size, skip_rows=entry.rows_committed, content_hash=entry.content_hash
+        )
+
+def iter_deduplicated_files(
+    file_jobs: Iterable[Tuple[Path, Optional[Future]]],
+    config: Dict,
+    phone_index: Optional[PhoneLookup],
+    name_index: Optional[NameLookup],
+    chunk_size: Optional[int] = None,
+    manifest_entries: Optional[Dict[Path, ManifestEntry]] = None,
+) -> Iterator[Tuple[Path, Iterator[Tuple[pd.DataFrame, List[str], int]]]]:
+    """
+    Chains `prepare_file` and `deduplicate_chunks` for each file, lazily, in
+    the current thread. Each file's chunks are only produced while the
+    caller loads them.
+
+    Args:
+        file_jobs (Iterable[Tuple[Path, Optional[Future]]]): Each file, with
+            the future of its prepared chunks if a worker process prepares it.
+        config (Dict): The pipeline configuration.
+        phone_index (Optional[PhoneLookup]): Existing phone numbers, if available.
+        name_index (Optional[NameLookup]): Existing company names, if
+            fuzzy matching is enabled.
+        chunk_size (Optional[int]): The number of rows per chunk, or None to
+            read whole files.
+        manifest_entries (Optional[Dict[Path, ManifestEntry]]): The manifest
+            entries of the files, for resuming partially loaded files.
+
+    Yields:
+        Tuple[Path, Iterator]: Each file and its deduplicated chunks, ready
+        for `load_file`.
+    """
+    manifest_entries = manifest_entries or {}
+    for file_path, prepared in file_jobs:
+        prepared_chunks = _iter_prepared_chunks(
+            file_path, prepared, config, chunk_size, manifest_entries.get(file_path)
+        )
+        yield file_path, deduplicate_chunks(file_path, prepared_chunks, config, phone_index, name_index)
+
+def iter_pipelined_files(
+    file_jobs: Iterable[Tuple[Path, Optional[Future]]],
+    config: Dict,
+    phone_index: Optional[PhoneLookup],
+    name_index: Optional[NameLookup],
+    chunk_size: Optional[int] = None,
+    manifest_entries: Optional[Dict[Path, ManifestEntry]] = None,
+    queue_size: int = 2,
+) -> Iterator[Tuple[Path, Iterator[Tuple[pd.DataFrame, List[str], int]]]]:
+    """
+    Like `iter_deduplicated_files`, but runs preparation and deduplication
+    in background threads, connected to the caller's loading by bounded
+    queues. While one chunk is being loaded, the next ones are already
+    being parsed and deduplicated.
+
+    Deduplication of a file only starts once the caller has finished
+    loading the previous file, so every file is checked against all earlier
+    files, exactly as in a serial run. Within a file, chunks are
+    deduplicated ahead of loading.
+
+    Args:
+        file_jobs, config, phone_index, name_index, chunk_size,
+        manifest_entries: See `iter_deduplicated_files`.
+        queue_size (int): The maximum number of chunks buffered between two
+            stages.
+
+    Yields:
+        Tuple[Path, Iterator]: Each file and its deduplicated chunks. The
+        next file is yielded once the caller asks for it, which marks the
+        current file as loaded.
+    """
+    manifest_entries = manifest_entries or {}
+    files_loaded = Gate()
+    pipeline = Pipeline(file_jobs, queue_size=queue_size)
+
+    def prepare_stage(jobs):
+        for file_path, prepared in jobs:
+            try:
+                for chunk in _iter_prepared_chunks(
+                    file_path, prepared, config, chunk_size, manifest_entries.get(file_path)
+                ):
+                    yield file_path, chunk
+            except Exception as e:
+                yield file_path, e
+            yield file_path, END_OF_GROUP
+
+    def deduplicate_stage(items):
+        for files_started, (file_path, prepared_chunks) in enumerate(iter_groups(items)):
+            files_loaded.wait_for(files_started, pipeline)
+            try:
+                for chunk in deduplicate_chunks(file_path, prepared_chunks, config, phone_index, name_index):
+                    yield file_path, chunk
+            except Exception as e:
+                yield file_path, e
+            yield file_path, END_OF_GROUP
+
+    pipeline.add_stage("prepare", prepare_stage).add_stage("deduplicate", deduplicate_stage)
+    for file_path, deduplicated_chunks in iter_groups(pipeline.run("load")):
+        yield file_path, deduplicated_chunks
+        files_loaded.advance()
+
+def check_manifest(
+    files: List[Path], config: Dict, engine: Engine, dry_run: bool, ignore_completed: bool = False
+) -> Tuple[List[Path], Dict[Path, ManifestEntry]]:
+    """
+    Looks up source files in the ingestion manifest.
+
+    Files the manifest records as completed are skipped, and in a live run
+    moved to the processed directory, e.g. after a run that stopped between
+    loading a file and moving it. Files that were partially loaded are
+    returned with their committed row offset, so they can be resumed.
+
+    Args:
+        files (List[Path]): The source files, in processing order.
+        config (Dict): The pipeline configuration.
+        engine (Engine): The SQLAlchemy database engine.
+        dry_run (bool): If True, completed files are not moved.
+        ignore_completed (bool): If True, no file is skipped and every file
+            is loaded from its first row.
+
+    Returns:
+        Tuple[List[Path], Dict[Path, ManifestEntry]]: The files still to
+        process, and their manifest entries.
+    """
+    remaining = []
+    entries = {}
+    for file_path in files:
+        entry = check_file(engine, file_path)
+        if ignore_completed:
+            entry = ManifestEntry(entry.content_hash, None, 0)
+        elif entry.state == STATE_COMPLETED:
+            if dry_run:
+                logger.info(f"[DRY RUN] Would skip {file_path.name}: the manifest records it as already loaded.")
+            else:
+                logger.info(f"Skipping {file_path.name}: the manifest records it as already loaded.")
+                move_processed_file(file_path, config["processed_directory"])
+            continue
+        elif entry.rows_committed:
+            logger.info(f"Resuming {file_path.name} after {entry.rows_committed} rows loaded by an earlier run.")
+        remaining.append(file_path)
+        entries[file_path] = entry
+    return remaining, entries
+
+def _init_worker(log_file: str):
+    """Configures logging in a worker process that did not inherit it."""
+    setup_logging(log_file)
+
+def _prepare_file_in_worker(
+    file_path: Path, config: Dict, skip_rows: int = 0, content_hash: Optional[str] = None
+) -> Tuple[List[Tuple[pd.DataFrame, List[str], int]], List[StageRecord]]:
+    """
+    Runs `prepare_file` in a worker process and returns all of its output,
+    with the timings of its stages for the main process's recorder.
+    """
+    with recording(StageRecorder()) as recorder:
+        chunks = list(prepare_file(file_path, config, skip_rows=skip_rows, content_hash=content_hash))
+    return chunks, recorder.records()
+
+def iter_prepared_files(
+    files: List[Path], config: Dict, workers: int, manifest_entries: Optional[Dict[Path, ManifestEntry]] = None
+) -> Iterator[Tuple[Path, Future]]:
+    """
+    Prepares files in a pool of worker processes.
+
+    Futures are yielded in the order of `files`, regardless of which worker
+    finishes first, so the writer deduplicates and loads files in the same
+    order as a serial run. At most two files per worker are in flight, which
+    bounds the memory held by finished but not yet loaded files.
+
+    Args:
+        files (List[Path]): The source files, in processing order.
+        config (Dict): The pipeline configuration.
+        workers (int): The number of worker processes.
+        manifest_entries (Optional[Dict[Path, ManifestEntry]]): The manifest
+            entries of the files, for resuming partially loaded files and
+            reusing their content hashes.
+
+    Yields:
+        Tuple[Path, Future]: Each file and the future of its prepared chunks.
+    """
+    manifest_entries = manifest_entries or {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config["log_file"],)) as pool:
+        def submit(file_path: Path) -> Tuple[Path, Future]:
+            entry = manifest_entries.get(file_path) or ManifestEntry(None, None, 0)
+            return file_path, pool.submit(
+                _prepare_file_in_worker, file_path, config, entry.rows_committed, entry.content_hash
+            )
+
+        files_iter = iter(files)
+        pending = deque(submit(file_path) for file_path in islice(files_iter, workers * 2))
+        while pending:
+            file_path, future = pending.popleft()
+            next_file = next(files_iter, None)
+            if next_file is not None:
+                pending.append(submit(next_file))
+            yield file_path, future
 
 @click.command()
 @click.option('--dry-run', is_flag=True, help="Run the ETL process without loading data into the database.")
 @click.option('--quiet', is_flag=True, help="Suppress log output during a dry run for cleaner output.")
-def main(dry_run, quiet):
+@click.option('--rebuild-phone-index', is_flag=True, help="Rebuild the on-disk phone index from the contacts table before running.")
+@click.option('--chunk-size', type=click.IntRange(min=1), default=None, help="Stream each file through the pipeline in chunks of this many rows.")
+@click.option('--workers', type=click.IntRange(min=1), default=1, help="Number of processes that extract, transform and clean files in parallel.")
+@click.option('--ignore-manifest', is_flag=True, help="Load every file from the start, even if the ingestion manifest records it as loaded.")
+@click.option('--pipelined', is_flag=True, help="Parse and deduplicate the next chunks in background threads while the current chunk is loaded.")
+@click.option('--profile', is_flag=True, help="Profile the run with cProfile and write the stats to etl/logs/profiles (main thread only).")
+def main(dry_run, quiet, rebuild_phone_index, chunk_size, workers, ignore_manifest, pipelined, profile):
     """Main ETL pipeline orchestrator."""
+    if workers > 1 and chunk_size:
+        raise click.UsageError("--workers and --chunk-size cannot be combined; workers process whole files.")
     load_dotenv()
 
-    with open("config.yaml", "r") as f:
-        config = yaml.safe_load(f)
+    config = load_config()
 
     logger = setup_logging(config["log_file"])
 
@@ -47,6 +551,13 @@ def main(dry_run, quiet):
         logger.critical(f"Halting execution: {e}")
         return
 
+    if not dry_run:
+        try:
+            check_schema_version(engine)
+        except RuntimeError as e:
+            logger.critical(f"Halting execution: {e}")
+            return
+
     # --- Audit Log: Create a new run record (skip in dry run) ---
     run_id = None
     if not dry_run:
@@ -68,82 +579,101 @@ def main(dry_run, quiet):
     processed_files = []
     pipeline_status = "completed"
 
+    # Time each stage per file; the records are stored with the run.
+    recorder = StageRecorder()
+    previous_recorder = start_recording(recorder)
+    profiler = None
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
     try:
         # Load existing contacts for deduplication checks
-        existing_names = []
-        existing_phones = []
-        if not dry_run:
+        dedup_config = config.get("deduplication", {})
+        fuzzy_enabled = dedup_config.get("enable_fuzzy_matching", True)
+        name_index = None
+        if fuzzy_enabled and dedup_config.get("fuzzy_backend", "index") == "database":
             try:
-                existing_contacts = pd.read_sql("SELECT company_name, phone_number FROM contacts", engine)
-                existing_names = existing_contacts['company_name'].str.lower().tolist()
-                existing_phones = existing_contacts['phone_number'].tolist()
-                logger.info(f"Loaded {len(existing_contacts)} existing contacts for deduplication.")
+                if DatabaseNameIndex.is_available(engine):
+                    name_index = DatabaseNameIndex(engine, dry_run=dry_run)
+                    logger.info("Matching company names in the database with pg_trgm.")
+                else:
+                    logger.warning(
+                        "The 'database' fuzzy backend requires the pg_trgm extension (run setup_database.py). "
+                        "Falling back to the in-process company name index."
+                    )
             except Exception as e:
-                logger.warning(f"Could not load existing contacts. Deduplication may be affected. Error: {e}")
+                logger.warning(f"Could not check for the pg_trgm extension. Falling back to the in-process index. Error: {e}")
+        phone_index = None
+        phone_backend = dedup_config.get("phone_backend", "index")
+        if phone_backend == "database":
+            phone_index = DatabasePhoneFilter(engine)
+            logger.info("Checking phone numbers against the database with a server-side anti-join.")
+        else:
+            try:
+                # A dry run matches numbers like a live run, with the same
+                # index, but keeps its refresh in memory.
+                phone_index = PhoneIndex.from_config(dedup_config, read_only=dry_run)
+                with stage("phone_index_refresh"):
+                    if rebuild_phone_index or not phone_index.verify(engine):
+                        phone_index.rebuild(engine)
+                    else:
+                        phone_index.refresh(engine)
+            except Exception as e:
+                logger.warning(f"Could not refresh the phone index. Deduplication may be affected. Error: {e}")
+        if fuzzy_enabled and name_index is None:
+            name_index = CompanyNameIndex.from_config(dedup_config)
+            try:
+                with stage("load_existing_names") as measurement:
+                    existing_names = pd.read_sql("SELECT company_name FROM contacts", engine)
+                    name_index.add(existing_names['company_name'])
+                    measurement.rows_out = len(existing_names)
+                logger.info(f"Loaded {len(existing_names)} existing company names for deduplication.")
+            except Exception as e:
+                logger.warning(f"Could not load existing company names. Deduplication may be affected. Error: {e}")
 
         source_dir = config["source_directory"]
         files_to_process = find_files(source_dir)
+        try:
+            files_to_process, manifest_entries = check_manifest(
+                files_to_process, config, engine, dry_run, ignore_completed=ignore_manifest
+            )
+        except Exception as e:
+            logger.warning(f"Could not read the ingestion manifest. Files will be loaded without it. Error: {e}")
+            manifest_entries = {}
 
-        for file_path in files_to_process:
-            logger.info(f"--- Processing file: {file_path.name} ---")
-            
-            raw_df = extract_data(file_path)
-            if raw_df.empty:
-                continue
+        if workers > 1:
+            logger.info(f"Preparing files in {workers} worker processes.")
+            file_jobs = iter_prepared_files(files_to_process, config, workers, manifest_entries=manifest_entries)
+        else:
+            file_jobs = ((file_path, None) for file_path in files_to_process)
 
-            transformed_df, json_keys = apply_transformations(raw_df, file_path.name, config)
-            cleaned_df = clean_data(transformed_df.copy())
-
-            logger.info("Starting deduplication...")
-            pre_dedupe_rows = len(cleaned_df)
-            cleaned_df = cleaned_df[~cleaned_df['phone_number'].isin(existing_phones)]
-            rows_after_phone_check = len(cleaned_df)
-            logger.info(f"Removed {pre_dedupe_rows - rows_after_phone_check} rows with existing phone numbers.")
-
-            potential_duplicates_to_review = []
-            if config.get("deduplication", {}).get("enable_fuzzy_matching", True):
-                logger.info("Fuzzy matching for company names is enabled.")
-                rows_to_drop = []
-                for idx, row in cleaned_df.iterrows():
-                    company_name = str(row.get("company_name", "")).lower()
-                    if not company_name: continue
-                    matches = process.extract(company_name, existing_names, scorer=fuzz.token_sort_ratio, limit=1, score_cutoff=config["deduplication"]["company_name_threshold"])
-                    if matches:
-                        match_name, score, _ = matches[0]
-                        logger.warning(f"Potential duplicate for '{row['company_name']}'. Similarity: {score}%. Matched: '{match_name}'. Skipping.")
-                        potential_duplicates_to_review.append(row)
-                        rows_to_drop.append(idx)
-                if rows_to_drop:
-                    cleaned_df = cleaned_df.drop(rows_to_drop)
-            else:
-                logger.info("Fuzzy matching for company names is disabled.")
-            
-            if potential_duplicates_to_review:
-                review_dir = config["review_directory"]
-                os.makedirs(review_dir, exist_ok=True)
-                pd.DataFrame(potential_duplicates_to_review).to_csv(os.path.join(review_dir, f"review_{file_path.stem}.csv"), index=False)
+        if pipelined:
+            queue_size = config.get("pipeline", {}).get("queue_size", 2)
+            logger.info(f"Running pipelined stages with queues of {queue_size} chunks.")
+            file_chunks = iter_pipelined_files(
+                file_jobs, config, phone_index, name_index, chunk_size, manifest_entries, queue_size=queue_size
+            )
+        else:
+            file_chunks = iter_deduplicated_files(
+                file_jobs, config, phone_index, name_index, chunk_size, manifest_entries
+            )
 
-            logger.info(f"Deduplication complete. {len(cleaned_df)} rows remaining.")
+        for file_path, deduplicated_chunks in file_chunks:
+            logger.info(f"--- Processing file: {file_path.name} ---")
+            try:
+                contacts_added = load_file(
+                    file_path, deduplicated_chunks, config, engine, dry_run, phone_index, name_index,
+                    manifest_entry=manifest_entries.get(file_path), run_id=run_id,
+                )
+            except Exception as e:
+                logger.error(f"Failed to load data for {file_path.name}. Error: {e}")
+                pipeline_status = "failed"
+                continue
+            if contacts_added is None:
+                continue
 
-            if dry_run:
-                logger.info(f"[DRY RUN] Would load {len(cleaned_df)} new contacts from {file_path.name}.")
-                if not cleaned_df.empty:
-                    print(f"\n--- [DRY RUN] Sample of Processed Data for {file_path.name} ---")
-                    print(cleaned_df.head(1).to_string())
-                    print("--- End of Sample ---\n")
-            else:
-                try:
-                    load_to_db(cleaned_df, "contacts", engine, json_keys)
-                    move_processed_file(file_path, config["processed_directory"])
-                    if not cleaned_df.empty:
-                        existing_names.extend(cleaned_df['company_name'].str.lower().tolist())
-                        existing_phones.extend(cleaned_df['phone_number'].tolist())
-                except Exception as e:
-                    logger.error(f"Failed to load data for {file_path.name}. Error: {e}")
-                    pipeline_status = "failed"
-                    continue
-            
-            total_contacts_added += len(cleaned_df)
+            total_contacts_added += contacts_added
             processed_files.append(file_path.name)
 
     except Exception as e:
@@ -151,7 +681,25 @@ def main(dry_run, quiet):
         pipeline_status = "failed"
     
     finally:
+        stop_recording(previous_recorder)
+        if profiler is not None:
+            profiler.disable()
+            profile_dir = Path(config["log_file"]).parent / "profiles"
+            profile_dir.mkdir(parents=True, exist_ok=True)
+            run_label = f"run_{run_id}" if run_id else f"dry_run_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            profile_path = profile_dir / f"{run_label}.prof"
+            profiler.dump_stats(profile_path)
+            logger.info(
+                f"Wrote the cProfile stats of this run to {profile_path}. Inspect them with "
+                f"'python -m pstats {profile_path}' or snakeviz, or convert them to a flame graph with flameprof."
+            )
+        log_summary(recorder)
+        log_pool_stats(engine)
         if not dry_run and run_id:
+            try:
+                save_run_stages(engine, run_id, recorder)
+            except Exception as e:
+                logger.error(f"Failed to save the stage timings of ETL run {run_id}: {e}")
             with engine.connect() as connection:
                 try:
                     connection.execute(
@@ -0,0 +1,139 @@
+import hashlib
+import logging
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+STATE_LOADING = "loading"
+STATE_COMPLETED = "completed"
+
+
+class ManifestEntry(NamedTuple):
+    """The ingestion state of one source file, identified by its content hash."""
+    content_hash: Optional[str]
+    state: Optional[str]
+    rows_committed: int
+
+
+def compute_file_hash(file_path: Path, block_size: int = 1024 * 1024) -> str:
+    """
+    Computes the SHA-256 hash of a file's contents, reading it in blocks.
+
+    Args:
+        file_path (Path): The file to hash.
+        block_size (int): The number of bytes read at a time.
+
+    Returns:
+        str: The hex digest.
+    """
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def check_file(engine: Engine, file_path: Path) -> ManifestEntry:
+    """
+    Looks up the ingestion state of a source file.
+
+    A file with the same name, size and modification time as a completed
+    entry is treated as completed without reading it. Otherwise the file is
+    hashed and looked up by content, so renamed or copied files are
+    recognized as well.
+
+    Args:
+        engine (Engine): The SQLAlchemy database engine.
+        file_path (Path): The source file.
+
+    Returns:
+        ManifestEntry: The entry for the file. `state` is None for a new file.
+    """
+    stat = file_path.stat()
+    with engine.connect() as connection:
+        row = connection.execute(
+            text("""
+                SELECT content_hash, state, rows_committed FROM etl_file_manifest
+                WHERE file_name = :name AND file_size = :size AND file_mtime = :mtime AND state = :completed
+                LIMIT 1
+            """),
+            {"name": file_path.name, "size": stat.st_size, "mtime": stat.st_mtime, "completed": STATE_COMPLETED},
+        ).fetchone()
+        if row:
+            return ManifestEntry(*row)
+
+        content_hash = compute_file_hash(file_path)
+        row = connection.execute(
+            text("SELECT content_hash, state, rows_committed FROM etl_file_manifest WHERE content_hash = :hash"),
+            {"hash": content_hash},
+        ).fetchone()
+    if row:
+        return ManifestEntry(*row)
+    return ManifestEntry(content_hash, None, 0)
+
+
+def start_file(engine: Engine, entry: ManifestEntry, file_path: Path, run_id: Optional[int]):
+    """
+    Marks a file as being loaded, starting at `entry.rows_committed`. A file
+    interrupted by an earlier run keeps its offset, so loading resumes after
+    the rows that were already committed.
+
+    Args:
+        engine (Engine): The SQLAlchemy database engine.
+        entry (ManifestEntry): The entry returned by `check_file`.
+        file_path (Path): The source file.
+        run_id (Optional[int]): The ID of the current ETL run.
+    """
+    stat = file_path.stat()
+    with engine.begin() as connection:
+        connection.execute(
+            text("""
+                INSERT INTO etl_file_manifest (content_hash, file_name, file_size, file_mtime, state, run_id)
+                VALUES (:hash, :name, :size, :mtime, :state, :run_id)
+                ON CONFLICT (content_hash) DO UPDATE
+                SET file_name = EXCLUDED.file_name, file_size = EXCLUDED.file_size,
+                    file_mtime = EXCLUDED.file_mtime, state = EXCLUDED.state, run_id = EXCLUDED.run_id,
+                    rows_committed = :rows_committed,
+                    contacts_added = CASE WHEN :rows_committed = 0 THEN 0 ELSE etl_file_manifest.contacts_added END,
+                    updated_at = NOW()
+            """),
+            {
+                "hash": entry.content_hash, "name": file_path.name, "size": stat.st_size,
+                "mtime": stat.st_mtime, "state": STATE_LOADING, "run_id": run_id,
+                "rows_committed": entry.rows_committed,
+            },
+        )
+
+
+def record_progress(connection: Connection, content_hash: str, source_rows: int, contacts_added: int):
+    """
+    Advances a file's committed row offset. Call this inside the transaction
+    that loads the rows, so the offset and the loaded rows commit together.
+
+    Args:
+        connection (Connection): The connection of the load transaction.
+        content_hash (str): The file's content hash.
+        source_rows (int): The number of source rows covered by the load.
+        contacts_added (int): The number of contacts inserted by the load.
+    """
+    connection.execute(
+        text("""
+            UPDATE etl_file_manifest
+            SET rows_committed = rows_committed + :rows, contacts_added = contacts_added + :added, updated_at = NOW()
+            WHERE content_hash = :hash
+        """),
+        {"hash": content_hash, "rows": source_rows, "added": contacts_added},
+    )
+
+
+def complete_file(engine: Engine, content_hash: str):
+    """Marks a file as fully loaded."""
+    with engine.begin() as connection:
+        connection.execute(
+            text("UPDATE etl_file_manifest SET state = :state, updated_at = NOW() WHERE content_hash = :hash"),
+            {"hash": content_hash, "state": STATE_COMPLETED},
+        )
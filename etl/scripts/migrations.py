@@ -0,0 +1,486 @@
+import logging
+import os
+import re
+import sys
+from typing import Callable, Iterable, List, NamedTuple, Optional, Union
+
+import click
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+# Add project root to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from etl.scripts.contact_stats import (
+    CONTACT_STATS_V4_SQL,
+    CREATE_CONTACT_STATS_TRIGGERS_SQL,
+    RECOMPUTE_CONTACT_STATS_SQL,
+)
+from etl.scripts.contact_tags import (
+    BACKFILL_CONTACT_TAGS_SQL,
+    CREATE_CONTACT_EVENTS_TABLE_SQL,
+    CREATE_CONTACT_TAGS_TABLE_SQL,
+    CREATE_CONTACTS_VIEW_SQL,
+    DROP_CONTACTS_TAG_COLUMNS_SQL,
+)
+from etl.scripts.database import get_db_engine
+from etl.scripts.phone_index import CREATE_PHONE_CHANGE_LOG_SQL
+from etl.scripts.utils import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Serializes migration runs across processes (pg_advisory_lock key).
+MIGRATION_LOCK_ID = 722_401
+
+CREATE_SCHEMA_MIGRATIONS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMP DEFAULT NOW()
+);
+"""
+
+
+# A SQL statement, or a function that runs on the migration's connection,
+# for changes that need Python (e.g. to normalize stored values).
+MigrationStep = Union[str, Callable[[Connection], None]]
+
+
+class Migration(NamedTuple):
+    """
+    A numbered schema change.
+
+    Statements of a transactional migration run in one transaction together
+    with the version record. Statements that cannot run in a transaction,
+    such as CREATE INDEX CONCURRENTLY, run one by one in autocommit mode and
+    must be safe to repeat, because a failure can leave some of them applied.
+
+    A migration with a `requires` check that fails, e.g. because an optional
+    extension is not installed, is skipped and stays pending until a later
+    run finds its requirement met. Later migrations are still applied, but
+    the schema version does not advance past the skipped one.
+    """
+    version: int
+    name: str
+    statements: List[MigrationStep]
+    transactional: bool = True
+    requires: Optional[Callable[[Connection], bool]] = None
+
+
+_INDEX_NAME_RE = re.compile(r"CREATE INDEX CONCURRENTLY IF NOT EXISTS (\w+)")
+
+
+def _concurrent_index(name: str, definition: str) -> str:
+    return f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}"
+
+
+def _pg_trgm_installed(connection: Connection) -> bool:
+    return connection.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+
+
+# Contacts loaded while phone columns were read as numbers hold e.g.
+# "4955868020.0". The rule is fixed, not taken from config.yaml, so the
+# migration rewrites the same rows on every deployment.
+NORMALIZE_FLOAT_PHONE_NUMBERS_SQL = r"""
+UPDATE contacts c SET phone_number = regexp_replace(c.phone_number, '\.0$', '')
+WHERE c.id > :start AND c.id <= :end AND c.phone_number ~ '^[0-9]+\.0$'
+  AND NOT EXISTS (
+      SELECT 1 FROM contacts o WHERE o.phone_number = regexp_replace(c.phone_number, '\.0$', '')
+  )
+"""
+
+# The float-form numbers of a batch left unchanged because their new form
+# belongs to another contact.
+FLOAT_PHONE_NUMBER_COLLISIONS_SQL = r"""
+SELECT c.id, c.phone_number, o.id AS holder_id
+FROM contacts c JOIN contacts o ON o.phone_number = regexp_replace(c.phone_number, '\.0$', '')
+WHERE c.id > :start AND c.id <= :end AND c.phone_number ~ '^[0-9]+\.0$'
+"""
+
+NORMALIZE_PHONE_NUMBERS_BATCH_SIZE = 10_000
+
+
+def _normalize_stored_phone_numbers(connection: Connection):
+    """
+    Strips the ".0" from phone numbers stored in float form, so that
+    reloaded files and status updates match them. Runs in committed batches
+    of ids and only touches rows still in float form, so an interrupted run
+    is simply repeated.
+
+    A number whose new form is already stored for another contact is left
+    as it is and logged: that contact was loaded twice, and one of the two
+    rows has to be removed by hand.
+    """
+    max_id = connection.execute(text("SELECT COALESCE(MAX(id), 0) FROM contacts")).scalar_one()
+    rewritten = 0
+    for start in range(0, max_id, NORMALIZE_PHONE_NUMBERS_BATCH_SIZE):
+        params = {"start": start, "end": start + NORMALIZE_PHONE_NUMBERS_BATCH_SIZE}
+        rewritten += connection.execute(text(NORMALIZE_FLOAT_PHONE_NUMBERS_SQL), params).rowcount
+        for contact_id, phone_number, holder_id in connection.execute(text(FLOAT_PHONE_NUMBER_COLLISIONS_SQL), params):
+            logger.warning(
+                f"Not changing phone number '{phone_number}' of contact {contact_id}: "
+                f"its normalized form is the number of contact {holder_id}."
+            )
+    logger.info(f"Normalized {rewritten} stored phone numbers in float form.")
+
+
+# Rows loaded with DataFrame.to_sql hold their additional_info as a JSON
+# string scalar wrapping the object; `#>> '{}'` takes the text out of it.
+UNWRAP_ADDITIONAL_INFO_SQL = """
+UPDATE contacts SET additional_info = (additional_info #>> '{}')::jsonb
+WHERE id > :start AND id <= :end AND jsonb_typeof(additional_info) = 'string'
+"""
+
+UNWRAP_ADDITIONAL_INFO_BATCH_SIZE = 10_000
+
+
+def _unwrap_additional_info_strings(connection: Connection):
+    """
+    Rewrites additional_info values stored as JSON strings into the JSON
+    objects they contain, so that `@>` (and its GIN index) and `->>` find
+    them. Runs in committed batches of ids and skips rows already rewritten,
+    so an interrupted run is simply repeated.
+    """
+    max_id = connection.execute(text("SELECT COALESCE(MAX(id), 0) FROM contacts")).scalar_one()
+    rewritten = 0
+    for start in range(0, max_id, UNWRAP_ADDITIONAL_INFO_BATCH_SIZE):
+        result = connection.execute(
+            text(UNWRAP_ADDITIONAL_INFO_SQL), {"start": start, "end": start + UNWRAP_ADDITIONAL_INFO_BATCH_SIZE}
+        )
+        rewritten += result.rowcount
+    logger.info(f"Rewrote the additional_info of {rewritten} contacts from JSON strings into objects.")
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "contacts performance indexes",
+        [
+            # view-contacts sorts by created_at.
+            _concurrent_index("idx_contacts_created_at", "contacts (created_at)"),
+            # batch_update_from_csv.py filters on tags @> ARRAY[...].
+            _concurrent_index("idx_contacts_tags", "contacts USING GIN (tags)"),
+            _concurrent_index("idx_contacts_status", "contacts (status)"),
+            _concurrent_index("idx_contacts_profile_id", "contacts (profile_id)"),
+            # Containment queries on the raw row data (additional_info @> '{...}').
+            _concurrent_index("idx_contacts_additional_info", "contacts USING GIN (additional_info jsonb_path_ops)"),
+        ],
+        transactional=False,
+    ),
+    Migration(
+        2,
+        "contacts updated_at trigger and export watermarks",
+        [
+            # updated_at is set to the transaction's start time, so a row
+            # that is still uncommitted is never older than its transaction
+            # (export.py relies on this). No-op updates keep the old value.
+            """
+            CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+            BEGIN
+                NEW.updated_at = NOW();
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS trg_contacts_updated_at ON contacts",
+            """
+            CREATE TRIGGER trg_contacts_updated_at BEFORE UPDATE ON contacts
+            FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION set_updated_at()
+            """,
+            # The last delta exported to each consumer of `export-delta`.
+            """
+            CREATE TABLE IF NOT EXISTS export_watermarks (
+                consumer TEXT PRIMARY KEY,
+                watermark TIMESTAMP NOT NULL,
+                rows_exported BIGINT NOT NULL DEFAULT 0,
+                exported_at TIMESTAMP DEFAULT NOW()
+            )
+            """,
+        ],
+    ),
+    Migration(
+        3,
+        "contacts updated_at index",
+        # export-delta selects the contacts changed since a watermark.
+        [_concurrent_index("idx_contacts_updated_at", "contacts (updated_at)")],
+        transactional=False,
+    ),
+    Migration(
+        4,
+        "contact statistics",
+        [
+            # contact_count is now maintained per contact by the stats trigger.
+            "ALTER TABLE contact_profiles ALTER COLUMN contact_count SET DEFAULT 0",
+            *CONTACT_STATS_V4_SQL,
+        ],
+    ),
+    Migration(
+        5,
+        "etl run stage timings",
+        [
+            # Written by main.py at the end of each live run (instrumentation.py).
+            """
+            CREATE TABLE IF NOT EXISTS etl_run_stages (
+                id SERIAL PRIMARY KEY,
+                run_id INTEGER NOT NULL REFERENCES etl_runs (id) ON DELETE CASCADE,
+                file_name TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                calls INTEGER NOT NULL,
+                seconds DOUBLE PRECISION NOT NULL,
+                rows_in BIGINT,
+                rows_out BIGINT,
+                rows_per_second DOUBLE PRECISION,
+                peak_rss_mb DOUBLE PRECISION,
+                recorded_at TIMESTAMP DEFAULT NOW()
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_etl_run_stages_run_id ON etl_run_stages (run_id)",
+        ],
+    ),
+    Migration(
+        6,
+        "contact tags and events tables",
+        [
+            # Tagging and marking contacts as used rewrote whole contacts
+            # rows; both now insert into side tables. Other sessions wait
+            # until the tags are copied and the columns dropped.
+            "LOCK TABLE contacts IN ACCESS EXCLUSIVE MODE",
+            *CREATE_CONTACT_TAGS_TABLE_SQL,
+            *CREATE_CONTACT_EVENTS_TABLE_SQL,
+            *BACKFILL_CONTACT_TAGS_SQL,
+            # Tags are counted by triggers on contact_tags from now on.
+            *CREATE_CONTACT_STATS_TRIGGERS_SQL,
+            # Dropping a column does not rewrite the table; the GIN index
+            # on tags is dropped with it.
+            DROP_CONTACTS_TAG_COLUMNS_SQL,
+            CREATE_CONTACTS_VIEW_SQL,
+            *RECOMPUTE_CONTACT_STATS_SQL,
+        ],
+    ),
+    Migration(
+        7,
+        "normalize stored phone numbers",
+        [_normalize_stored_phone_numbers],
+        # Each batch commits on its own. The loader already stores the new
+        # form, so rows inserted meanwhile need no rewrite.
+        transactional=False,
+    ),
+    Migration(
+        8,
+        "company name trigram index",
+        # The "database" fuzzy matching backend joins on lower(company_name) % ...
+        # setup_database.py creates the pg_trgm extension if the server has it.
+        [_concurrent_index("idx_contacts_company_name_trgm", "contacts USING GIN (lower(company_name) gin_trgm_ops)")],
+        transactional=False,
+        requires=_pg_trgm_installed,
+    ),
+    Migration(
+        9,
+        "etl run stage memory growth",
+        [
+            # peak_rss_mb was the process-wide peak, which never decreases,
+            # so it said nothing about the stage it was stored with.
+            "ALTER TABLE etl_run_stages RENAME COLUMN peak_rss_mb TO process_peak_rss_mb",
+            "ALTER TABLE etl_run_stages ADD COLUMN IF NOT EXISTS rss_growth_mb DOUBLE PRECISION",
+        ],
+    ),
+    Migration(
+        10,
+        "contacts phone change log",
+        # Lets the ETL apply deleted contacts and changed numbers to the
+        # phone index, instead of comparing it with the whole table.
+        CREATE_PHONE_CHANGE_LOG_SQL,
+    ),
+    Migration(
+        11,
+        "additional_info as JSON objects",
+        [_unwrap_additional_info_strings],
+        # Each batch commits on its own, so the rewrite does not hold row
+        # locks on the whole table.
+        transactional=False,
+    ),
+    Migration(
+        12,
+        "delta export write times",
+        [
+            # Rows are stamped when they are written rather than when their
+            # transaction started, so export-delta only has to wait for
+            # transactions that are writing these tables when it runs. A
+            # stamp is still never older than its transaction.
+            """
+            CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+            BEGIN
+                NEW.updated_at = clock_timestamp();
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            "ALTER TABLE contacts ALTER COLUMN updated_at SET DEFAULT clock_timestamp()",
+            "ALTER TABLE contact_tags ALTER COLUMN tagged_at SET DEFAULT clock_timestamp()",
+            # Marking a contact as used only adds an event; occurred_at is
+            # the time given by the writer, so export-delta needs its own
+            # stamp. Events recorded before the migration keep NULL.
+            "ALTER TABLE contact_events ADD COLUMN IF NOT EXISTS recorded_at TIMESTAMP",
+            "ALTER TABLE contact_events ALTER COLUMN recorded_at SET DEFAULT clock_timestamp()",
+            _concurrent_index("idx_contact_events_recorded_at", "contact_events (recorded_at)"),
+        ],
+        transactional=False,
+    ),
+]
+
+
+def _execute(connection: Connection, statement: MigrationStep):
+    if callable(statement):
+        statement(connection)
+    else:
+        connection.execute(text(statement))
+
+
+def _drop_invalid_indexes(connection: Connection, migration: Migration):
+    """
+    Drops indexes left invalid by an interrupted CREATE INDEX CONCURRENTLY,
+    which IF NOT EXISTS would otherwise treat as already created.
+    """
+    names = [
+        match.group(1)
+        for statement in migration.statements if isinstance(statement, str)
+        for match in _INDEX_NAME_RE.finditer(statement)
+    ]
+    invalid = connection.execute(text("""
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE NOT i.indisvalid AND c.relname = ANY(:names)
+    """), {"names": names}).scalars().all()
+    for index_name in invalid:
+        logger.warning(f"Dropping invalid index '{index_name}' left by an interrupted migration.")
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+
+
+def applied_versions(engine: Engine) -> List[int]:
+    """Returns the versions of the migrations applied to the database."""
+    with engine.begin() as connection:
+        connection.execute(text(CREATE_SCHEMA_MIGRATIONS_TABLE_SQL))
+        return connection.execute(text("SELECT version FROM schema_migrations ORDER BY version")).scalars().all()
+
+
+def _schema_version(applied: Iterable[int]) -> int:
+    applied = set(applied)
+    version = 0
+    for migration in sorted(MIGRATIONS):
+        if migration.version not in applied:
+            break
+        version = migration.version
+    return version
+
+
+def _pending_gaps(applied: Iterable[int]) -> List[int]:
+    applied = set(applied)
+    latest = max(applied, default=0)
+    return [migration.version for migration in sorted(MIGRATIONS)
+            if migration.version < latest and migration.version not in applied]
+
+
+def current_version(engine: Engine) -> int:
+    """
+    Returns the schema version of the database: the highest migration that
+    is applied together with every migration before it, or 0. Migrations
+    applied past a skipped one do not count; see `pending_gaps`.
+    """
+    return _schema_version(applied_versions(engine))
+
+
+def pending_gaps(engine: Engine) -> List[int]:
+    """Returns the pending migrations that later, already applied migrations skipped over."""
+    return _pending_gaps(applied_versions(engine))
+
+
+def _describe_version(applied: Iterable[int]) -> str:
+    applied = set(applied)
+    version = _schema_version(applied)
+    gaps = _pending_gaps(applied)
+    if not gaps:
+        return f"version {version}"
+    ahead = sorted(v for v in applied if v > version)
+    return (
+        f"version {version} (pending: {', '.join(map(str, gaps))}; "
+        f"applied past them: {', '.join(map(str, ahead))})"
+    )
+
+
+def run_migrations(engine: Engine, target: Optional[int] = None) -> List[int]:
+    """
+    Applies the pending migrations in order, up to and including `target`.
+
+    Concurrent runs are serialized with an advisory lock; a run that waited
+    for the lock skips the migrations the other run applied.
+
+    Args:
+        engine (Engine): The SQLAlchemy database engine.
+        target (Optional[int]): The version to migrate to. Defaults to the latest.
+
+    Returns:
+        List[int]: The versions applied by this run.
+    """
+    applied = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            connection.execute(text(CREATE_SCHEMA_MIGRATIONS_TABLE_SQL))
+            done = set(connection.execute(text("SELECT version FROM schema_migrations")).scalars().all())
+            for migration in sorted(MIGRATIONS):
+                if migration.version in done or (target is not None and migration.version > target):
+                    continue
+                if migration.requires is not None and not migration.requires(connection):
+                    logger.warning(
+                        f"Skipping migration {migration.version}: {migration.name}. Its requirements are not met; "
+                        f"it stays pending until a later run."
+                    )
+                    continue
+                logger.info(f"Applying migration {migration.version}: {migration.name}...")
+                record = text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)")
+                params = {"version": migration.version, "name": migration.name}
+                if migration.transactional:
+                    with engine.begin() as transaction:
+                        for statement in migration.statements:
+                            _execute(transaction, statement)
+                        transaction.execute(record, params)
+                else:
+                    _drop_invalid_indexes(connection, migration)
+                    for statement in migration.statements:
+                        _execute(connection, statement)
+                    connection.execute(record, params)
+                applied.append(migration.version)
+                logger.info(f"Migration {migration.version} applied.")
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+    versions = applied_versions(engine)
+    if _pending_gaps(versions):
+        logger.warning(f"Database schema is at {_describe_version(versions)}.")
+    else:
+        logger.info(f"Database schema is at {_describe_version(versions)}.")
+    return applied
+
+
+@click.command()
+@click.option('--status', is_flag=True, help="Show the applied and pending migrations without applying them.")
+@click.option('--target', type=int, default=None, help="Migrate up to this version instead of the latest.")
+def migrate(status, target):
+    """Applies pending schema migrations."""
+    setup_logging("etl/logs/setup.log")
+    load_dotenv()
+    engine = get_db_engine()
+    if status:
+        applied = set(applied_versions(engine))
+        for migration in sorted(MIGRATIONS):
+            state = "applied" if migration.version in applied else "pending"
+            print(f"{migration.version:>4}  {state:<8} {migration.name}")
+        print(f"Schema {_describe_version(applied)}.")
+        return
+    run_migrations(engine, target=target)
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,107 @@
+import logging
+import threading
+from typing import Iterable, Set, Union
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.engine import Engine
+
+from etl.scripts.load import copy_dataframe
+from etl.scripts.phone_index import PhoneIndex
+
+logger = logging.getLogger(__name__)
+
+CANDIDATE_TABLE = "phone_candidates"
+
+
+class DatabasePhoneFilter:
+    """
+    Checks phone numbers against the contacts table on the server, instead
+    of against a copy of all existing numbers held by the ETL.
+
+    For each check, the distinct candidate numbers are copied into a
+    temporary table and anti-joined against `contacts`, which uses the
+    index behind the `unique_phone_number` constraint. Only the numbers
+    that are not in the table yet come back, so memory use and transfer
+    grow with the input, not with the contacts table.
+
+    The check never changes the database: the temporary table lives in a
+    transaction that is rolled back, and the anti-join itself runs
+    read-only. The filter can therefore be used in dry runs, where numbers
+    that would be loaded by earlier files are remembered with `add`.
+
+    It has the same `contains` and `refresh` methods as `PhoneIndex`.
+    Numbers are matched exactly as stored, like the ON CONFLICT check of
+    the load, whereas the phone index also ignores formatting.
+    Requires PostgreSQL with psycopg2.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def refresh(self, engine: Engine) -> int:
+        """Does nothing: every check already sees the current table."""
+        return 0
+
+    def add(self, phones: Iterable):
+        """
+        Remembers numbers that are not in the table but should count as
+        existing, e.g. numbers a dry run would have loaded from an earlier file.
+        """
+        with self._lock:
+            self._pending.update(str(phone) for phone in phones if pd.notna(phone))
+
+    def _new_numbers(self, candidates: pd.Series) -> Set[str]:
+        """Returns the candidates that are not in the contacts table."""
+        with self.engine.connect() as connection:
+            dbapi_connection = connection.connection
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute(f"CREATE TEMP TABLE {CANDIDATE_TABLE} (phone_number TEXT) ON COMMIT DROP")
+                copy_dataframe(cursor, candidates.to_frame("phone_number"), CANDIDATE_TABLE)
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.execute(
+                    f"SELECT t.phone_number FROM {CANDIDATE_TABLE} t "
+                    f"WHERE NOT EXISTS (SELECT 1 FROM contacts c WHERE c.phone_number = t.phone_number)"
+                )
+                survivors = {row[0] for row in cursor.fetchall()}
+            finally:
+                cursor.close()
+                dbapi_connection.rollback()
+        return survivors
+
+    def contains(self, phones: Iterable) -> np.ndarray:
+        """
+        Checks which of the given phone numbers already exist.
+
+        Args:
+            phones (Iterable): Phone numbers, e.g. a DataFrame column.
+
+        Returns:
+            np.ndarray: A boolean array, True where the number exists.
+        """
+        phones = pd.Series(phones, dtype=object)
+        present = phones.notna()
+        if not present.any():
+            return np.zeros(len(phones), dtype=bool)
+
+        as_text = phones[present].astype(str)
+        candidates = pd.Series(as_text.unique())
+        survivors = self._new_numbers(candidates)
+        with self._lock:
+            if self._pending:
+                survivors -= self._pending
+
+        found = np.zeros(len(phones), dtype=bool)
+        found[present.to_numpy()] = ~as_text.isin(survivors).to_numpy()
+        logger.info(
+            f"Checked {len(candidates)} distinct phone numbers against the database: "
+            f"{len(candidates) - len(survivors)} already exist."
+        )
+        return found
+
+
+# The phone lookups `main.deduplicate` accepts.
+PhoneLookup = Union[PhoneIndex, DatabasePhoneFilter]
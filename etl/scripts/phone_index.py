@@ -0,0 +1,560 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# A key is a leading flag digit (1 = no '+', 2 = international '+' prefix)
+# followed by the phone's digits. The flag keeps leading zeros significant,
+# and 17 digits keeps every key below the int64 limit.
+MAX_KEY_DIGITS = 17
+INVALID_KEY = -1
+
+# The highest contacts.id handed out so far. Ids up to it are allocated,
+# but may belong to transactions that have not committed yet.
+ALLOCATED_ID_SQL = "SELECT pg_sequence_last_value(pg_get_serial_sequence('contacts', 'id')::regclass)"
+
+# Of the other transactions that allocated contacts ids, i.e. inserted
+# contacts: how many hide their start time from this role (pg_stat_activity
+# only shows xact_start of other roles' sessions to members of
+# pg_read_all_stats), the start of the oldest one that does not (NULL if
+# there is none), and the current time. nextval() holds a RowExclusiveLock
+# on the sequence until the transaction ends; status updates and other
+# writers that insert no contacts do not take it.
+OPEN_WRITERS_SQL = """
+SELECT COUNT(*) FILTER (WHERE a.xact_start IS NULL), MIN(a.xact_start), clock_timestamp()::timestamptz
+FROM pg_locks l JOIN pg_stat_activity a ON a.pid = l.pid
+WHERE l.locktype = 'relation' AND l.relation = pg_get_serial_sequence('contacts', 'id')::regclass
+  AND l.mode = 'RowExclusiveLock' AND l.pid <> pg_backend_pid()
+"""
+
+# Deleting contacts, changing their phone number or id, or truncating the
+# table adds rows to this log (migration 10). The index takes the rows it
+# has applied out of the log, so checking it at startup only costs as much
+# as the changes made since the last run.
+PHONE_CHANGE_LOG_TABLE = "contact_phone_changes"
+
+PHONE_CHANGE_LOG_EXISTS_SQL = f"SELECT to_regclass('{PHONE_CHANGE_LOG_TABLE}') IS NOT NULL"
+
+# Only committed rows are returned, so changes of transactions still open
+# stay in the log for the next run.
+CONSUME_PHONE_CHANGES_SQL = f"DELETE FROM {PHONE_CHANGE_LOG_TABLE} RETURNING operation, contact_id, phone_number"
+
+READ_PHONE_CHANGES_SQL = f"SELECT operation, contact_id, phone_number FROM {PHONE_CHANGE_LOG_TABLE}"
+
+CREATE_PHONE_CHANGE_LOG_SQL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {PHONE_CHANGE_LOG_TABLE} (
+        id BIGSERIAL PRIMARY KEY,
+        operation TEXT NOT NULL,
+        contact_id INTEGER,
+        phone_number TEXT,
+        changed_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION contacts_phone_changes_log() RETURNS trigger AS $$
+    BEGIN
+        -- The number that may no longer be stored, and for updates the id
+        -- the row has now.
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO {PHONE_CHANGE_LOG_TABLE} (operation, contact_id, phone_number)
+            SELECT 'DELETE', id, phone_number FROM old_rows;
+        ELSIF TG_OP = 'UPDATE' THEN
+            INSERT INTO {PHONE_CHANGE_LOG_TABLE} (operation, contact_id, phone_number)
+            VALUES ('UPDATE', NEW.id, OLD.phone_number);
+        ELSE
+            INSERT INTO {PHONE_CHANGE_LOG_TABLE} (operation) VALUES ('TRUNCATE');
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS trg_contacts_phone_changes_update ON contacts",
+    "DROP TRIGGER IF EXISTS trg_contacts_phone_changes_delete ON contacts",
+    "DROP TRIGGER IF EXISTS trg_contacts_phone_changes_truncate ON contacts",
+    # Fires only for the rare rows whose number or id changes, not for
+    # status updates.
+    """
+    CREATE TRIGGER trg_contacts_phone_changes_update AFTER UPDATE OF phone_number, id ON contacts
+    FOR EACH ROW WHEN (OLD.phone_number IS DISTINCT FROM NEW.phone_number OR OLD.id <> NEW.id)
+    EXECUTE FUNCTION contacts_phone_changes_log()
+    """,
+    """
+    CREATE TRIGGER trg_contacts_phone_changes_delete AFTER DELETE ON contacts
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION contacts_phone_changes_log()
+    """,
+    """
+    CREATE TRIGGER trg_contacts_phone_changes_truncate AFTER TRUNCATE ON contacts
+    FOR EACH STATEMENT EXECUTE FUNCTION contacts_phone_changes_log()
+    """,
+]
+
+
+def phone_keys(phones) -> np.ndarray:
+    """
+    Converts phone numbers to int64 keys for the phone index.
+
+    Only digits and a leading '+' are significant, so "+41 56 204" and
+    "'+4156204" map to the same key. Missing values, values without digits
+    and values with more than MAX_KEY_DIGITS digits map to INVALID_KEY.
+
+    Args:
+        phones: A sequence or Series of phone numbers.
+
+    Returns:
+        np.ndarray: An int64 array of keys, aligned with the input.
+    """
+    series = pd.Series(phones, dtype=object)
+    keys = np.full(len(series), INVALID_KEY, dtype=np.int64)
+    present = series.notna().to_numpy()
+    if not present.any():
+        return keys
+
+    values = series[present].astype(str)
+    digits = values.str.replace(r"\D", "", regex=True)
+    lengths = digits.str.len().to_numpy()
+    valid = (lengths > 0) & (lengths <= MAX_KEY_DIGITS)
+    if not valid.any():
+        return keys
+
+    flags = np.where(values.str.match(r"^[^\d]*\+").to_numpy()[valid], 2, 1).astype(np.int64)
+    numbers = digits[valid].astype(np.int64).to_numpy()
+    positions = np.flatnonzero(present)[valid]
+    keys[positions] = flags * np.power(10, lengths[valid], dtype=np.int64) + numbers
+    return keys
+
+
+# Of the given numbers, the ones still stored for some contact.
+STORED_PHONES_SQL = "SELECT phone_number FROM contacts WHERE phone_number = ANY(:phones)"
+
+# The current numbers of updated contacts whose old number was already
+# added to the index; contacts above `logged_id` are read by the next refresh.
+CURRENT_PHONES_SQL = "SELECT phone_number FROM contacts WHERE id = ANY(:ids) AND id <= :logged_id"
+
+
+class PhoneIndex:
+    """
+    A persistent, incrementally refreshed index of the phone numbers in the
+    contacts table, used for exact deduplication.
+
+    The index directory holds:
+      - base.npy: a sorted int64 array of phone keys, opened memory-mapped.
+      - delta.bin: an append-only log of keys added since the last compaction.
+      - removed.bin: keys of numbers no longer stored, dropped from the base
+        array by the next compaction.
+      - overflow.txt: phone numbers that cannot be encoded as a key.
+      - meta.json: the contacts.id up to which all rows are indexed (the
+        watermark), the highest contacts.id whose number was added to the
+        delta log, and whether the index follows the phone change log.
+
+    A refresh only reads rows with an id above the watermark, so the cost of
+    opening the index does not grow with the size of the contacts table.
+    Ids are handed out when a row is inserted, but become visible when its
+    transaction commits, so a concurrent load can commit rows below ids
+    that were already read. The watermark is therefore only advanced to an
+    id below which no transaction that inserted contacts can still commit
+    rows; rows above it are read again by the next refresh. Of the rows
+    read again, only numbers that are not in the index yet are added to the
+    delta log, so it does not grow while the watermark is held. A writer
+    whose start time is hidden from this role counts as open since before
+    any checkpoint.
+
+    Rows that are deleted or whose phone number changes are not seen by a
+    refresh. Triggers record such changes in the phone change log
+    (migration 10), which `verify` applies to the index and empties, so
+    checking the index costs as much as the changes since the last run.
+
+    Lookups and updates are serialized with a lock, so one thread can check
+    numbers while another refreshes the index.
+
+    A read-only index (used by dry runs) is loaded from disk and refreshed
+    like any other, but keeps all changes in memory, never writes to its
+    directory and leaves the phone change log as it is.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        compact_threshold: int = 100_000,
+        refresh_batch_size: int = 100_000,
+        read_only: bool = False,
+    ):
+        self.directory = Path(directory)
+        self.read_only = read_only
+        self.compact_threshold = compact_threshold
+        self.refresh_batch_size = refresh_batch_size
+        self.watermark = 0
+        # The highest id whose number was added to the delta log. Rows
+        # between the watermark and it are read again by a refresh.
+        self.logged_id = 0
+        # Whether deletes and number changes since the index was built
+        # were applied from the phone change log.
+        self.follows_change_log = False
+        # The last allocated id and the time it was read, used by the next
+        # refresh to advance the watermark while other loads are running.
+        self._checkpoint: Optional[Dict] = None
+        self._base = np.empty(0, dtype=np.int64)
+        self._delta = np.empty(0, dtype=np.int64)
+        self._removed = np.empty(0, dtype=np.int64)
+        self._overflow = set()
+        self._lock = threading.RLock()
+        self._open()
+
+    @classmethod
+    def from_config(cls, dedup_config: Dict, read_only: bool = False) -> "PhoneIndex":
+        """
+        Opens the index configured in the 'deduplication' section of config.yaml.
+        """
+        index_config = dedup_config.get("phone_index", {}) or {}
+        return cls(
+            index_config.get("directory", "etl/cache/phone_index"),
+            compact_threshold=index_config.get("compact_threshold", 100_000),
+            refresh_batch_size=index_config.get("refresh_batch_size", 100_000),
+            read_only=read_only,
+        )
+
+    @property
+    def _base_path(self) -> Path:
+        return self.directory / "base.npy"
+
+    @property
+    def _delta_path(self) -> Path:
+        return self.directory / "delta.bin"
+
+    @property
+    def _removed_path(self) -> Path:
+        return self.directory / "removed.bin"
+
+    @property
+    def _overflow_path(self) -> Path:
+        return self.directory / "overflow.txt"
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    def __len__(self) -> int:
+        return len(self._base) + len(self._delta) + len(self._overflow) - len(self._removed)
+
+    def _open(self):
+        """Loads the on-disk state of the index, if any."""
+        if not self.read_only:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        if self._meta_path.exists():
+            with open(self._meta_path, "r") as f:
+                meta = json.load(f)
+            self.watermark = meta.get("watermark", 0)
+            self.logged_id = meta.get("logged_id", self.watermark)
+            # Indexes written before the change log existed are rebuilt once.
+            self.follows_change_log = meta.get("follows_change_log", False)
+            self._checkpoint = meta.get("checkpoint")
+        if self._base_path.exists():
+            self._base = np.load(self._base_path, mmap_mode="r")
+        if self._delta_path.exists():
+            self._delta = np.unique(np.fromfile(self._delta_path, dtype=np.int64))
+        if self._removed_path.exists():
+            self._removed = np.unique(np.fromfile(self._removed_path, dtype=np.int64))
+        if self._overflow_path.exists():
+            with open(self._overflow_path, "r", encoding="utf-8") as f:
+                self._overflow = {line.rstrip("\n") for line in f if line.strip()}
+        logger.info(
+            f"Opened phone index at {self.directory} with {len(self)} numbers "
+            f"(watermark: contacts.id {self.watermark})."
+        )
+
+    def _write_meta(self):
+        if self.read_only:
+            return
+        tmp_path = self._meta_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "watermark": self.watermark,
+                    "logged_id": self.logged_id,
+                    "follows_change_log": self.follows_change_log,
+                    "checkpoint": self._checkpoint,
+                },
+                f,
+            )
+        os.replace(tmp_path, self._meta_path)
+
+    def _write_removed(self):
+        if self.read_only:
+            return
+        tmp_path = self._removed_path.with_suffix(".tmp")
+        self._removed.tofile(tmp_path)
+        os.replace(tmp_path, self._removed_path)
+
+    def _write_overflow(self):
+        if self.read_only:
+            return
+        tmp_path = self._overflow_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(f"{phone}\n" for phone in sorted(self._overflow))
+        os.replace(tmp_path, self._overflow_path)
+
+    def _append(self, phones: pd.Series, skip_known: bool = False):
+        """
+        Appends phone numbers to the delta log and the overflow file. With
+        `skip_known`, numbers already in the index are left out.
+        """
+        keys = phone_keys(phones)
+        valid = keys != INVALID_KEY
+        overflow = {str(phone) for phone in phones[~valid] if pd.notna(phone)}
+        with self._lock:
+            if skip_known:
+                valid &= ~self.contains(phones)
+            new_keys = np.unique(keys[valid])
+            if len(new_keys) and not self.read_only:
+                with open(self._delta_path, "ab") as f:
+                    new_keys.tofile(f)
+            self._delta = np.union1d(self._delta, new_keys)
+
+            # A number stored again after it was removed counts again.
+            restored = np.isin(self._removed, new_keys)
+            if restored.any():
+                self._removed = self._removed[~restored]
+                self._write_removed()
+
+            new_overflow = overflow - self._overflow
+            if new_overflow and not self.read_only:
+                with open(self._overflow_path, "a", encoding="utf-8") as f:
+                    f.writelines(f"{phone}\n" for phone in sorted(new_overflow))
+            self._overflow |= new_overflow
+
+    def _remove(self, phones: pd.Series):
+        """Removes phone numbers that are no longer stored from the index."""
+        keys = phone_keys(phones)
+        valid = keys != INVALID_KEY
+        with self._lock:
+            indexed = valid & self.contains(phones)
+            if indexed.any():
+                self._removed = np.union1d(self._removed, keys[indexed])
+                self._write_removed()
+            gone = {str(phone) for phone in phones[~valid] if pd.notna(phone)} & self._overflow
+            if gone:
+                self._overflow -= gone
+                self._write_overflow()
+
+    def _settled_id(self, connection) -> int:
+        """
+        Returns the highest id below which no open transaction can still
+        commit contacts, and records a checkpoint for the next refresh.
+
+        The last allocated id is read before looking for open writers: a
+        writer that holds an id up to it started earlier, so it is either
+        seen as open or has finished. While writers are open, the last
+        checkpoint is settled if all of them started after it was taken. A
+        writer whose start time is hidden may have started before it, so
+        nothing is settled while one is open.
+        """
+        allocated = connection.execute(text(ALLOCATED_ID_SQL)).scalar() or 0
+        hidden_writers, oldest_writer, now = connection.execute(text(OPEN_WRITERS_SQL)).one()
+        settled = self.watermark
+        if hidden_writers:
+            logger.warning(
+                f"{hidden_writers} transaction(s) of other roles inserting contacts hide their start time; "
+                f"the phone index watermark stays at contacts.id {self.watermark}. "
+                "Grant this role pg_read_all_stats to let it advance while they run."
+            )
+        elif oldest_writer is None:
+            settled = allocated
+        elif self._checkpoint and oldest_writer > datetime.fromisoformat(self._checkpoint["at"]):
+            settled = self._checkpoint["allocated"]
+        self._checkpoint = {"allocated": int(allocated), "at": now.isoformat()}
+        return max(self.watermark, int(settled))
+
+    def refresh(self, engine: Engine) -> int:
+        """
+        Adds all contacts committed since the last refresh to the index.
+
+        Args:
+            engine (Engine): The SQLAlchemy database engine.
+
+        Returns:
+            int: The number of contact rows read.
+        """
+        rows_read = 0
+        query = text("SELECT id, phone_number FROM contacts WHERE id > :after ORDER BY id LIMIT :limit")
+        with engine.connect() as connection:
+            settled = self._settled_id(connection)
+            after = self.watermark
+            while True:
+                batch = pd.read_sql(query, connection, params={"after": after, "limit": self.refresh_batch_size})
+                if batch.empty:
+                    break
+                # Rows up to logged_id were read before; only the numbers
+                # that committed since, below ids already read, are new.
+                logged = (batch["id"] <= self.logged_id).to_numpy()
+                self._append(batch["phone_number"][~logged])
+                if logged.any():
+                    self._append(batch["phone_number"][logged], skip_known=True)
+                after = int(batch["id"].iloc[-1])
+                self.logged_id = max(self.logged_id, after)
+                self.watermark = min(after, settled)
+                self._write_meta()
+                rows_read += len(batch)
+            self.watermark = settled
+            self._write_meta()
+
+        if rows_read:
+            logger.info(f"Read {rows_read} contacts into the phone index (watermark: contacts.id {self.watermark}).")
+        if len(self._delta) >= self.compact_threshold:
+            self.compact()
+        return rows_read
+
+    def compact(self):
+        """Merges the delta log into the sorted base array and drops the removed numbers."""
+        with self._lock:
+            merged = np.union1d(np.asarray(self._base), self._delta)
+            if len(self._removed):
+                merged = np.setdiff1d(merged, self._removed, assume_unique=True)
+            if self.read_only:
+                self._base = merged
+                self._delta = np.empty(0, dtype=np.int64)
+                self._removed = np.empty(0, dtype=np.int64)
+                return
+            tmp_path = self.directory / "base.tmp.npy"
+            np.save(tmp_path, merged)
+            # Release the memory map before replacing the file it points to.
+            self._base = np.empty(0, dtype=np.int64)
+            os.replace(tmp_path, self._base_path)
+            open(self._delta_path, "wb").close()
+            self._removed_path.unlink(missing_ok=True)
+            self._base = np.load(self._base_path, mmap_mode="r")
+            self._delta = np.empty(0, dtype=np.int64)
+            self._removed = np.empty(0, dtype=np.int64)
+        logger.info(f"Compacted phone index to {len(self._base)} numbers.")
+
+    def add(self, phones: Iterable):
+        """
+        Adds numbers that are not in the table but should count as existing,
+        e.g. numbers a dry run would have loaded from an earlier file. Meant
+        for read-only indexes; a refresh adds the numbers of loaded contacts.
+        """
+        self._append(pd.Series(phones, dtype=object))
+
+    def contains(self, phones: Iterable) -> np.ndarray:
+        """
+        Checks which of the given phone numbers are already in the index.
+
+        Args:
+            phones (Iterable): Phone numbers, e.g. a DataFrame column.
+
+        Returns:
+            np.ndarray: A boolean array, True where the number is known.
+        """
+        phones = pd.Series(phones, dtype=object)
+        keys = phone_keys(phones)
+        found = np.zeros(len(keys), dtype=bool)
+
+        with self._lock:
+            if len(self._base):
+                positions = np.searchsorted(self._base, keys)
+                in_range = positions < len(self._base)
+                found[in_range] = self._base[positions[in_range]] == keys[in_range]
+            if len(self._delta):
+                found |= np.isin(keys, self._delta)
+            if len(self._removed):
+                found &= ~np.isin(keys, self._removed)
+            if self._overflow:
+                unencodable = keys == INVALID_KEY
+                found[unencodable] = phones[unencodable].isin(self._overflow).to_numpy()
+
+        return found
+
+    def verify(self, engine: Engine) -> bool:
+        """
+        Applies the deletes and phone number changes recorded in the phone
+        change log since the last run, and takes them out of the log.
+
+        Only the logged changes are read, so the check does not grow with
+        the size of the contacts table. An index that was built before the
+        log existed, or a truncated table, needs a rebuild. Before
+        migration 10 there is no log, and changes are not detected.
+
+        Args:
+            engine (Engine): The SQLAlchemy database engine.
+
+        Returns:
+            bool: True if the index matches the table, False if it has to
+            be rebuilt.
+        """
+        with engine.begin() as connection:
+            if not connection.execute(text(PHONE_CHANGE_LOG_EXISTS_SQL)).scalar():
+                logger.warning(
+                    f"The {PHONE_CHANGE_LOG_TABLE} table does not exist, so deleted contacts and changed phone "
+                    "numbers are not removed from the phone index. Run the migrations to create it."
+                )
+                return True
+            if not self.follows_change_log:
+                logger.info("The phone index does not follow the phone change log yet and is rebuilt.")
+                return False
+            sql = READ_PHONE_CHANGES_SQL if self.read_only else CONSUME_PHONE_CHANGES_SQL
+            changes = connection.execute(text(sql)).all()
+            if not changes:
+                return True
+            if any(operation == "TRUNCATE" for operation, _, _ in changes):
+                logger.warning("The contacts table was truncated; the phone index is rebuilt.")
+                return False
+
+            # The log is only emptied when the transaction commits, after
+            # the index files are written.
+            old_phones = list({phone for _, _, phone in changes if phone is not None})
+            stored = set(connection.execute(text(STORED_PHONES_SQL), {"phones": old_phones}).scalars())
+            self._remove(pd.Series([phone for phone in old_phones if phone not in stored], dtype=object))
+            updated = [contact_id for operation, contact_id, _ in changes if operation == "UPDATE"]
+            if updated:
+                current = connection.execute(
+                    text(CURRENT_PHONES_SQL), {"ids": updated, "logged_id": self.logged_id}
+                ).scalars().all()
+                self._append(pd.Series(current, dtype=object), skip_known=True)
+        logger.info(f"Applied {len(changes)} deleted or changed contacts to the phone index.")
+        return True
+
+    def rebuild(self, engine: Engine) -> int:
+        """
+        Discards the on-disk index and rebuilds it from the contacts table.
+
+        Args:
+            engine (Engine): The SQLAlchemy database engine.
+
+        Returns:
+            int: The number of contact rows read.
+        """
+        self.clear()
+        with engine.begin() as connection:
+            self.follows_change_log = bool(connection.execute(text(PHONE_CHANGE_LOG_EXISTS_SQL)).scalar())
+            if self.follows_change_log and not self.read_only:
+                # The changes logged so far are part of the rows read below.
+                connection.execute(text(f"DELETE FROM {PHONE_CHANGE_LOG_TABLE}"))
+        rows_read = self.refresh(engine)
+        self.compact()
+        return rows_read
+
+    def clear(self):
+        """Deletes the on-disk index, e.g. after the contacts table was emptied."""
+        self._base = np.empty(0, dtype=np.int64)
+        self._delta = np.empty(0, dtype=np.int64)
+        self._removed = np.empty(0, dtype=np.int64)
+        self._overflow = set()
+        self.watermark = 0
+        self.logged_id = 0
+        self.follows_change_log = False
+        self._checkpoint = None
+        if self.read_only:
+            return
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        logger.info(f"Cleared phone index at {self.directory}.")
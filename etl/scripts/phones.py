@@ -0,0 +1,90 @@
+import logging
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import phonenumbers
+except ImportError:  # phonenumbers is optional; only needed for E.164 output
+    phonenumbers = None
+
+logger = logging.getLogger(__name__)
+
+# Characters stripped from phone numbers before they are stored or matched.
+PHONE_STRIP_PATTERN = r"[()\-\s]"
+
+# Numbers that were read from CSV files as floats, e.g. "4955868020.0".
+# Phone columns used to be parsed as numbers, which appends ".0" and drops
+# any leading '+' or '0'. Only the ".0" can be undone: the digits alone do
+# not tell an international number from a national one.
+FLOAT_STYLE_PATTERN = r"^(\d+)\.0$"
+
+# Text that pandas and str() produce for missing values.
+_MISSING_TEXT = {"", "nan", "NaN", "None", "<NA>", "NaT"}
+
+
+@lru_cache(maxsize=1_000_000)
+def _to_e164(phone: str, default_region: Optional[str]) -> str:
+    """Formats a cleaned phone number as E.164, or returns it unchanged if it cannot be parsed."""
+    try:
+        parsed = phonenumbers.parse(phone.lstrip("'"), default_region)
+    except phonenumbers.NumberParseException:
+        return phone
+    if not phonenumbers.is_possible_number(parsed):
+        return phone
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
+
+def normalize_phone_numbers(phones: Iterable, settings: Optional[Dict] = None) -> pd.Series:
+    """
+    Normalizes a column of phone numbers.
+
+    Parentheses, dashes and whitespace are removed, and missing or empty
+    values become None. Numbers in float form, as stored by versions that
+    read phone columns as numbers, lose their ".0" ("4955868020.0" becomes
+    "4955868020"), so they match the same number read from an integer
+    column. Each distinct raw value is only normalized once, so columns
+    with many repeated numbers are cheap to process.
+
+    With `e164: true` in the settings, numbers are additionally formatted as
+    E.164 (e.g. "+41562040888"), using `default_region` for numbers without
+    a country code. Numbers that cannot be parsed are kept as cleaned. This
+    requires the optional `phonenumbers` package.
+
+    Args:
+        phones (Iterable): The raw phone numbers, e.g. a DataFrame column.
+        settings (Optional[Dict]): The 'phone_normalization' section of config.yaml.
+
+    Returns:
+        pd.Series: The normalized numbers (object dtype, None for missing),
+        with the same index as the input if it was a Series.
+    """
+    settings = settings or {}
+    series = phones if isinstance(phones, pd.Series) else pd.Series(list(phones), dtype=object)
+
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    cleaned = pd.Series(uniques, dtype=object).astype(str).str.strip()
+    cleaned = cleaned.where(~cleaned.isin(_MISSING_TEXT), "")
+    cleaned = cleaned.str.replace(PHONE_STRIP_PATTERN, "", regex=True)
+    cleaned = cleaned.str.replace(FLOAT_STYLE_PATTERN, r"\1", regex=True)
+
+    if settings.get("e164"):
+        if phonenumbers is None:
+            raise ImportError("E.164 phone normalization requires the 'phonenumbers' package.")
+        default_region = settings.get("default_region")
+        cleaned = cleaned.map(lambda phone: _to_e164(phone, default_region) if phone else phone)
+
+    # Series.where(..., None) yields NaN on pandas' str dtype, so None is
+    # filled in on an object array.
+    cleaned_values = cleaned.to_numpy(dtype=object)
+    normalized_uniques = np.where(cleaned_values == "", None, cleaned_values)
+    normalized = pd.Series(
+        normalized_uniques.take(codes) if len(uniques) else [None] * len(codes),
+        index=series.index,
+        dtype=object,
+    )
+    normalized[codes == -1] = None
+    return normalized
+
@@ -0,0 +1,273 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Payload that closes a group of items in a stream, see `iter_groups`.
+END_OF_GROUP = object()
+
+_SENTINEL = object()
+_POLL_INTERVAL = 0.1
+
+
+class PipelineStopped(Exception):
+    """Raised inside a stage when the pipeline is shutting down."""
+
+
+class StageStats:
+    """Counters for one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.input_wait = 0.0
+        self.output_wait = 0.0
+        self.max_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+
+    def record_depth(self, depth: int):
+        self.max_depth = max(self.max_depth, depth)
+        self._depth_total += depth
+        self._depth_samples += 1
+
+    @property
+    def mean_depth(self) -> float:
+        return self._depth_total / self._depth_samples if self._depth_samples else 0.0
+
+    def summary(self) -> str:
+        summary = f"stage '{self.name}': {self.items} input items, waited {self.input_wait:.2f}s for input"
+        if self._depth_samples:
+            summary += (
+                f" and {self.output_wait:.2f}s on a full output queue "
+                f"(output queue depth: mean {self.mean_depth:.1f}, max {self.max_depth})"
+            )
+        return summary
+
+
+class Pipeline:
+    """
+    Runs a chain of stages concurrently, connected by bounded queues.
+
+    Each stage is a function that takes an iterator of input items and
+    yields output items. All stages except the last run in their own
+    thread; the last stage is whoever iterates over the pipeline. A stage
+    that gets ahead blocks once its output queue is full, so at most
+    `queue_size` items are buffered between two stages.
+
+    If a stage raises, the pipeline stops: the other stages are interrupted
+    at their next queue operation, and the error is re-raised to the
+    consumer. The pipeline also stops when the consumer stops iterating.
+
+    Example:
+        pipeline = Pipeline(files, queue_size=4)
+        pipeline.add_stage("parse", parse_files)
+        pipeline.add_stage("clean", clean_frames)
+        for frame in pipeline.run("load"):
+            load(frame)
+    """
+
+    def __init__(self, source: Iterable, queue_size: int = 2):
+        self.source = source
+        self.queue_size = queue_size
+        self.stats: List[StageStats] = []
+        self._stages: List[Tuple[str, Callable[[Iterator], Iterator]]] = []
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def add_stage(self, name: str, func: Callable[[Iterator], Iterator]) -> "Pipeline":
+        """Appends a stage that runs in its own thread."""
+        self._stages.append((name, func))
+        return self
+
+    def stop(self):
+        """Asks all stages to stop at their next queue operation."""
+        self._stop.set()
+
+    def _get(self, in_queue: queue.Queue, stats: StageStats) -> Any:
+        started = time.perf_counter()
+        try:
+            while True:
+                try:
+                    return in_queue.get(timeout=_POLL_INTERVAL)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        raise PipelineStopped()
+        finally:
+            stats.input_wait += time.perf_counter() - started
+
+    def _put(self, out_queue: queue.Queue, item: Any, stats: StageStats):
+        started = time.perf_counter()
+        try:
+            while True:
+                try:
+                    out_queue.put(item, timeout=_POLL_INTERVAL)
+                    stats.record_depth(out_queue.qsize())
+                    return
+                except queue.Full:
+                    if self._stop.is_set():
+                        raise PipelineStopped()
+        finally:
+            stats.output_wait += time.perf_counter() - started
+
+    def _iter_queue(self, in_queue: queue.Queue, stats: StageStats) -> Iterator:
+        while True:
+            item = self._get(in_queue, stats)
+            if item is _SENTINEL:
+                return
+            stats.items += 1
+            yield item
+
+    def _iter_source(self, stats: StageStats) -> Iterator:
+        for item in self.source:
+            if self._stop.is_set():
+                raise PipelineStopped()
+            stats.items += 1
+            yield item
+
+    def _run_stage(self, func: Callable[[Iterator], Iterator], inputs: Iterator, out_queue: queue.Queue, stats: StageStats):
+        try:
+            for item in func(inputs):
+                self._put(out_queue, item, stats)
+            self._put(out_queue, _SENTINEL, stats)
+        except PipelineStopped:
+            pass
+        except BaseException as e:
+            logger.error(f"Pipeline stage '{stats.name}' failed: {e}")
+            self._errors.append(e)
+            self._stop.set()
+
+    def run(self, consumer_name: str = "consumer") -> Iterator:
+        """
+        Starts the stage threads and yields the output of the last stage.
+
+        Args:
+            consumer_name (str): The name the caller's stage is logged under.
+
+        Yields:
+            The items produced by the last stage.
+        """
+        threads = []
+        inputs = None
+        for position, (name, func) in enumerate(self._stages):
+            stats = StageStats(name)
+            self.stats.append(stats)
+            inputs = self._iter_source(stats) if position == 0 else self._iter_queue(out_queue, stats)
+            out_queue = queue.Queue(maxsize=self.queue_size)
+            thread = threading.Thread(
+                target=self._run_stage, args=(func, inputs, out_queue, stats), name=f"pipeline-{name}", daemon=True
+            )
+            threads.append(thread)
+
+        consumer_stats = StageStats(consumer_name)
+        self.stats.append(consumer_stats)
+        for thread in threads:
+            thread.start()
+        try:
+            if threads:
+                yield from self._iter_queue(out_queue, consumer_stats)
+            else:
+                yield from self._iter_source(consumer_stats)
+        except PipelineStopped:
+            pass
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self.log_stats()
+        if self._errors:
+            raise self._errors[0]
+
+    def log_stats(self):
+        """Logs the counters of every stage."""
+        for stats in self.stats:
+            logger.info(f"Pipeline {stats.summary()}")
+
+
+class Gate:
+    """
+    A counter that a stage can wait on, e.g. to hold back work on the next
+    file until a downstream stage has finished the previous one.
+    """
+
+    def __init__(self):
+        self._count = 0
+        self._condition = threading.Condition()
+
+    def advance(self):
+        """Increments the counter and wakes up waiting stages."""
+        with self._condition:
+            self._count += 1
+            self._condition.notify_all()
+
+    def wait_for(self, count: int, pipeline: Optional[Pipeline] = None):
+        """
+        Blocks until the counter reaches `count`. Raises PipelineStopped if
+        the given pipeline stops while waiting.
+        """
+        with self._condition:
+            while self._count < count:
+                if pipeline is not None and pipeline.stopped:
+                    raise PipelineStopped()
+                self._condition.wait(timeout=_POLL_INTERVAL)
+
+
+class _Group:
+    """The payloads of one group in a stream of (key, payload) items."""
+
+    def __init__(self, items: Iterator, first: Any):
+        self._items = items
+        self._next = first
+        self.done = False
+
+    def _take(self) -> Any:
+        if self._next is not _SENTINEL:
+            payload, self._next = self._next, _SENTINEL
+        else:
+            item = next(self._items, None)
+            payload = END_OF_GROUP if item is None else item[1]
+        if payload is END_OF_GROUP:
+            self.done = True
+        return payload
+
+    def __iter__(self) -> Iterator:
+        while not self.done:
+            payload = self._take()
+            if payload is END_OF_GROUP:
+                return
+            if isinstance(payload, BaseException):
+                raise payload
+            yield payload
+
+    def drain(self):
+        while not self.done:
+            self._take()
+
+
+def iter_groups(items: Iterable[Tuple[Any, Any]]) -> Iterator[Tuple[Any, Iterator]]:
+    """
+    Splits a stream of (key, payload) items into consecutive groups.
+
+    Each group ends with an item whose payload is END_OF_GROUP. A payload
+    that is an exception is raised by the group's iterator. If the caller
+    stops reading a group early, its remaining items are skipped.
+
+    Args:
+        items (Iterable[Tuple[Any, Any]]): The stream of items.
+
+    Yields:
+        Tuple[Any, Iterator]: The key of each group and an iterator over its
+        payloads.
+    """
+    items = iter(items)
+    for key, first in items:
+        group = _Group(items, first)
+        yield key, iter(group)
+        group.drain()
@@ -3,9 +3,6 @@ import os
 import sys
 import json
 from pathlib import Path
-import pandas as pd
-import yaml
-from dotenv import load_dotenv
 import click
 
 # Add project root to the Python path
@@ -13,39 +10,59 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from sqlalchemy import text
-from etl.scripts.load import get_db_engine
-from etl.scripts.utils import setup_logging
+from etl.scripts.utils import load_config, setup_logging
 
-# --- Configuration ---
-load_dotenv(override=True)
-with open("config.yaml", "r") as f:
-    config = yaml.safe_load(f)
-
-logger = setup_logging(config["log_file"])
+# pandas, SQLAlchemy and the database modules are imported by the commands
+# that use them, so that commands which only look at the filesystem, such as
+# check-review-folder, start quickly.
+logger = logging.getLogger(__name__)
 
 # --- Helper Functions ---
 def get_engine():
+    from dotenv import load_dotenv
+    from etl.scripts.database import get_db_engine
+
+    load_dotenv(override=True)
     try:
         return get_db_engine()
     except ValueError as e:
         logger.critical(f"Database not configured. Halting execution: {e}")
         sys.exit(1)
 
+def _export_options(filename, export_format, columns, chunk_size):
+    """Resolves the format, column list and chunk size of an export command."""
+    from etl.scripts.export import EXPORT_FORMATS
+
+    export_format = (export_format or Path(filename).suffix.lstrip(".")).lower()
+    if export_format not in EXPORT_FORMATS:
+        raise click.BadParameter(
+            f"Cannot export '{filename}' as '{export_format}'; use --format with one of: {', '.join(EXPORT_FORMATS)}.",
+            param_hint="--format",
+        )
+    column_names = [name.strip() for name in columns.split(",") if name.strip()] if columns else None
+    chunk_size = chunk_size or (load_config().get("export", {}) or {}).get("chunk_size", 10_000)
+    return export_format, column_names, chunk_size
+
 # --- CLI Commands ---
 @click.group()
 def cli():
     """A CLI tool to view and manage the contacts database."""
-    pass
+    setup_logging(load_config()["log_file"])
 
 @cli.command()
 @click.option('--limit', default=10, help='Number of contacts to display.')
 def view_contacts(limit):
     """Displays the most recent contacts from the database."""
+    import pandas as pd
+    from sqlalchemy import text
+
     logger.info(f"Fetching the last {limit} contacts...")
     engine = get_engine()
     try:
-        df = pd.read_sql(f"SELECT id, company_name, phone_number, industry, created_at FROM contacts ORDER BY created_at DESC LIMIT {limit}", engine)
+        df = pd.read_sql(
+            text("SELECT id, company_name, phone_number, industry, created_at FROM contacts ORDER BY created_at DESC LIMIT :limit"),
+            engine, params={"limit": limit},
+        )
         if df.empty:
             print("No contacts found in the database.")
             return
@@ -56,24 +73,72 @@ def view_contacts(limit):
         logger.error(f"An error occurred while fetching contacts: {e}")
 
 @cli.command()
-@click.option('--filename', default='contact_export.xlsx', help='Name of the output Excel file.')
-def export_contacts(filename):
-    """Exports all contacts to an Excel file."""
-    logger.info(f"Exporting all contacts to {filename}...")
+@click.option('--filename', default='contact_export.xlsx', help='Name of the output file. Its extension selects the format unless --format is given.')
+@click.option('--format', 'export_format', default=None, help='Output format: csv, parquet or xlsx.')
+@click.option('--columns', default=None, help='Comma-separated columns to export (default: all).')
+@click.option('--tag', 'tags', multiple=True, help='Only export contacts with this tag. Can be given several times.')
+@click.option('--status', default=None, help='Only export contacts with this status.')
+@click.option('--profile', 'profile_id', type=int, default=None, help='Only export contacts of this data profile ID.')
+@click.option('--chunk-size', type=click.IntRange(min=1), default=None, help='Rows fetched per round trip (default: export.chunk_size).')
+def export_contacts(filename, export_format, columns, tags, status, profile_id, chunk_size):
+    """
+    Exports contacts to a CSV, Parquet or Excel file.
+
+    Contacts are streamed from a server-side cursor in chunks, so memory use
+    stays flat regardless of the table size. Excel exports start a new sheet
+    every 1,048,575 rows.
+    """
+    from etl.scripts.export import export_contacts as export_contacts_to_file
+
+    export_format, column_names, chunk_size = _export_options(filename, export_format, columns, chunk_size)
+
+    logger.info(f"Exporting contacts to {filename} ({export_format})...")
     engine = get_engine()
     try:
-        df = pd.read_sql("SELECT * FROM contacts", engine)
-        if df.empty:
+        count = export_contacts_to_file(
+            engine, filename, export_format, columns=column_names, tags=tags,
+            status=status, profile_id=profile_id, chunk_size=chunk_size,
+        )
+        if not count:
             print("No contacts to export.")
-            return
-        df.to_excel(filename, index=False)
-        logger.info(f"Successfully exported {len(df)} contacts to {os.path.abspath(filename)}")
+        logger.info(f"Successfully exported {count} contacts to {os.path.abspath(filename)}")
     except Exception as e:
         logger.error(f"An error occurred during export: {e}")
 
+@cli.command()
+@click.option('--consumer', required=True, help='Name of the downstream consumer whose watermark is used, e.g. dialer.')
+@click.option('--filename', required=True, help='Name of the output file. Its extension selects the format unless --format is given.')
+@click.option('--format', 'export_format', default=None, help='Output format: csv, parquet or xlsx.')
+@click.option('--columns', default=None, help='Comma-separated columns to export (default: all).')
+@click.option('--chunk-size', type=click.IntRange(min=1), default=None, help='Rows fetched per round trip (default: export.chunk_size).')
+def export_delta(consumer, filename, export_format, columns, chunk_size):
+    """
+    Exports the contacts created or updated since the consumer's last export.
+
+    The first export of a consumer contains all contacts. Contacts changed
+    while an export runs can appear again in the next delta, so consumers
+    should upsert rows by id.
+    """
+    from etl.scripts.export import export_delta as export_delta_to_file
+
+    export_format, column_names, chunk_size = _export_options(filename, export_format, columns, chunk_size)
+
+    engine = get_engine()
+    try:
+        result = export_delta_to_file(engine, consumer, filename, export_format, columns=column_names, chunk_size=chunk_size)
+        since = result.since or "the beginning"
+        logger.info(
+            f"Exported {result.exported} contacts changed since {since} to {os.path.abspath(filename)} "
+            f"for '{consumer}'. New watermark: {result.watermark}."
+        )
+    except Exception as e:
+        logger.error(f"An error occurred during the delta export: {e}")
+
 @cli.command()
 def view_profiles():
     """Displays all discovered contact data profiles."""
+    import pandas as pd
+
     logger.info("Fetching contact profiles...")
     engine = get_engine()
     try:
@@ -92,7 +157,7 @@ def view_profiles():
 @cli.command()
 def check_review_folder():
     """Checks for files needing manual review."""
-    review_dir = Path(config["review_directory"])
+    review_dir = Path(load_config()["review_directory"])
     logger.info(f"Checking for files in {review_dir}...")
     if not review_dir.exists() or not any(review_dir.iterdir()):
         print("Review folder is empty. No files need manual review.")
@@ -121,13 +186,23 @@ def check_dropped_duplicates():
 @click.confirmation_option(prompt='Are you sure you want to delete all contacts and profiles?')
 def reset_database():
     """
-    Deletes all records from the contacts and contact_profiles tables.
+    Deletes all records from the contacts (with their tags and events),
+    contact_profiles and etl_file_manifest tables.
     This is a destructive operation and cannot be undone.
     """
+    from sqlalchemy import text
+    from etl.scripts.phone_index import PhoneIndex
+
     logger.warning("--- Starting Database Reset ---")
     engine = get_engine()
     with engine.connect() as connection:
         try:
+            # Emptied first, so the contacts' foreign keys have nothing to cascade to.
+            logger.info("Deleting all records from 'contact_tags' and 'contact_events' tables...")
+            connection.execute(text("DELETE FROM contact_tags;"))
+            connection.execute(text("DELETE FROM contact_events;"))
+            logger.info("...done.")
+
             logger.info("Deleting all records from 'contacts' table...")
             connection.execute(text("DELETE FROM contacts;"))
             logger.info("...done.")
@@ -135,8 +210,16 @@ def reset_database():
             logger.info("Deleting all records from 'contact_profiles' table...")
             connection.execute(text("DELETE FROM contact_profiles;"))
             logger.info("...done.")
+
+            # Without contacts, the manifest's loaded files must be loaded again.
+            logger.info("Deleting all records from 'etl_file_manifest' table...")
+            connection.execute(text("DELETE FROM etl_file_manifest;"))
+            logger.info("...done.")
             
             connection.commit()
+
+            # The phone index mirrors the contacts table, so it is stale now.
+            PhoneIndex.from_config(load_config().get("deduplication", {})).clear()
             logger.info("--- Database Reset Successfully ---")
         except Exception as e:
             logger.error(f"An error occurred during database reset: {e}")
@@ -146,11 +229,15 @@ def reset_database():
 @click.option('--id', required=True, type=int, help='The ID of the contact to audit.')
 def audit_contact(id):
     """Displays a full audit report for a single contact."""
+    import pandas as pd
+    from sqlalchemy import text
+    from etl.scripts.contact_tags import CONTACTS_VIEW
+
     logger.info(f"Generating audit report for contact ID: {id}")
     engine = get_engine()
     try:
         # Fetch the main contact record
-        contact_df = pd.read_sql(f"SELECT * FROM contacts WHERE id = {id}", engine)
+        contact_df = pd.read_sql(text(f"SELECT * FROM {CONTACTS_VIEW} WHERE id = :id"), engine, params={"id": id})
         if contact_df.empty:
             print(f"Error: No contact found with ID: {id}")
             return
@@ -168,6 +255,9 @@ def audit_contact(id):
             "Industry": contact.get('industry'),
             "Is B2B": contact.get('is_b2b'),
             "Profile ID": contact.get('profile_id'),
+            "Status": contact.get('status'),
+            "Tags": ", ".join(contact.get('tags') or []),
+            "Last Used": contact.get('last_used'),
             "Created At": contact.get('created_at')
         }
         for key, value in promoted_data.items():
@@ -175,15 +265,17 @@ def audit_contact(id):
 
         # --- Display Full Raw Data ---
         print("\n== Full Original Data (from additional_info) ==")
-        additional_info_str = contact.get('additional_info')
-        if additional_info_str and isinstance(additional_info_str, str):
+        additional_info = contact.get('additional_info')
+        if additional_info and isinstance(additional_info, str):
+            # Rows loaded with to_sql hold the document as a JSON string
             try:
-                additional_info = json.loads(additional_info_str)
-                for key, value in sorted(additional_info.items()):
-                    print(f"- {key+':':<30} {value}")
+                additional_info = json.loads(additional_info)
             except json.JSONDecodeError:
                 print("Could not decode the additional_info JSON string.")
-        else:
+        if additional_info and isinstance(additional_info, dict):
+            for key, value in sorted(additional_info.items()):
+                print(f"- {key+':':<30} {value}")
+        elif not isinstance(additional_info, str):
             print("No additional information found.")
 
         print("\n-----------------------------------------")
@@ -195,22 +287,96 @@ def audit_contact(id):
 @cli.command()
 def count_contacts():
     """Counts the total number of contacts in the database."""
+    from etl.scripts.contact_stats import get_total
+
     logger.info("Counting total contacts...")
     engine = get_engine()
     try:
-        count = pd.read_sql("SELECT COUNT(id) FROM contacts", engine).iloc[0,0]
+        # Read from the maintained counters instead of scanning the table.
+        count = get_total(engine)
         print(f"Total number of contacts: {count}")
     except Exception as e:
         logger.error(f"An error occurred while counting contacts: {e}")
 
+@cli.group(invoke_without_command=True)
+@click.option('--recompute', is_flag=True, help='Recount all contacts, correct the counters and list the ones that were wrong.')
+@click.pass_context
+def stats(ctx, recompute):
+    """
+    Shows contact counts by status, tag, profile and industry.
+
+    The counts are kept up to date by triggers in the same transaction as
+    every change to the contacts table, so they are read without scanning it.
+    Without a subcommand, shows the total and the counts by status.
+    """
+    from etl.scripts.contact_stats import get_total, recompute_contact_stats
+
+    engine = get_engine()
+    if recompute:
+        logger.info("Recomputing contact statistics...")
+        try:
+            drift = recompute_contact_stats(engine)
+        except Exception as e:
+            logger.error(f"An error occurred while recomputing statistics: {e}")
+            return
+        if drift.empty:
+            print("All contact statistics were up to date.")
+        else:
+            print(f"--- Corrected {len(drift)} Counters ---")
+            print(drift.to_string(index=False))
+            print("-----------------------------")
+    if ctx.invoked_subcommand is None:
+        try:
+            print(f"Total number of contacts: {get_total(engine)}")
+            _print_stats(engine, "status", None)
+        except Exception as e:
+            logger.error(f"An error occurred while fetching statistics: {e}")
+
+def _print_stats(engine, dimension, limit):
+    from etl.scripts.contact_stats import get_stats
+
+    df = get_stats(engine, dimension, limit)
+    if df.empty:
+        print(f"No contacts to count by {dimension}.")
+        return
+    df["value"] = df["value"].replace("", "(none)")
+    print(f"--- Contacts by {dimension} ---")
+    print(df.rename(columns={"value": dimension}).to_string(index=False))
+    print("-----------------------------")
+
+def _stats_command(dimension, help_text):
+    @stats.command(name=dimension, help=help_text)
+    @click.option('--limit', default=None, type=int, help='Show only the largest values.')
+    def command(limit):
+        try:
+            _print_stats(get_engine(), dimension, limit)
+        except Exception as e:
+            logger.error(f"An error occurred while fetching statistics: {e}")
+    return command
+
+stats_status = _stats_command("status", "Shows the number of contacts per status.")
+stats_tag = _stats_command("tag", "Shows the number of contacts carrying each tag.")
+stats_profile = _stats_command("profile", "Shows the number of contacts per data profile ID.")
+stats_industry = _stats_command("industry", "Shows the number of contacts per industry.")
+
 @cli.command()
 @click.option('--limit', default=20, help='Number of past runs to display.')
-def view_etl_runs(limit):
-    """Displays a history of ETL pipeline runs."""
-    logger.info(f"Fetching the last {limit} ETL runs...")
+@click.option('--run-id', type=int, default=None, help='Show the time spent in each stage of this run, per stage and per file.')
+def view_etl_runs(limit, run_id):
+    """Displays a history of ETL pipeline runs, or the stage breakdown of one run."""
     engine = get_engine()
+    if run_id is not None:
+        _print_run_stages(engine, run_id)
+        return
+    import pandas as pd
+    from sqlalchemy import text
+
+    logger.info(f"Fetching the last {limit} ETL runs...")
     try:
-        df = pd.read_sql(f"SELECT id, run_at, finished_at, status, tag_used, files_processed, contacts_added FROM etl_runs ORDER BY run_at DESC LIMIT {limit}", engine)
+        df = pd.read_sql(
+            text("SELECT id, run_at, finished_at, status, tag_used, files_processed, contacts_added FROM etl_runs ORDER BY run_at DESC LIMIT :limit"),
+            engine, params={"limit": limit},
+        )
         if df.empty:
             print("No ETL runs found in the database.")
             return
@@ -220,5 +386,37 @@ def view_etl_runs(limit):
     except Exception as e:
         logger.error(f"An error occurred while fetching ETL runs: {e}")
 
+def _print_run_stages(engine, run_id):
+    import pandas as pd
+    from sqlalchemy import text
+
+    logger.info(f"Fetching the stage timings of ETL run {run_id}...")
+    try:
+        df = pd.read_sql(
+            text(
+                "SELECT file_name, stage, calls, seconds, rows_in, rows_out, rows_per_second, "
+                "rss_growth_mb, process_peak_rss_mb "
+                "FROM etl_run_stages WHERE run_id = :run_id ORDER BY file_name, id"
+            ),
+            engine, params={"run_id": run_id},
+        )
+        if df.empty:
+            print(f"No stage timings found for ETL run {run_id}.")
+            return
+        totals = df.groupby("stage", sort=False).agg(
+            calls=("calls", "sum"), seconds=("seconds", "sum"), rows_in=("rows_in", "sum"),
+            rows_out=("rows_out", "sum"), rss_growth_mb=("rss_growth_mb", "max"),
+            process_peak_rss_mb=("process_peak_rss_mb", "max"),
+        )
+        totals["share"] = (totals["seconds"] / totals["seconds"].sum() * 100).round(1).astype(str) + "%"
+        print(f"--- ETL Run {run_id}: Time per Stage ---")
+        print(totals.round(2).to_string())
+        print(f"\n--- ETL Run {run_id}: Time per File and Stage ---")
+        df["file_name"] = df["file_name"].replace("", "(run)")
+        print(df.round(2).to_string(index=False))
+        print("-----------------------")
+    except Exception as e:
+        logger.error(f"An error occurred while fetching stage timings: {e}")
+
 if __name__ == "__main__":
     cli()
\ No newline at end of file
@@ -1,6 +1,7 @@
 import logging
 import os
 import sys
+import click
 from dotenv import load_dotenv
 from sqlalchemy import text
 
@@ -9,13 +10,16 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from etl.scripts.load import get_db_engine
+from etl.scripts.database import get_db_engine
+from etl.scripts.migrations import run_migrations
 from etl.scripts.utils import setup_logging
 
-# Initialize logger
-setup_logging("etl/logs/setup.log")
 logger = logging.getLogger(__name__)
 
+# The contacts table as it was before the first migration; the migrations
+# run below bring it to the current schema. Migration 1 indexes `tags`, and
+# migration 6 moves `tags` and `last_used` into contact_tags and
+# contact_events, so a database is only ready for loading once they ran.
 CREATE_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS contacts (
     id SERIAL PRIMARY KEY,
@@ -39,7 +43,7 @@ CREATE TABLE IF NOT EXISTS contact_profiles (
     id SERIAL PRIMARY KEY,
     profile_hash TEXT UNIQUE NOT NULL,
     json_keys TEXT[] NOT NULL,
-    contact_count INTEGER DEFAULT 1,
+    contact_count INTEGER DEFAULT 0,
     created_at TIMESTAMP DEFAULT NOW()
 );
 """
@@ -56,6 +60,26 @@ CREATE TABLE IF NOT EXISTS etl_runs (
 );
 """
 
+CREATE_FILE_MANIFEST_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS etl_file_manifest (
+    content_hash TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    file_size BIGINT NOT NULL,
+    file_mtime DOUBLE PRECISION NOT NULL,
+    state TEXT NOT NULL,
+    rows_committed BIGINT NOT NULL DEFAULT 0,
+    contacts_added INTEGER NOT NULL DEFAULT 0,
+    run_id INTEGER,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_etl_file_manifest_file ON etl_file_manifest (file_name, file_size, file_mtime);
+"""
+
+# Used by the "database" fuzzy matching backend (deduplication.fuzzy_backend).
+# Its company name index is built by migration 8.
+CREATE_TRIGRAM_EXTENSION_SQL = "CREATE EXTENSION IF NOT EXISTS pg_trgm;"
+
 ADD_PROFILE_ID_COLUMN_SQL = """
 DO $$
 BEGIN
@@ -87,7 +111,8 @@ $$;
 
 def setup_database():
     """
-    Sets up the database by creating tables, columns, and constraints.
+    Sets up the database by creating tables, columns, and constraints, then
+    applies pending schema migrations (see `migrations.py`).
     """
     logger.info("Starting database setup...")
     load_dotenv()
@@ -115,14 +140,39 @@ def setup_database():
             connection.execute(text(CREATE_ETL_RUNS_TABLE_SQL))
             logger.info("Table 'etl_runs' ensured to exist.")
 
+            logger.info("Executing CREATE TABLE IF NOT EXISTS for 'etl_file_manifest'...")
+            connection.execute(text(CREATE_FILE_MANIFEST_TABLE_SQL))
+            logger.info("Table 'etl_file_manifest' ensured to exist.")
+
             # Commit the transaction
             connection.commit()
 
+        # pg_trgm is a contrib extension that may not be installed on the
+        # server, so it is set up separately and is not required.
+        try:
+            with engine.begin() as connection:
+                logger.info("Executing CREATE EXTENSION IF NOT EXISTS pg_trgm...")
+                connection.execute(text(CREATE_TRIGRAM_EXTENSION_SQL))
+                logger.info("Extension 'pg_trgm' ensured to exist.")
+        except Exception as e:
+            logger.warning(
+                f"Could not set up the pg_trgm extension; the 'database' fuzzy matching backend will not be available. Error: {e}"
+            )
+
+        # Indexes and later schema changes are versioned migrations.
+        run_migrations(engine)
+
         logger.info("Database setup completed successfully.")
 
     except Exception as e:
         logger.critical(f"An error occurred during database setup: {e}")
         raise
 
+@click.command()
+def setup():
+    """Creates the database schema and applies pending migrations."""
+    setup_logging("etl/logs/setup.log")
+    setup_database()
+
 if __name__ == "__main__":
-    setup_database()
\ No newline at end of file
+    setup()
\ No newline at end of file
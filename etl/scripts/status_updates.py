@@ -0,0 +1,112 @@
+import logging
+import time
+from datetime import datetime
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+import pandas as pd
+from sqlalchemy.engine import Engine
+
+from etl.scripts.contact_tags import USED_EVENT
+from etl.scripts.load import copy_dataframe
+
+logger = logging.getLogger(__name__)
+
+STATUS_UPDATES_TABLE = "status_updates"
+
+
+class StatusUpdateResult(NamedTuple):
+    """The outcome of marking a batch of phone numbers as used."""
+    matched: int
+    updated: int
+    unmatched: List[str]
+    # Seconds from the UPDATE to the commit, i.e. how long row locks were held.
+    lock_seconds: float = 0.0
+
+
+def iter_line_batches(path: str, batch_size: int) -> Iterator[List[str]]:
+    """
+    Reads a text file lazily and yields its non-blank lines, stripped, in
+    lists of at most `batch_size` lines.
+    """
+    batch = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            batch.append(line)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def mark_used(
+    engine: Engine, phones: Iterable[str], tag: str = "used", used_at: Optional[datetime] = None
+) -> StatusUpdateResult:
+    """
+    Marks the contacts with the given phone numbers as used, in a single
+    set-based statement.
+
+    The numbers are copied into a temporary table and joined against
+    `contacts`. `tag` is inserted into `contact_tags` and a 'used' event
+    with `used_at` into `contact_events`, and contacts whose status is not
+    'used' yet are set to 'used'. Contacts that already carry the tag are
+    left unchanged, and contacts that were already used are not rewritten.
+    The batch is committed as one transaction, so callers bound the
+    transaction size by the batch size.
+
+    Args:
+        engine (Engine): The SQLAlchemy database engine.
+        phones (Iterable[str]): Normalized, distinct phone numbers.
+        tag (str): The tag to add.
+        used_at (Optional[datetime]): The time of the 'used' event. Defaults to now.
+
+    Returns:
+        StatusUpdateResult: The number of numbers found in the contacts
+        table, the number of contacts newly tagged, the numbers not found,
+        and how long the updated rows stayed locked.
+    """
+    candidates = pd.DataFrame({"phone_number": list(phones)})
+    if candidates.empty:
+        return StatusUpdateResult(0, 0, [])
+
+    with engine.begin() as connection:
+        cursor = connection.connection.cursor()
+        try:
+            cursor.execute(f"CREATE TEMP TABLE {STATUS_UPDATES_TABLE} (phone_number TEXT PRIMARY KEY) ON COMMIT DROP")
+            copy_dataframe(cursor, candidates, STATUS_UPDATES_TABLE)
+            cursor.execute(
+                f"SELECT u.phone_number FROM {STATUS_UPDATES_TABLE} u "
+                f"WHERE NOT EXISTS (SELECT 1 FROM contacts c WHERE c.phone_number = u.phone_number)"
+            )
+            unmatched = [row[0] for row in cursor.fetchall()]
+            lock_started = time.perf_counter()
+            cursor.execute(
+                f"""
+                WITH tagged AS (
+                    INSERT INTO contact_tags (contact_id, tag)
+                    SELECT c.id, %(tag)s FROM {STATUS_UPDATES_TABLE} u JOIN contacts c ON c.phone_number = u.phone_number
+                    ON CONFLICT (tag, contact_id) DO NOTHING
+                    RETURNING contact_id
+                ),
+                events AS (
+                    INSERT INTO contact_events (contact_id, event, tag, occurred_at)
+                    SELECT contact_id, %(event)s, %(tag)s, %(used_at)s FROM tagged
+                ),
+                used AS (
+                    UPDATE contacts c SET status = 'used'
+                    FROM tagged t
+                    WHERE c.id = t.contact_id AND c.status IS DISTINCT FROM 'used'
+                )
+                SELECT COUNT(*) FROM tagged
+                """,
+                {"used_at": used_at or datetime.now(), "tag": tag, "event": USED_EVENT},
+            )
+            updated = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+    lock_seconds = time.perf_counter() - lock_started
+
+    return StatusUpdateResult(len(candidates) - len(unmatched), updated, unmatched, lock_seconds)
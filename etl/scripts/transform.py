@@ -3,12 +3,188 @@ import os
 import pandas as pd
 import numpy as np
 import json
-from typing import Dict, List
+import hashlib
+from datetime import date, datetime, time
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
 from urllib.parse import urlparse
 
+from etl.scripts.phones import normalize_phone_numbers
+
 logger = logging.getLogger(__name__)
 
-from typing import Dict, List, Tuple
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library is used without it
+    orjson = None
+
+# Stand-in for a missing phone number when tracking phones across chunks.
+_MISSING_PHONE = "\x00missing"
+
+def _json_default(value: Any) -> str:
+    """Encodes the values JSON has no type for, such as date cells, as ISO 8601 strings."""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def serialize_rows_to_json(df: pd.DataFrame, use_fast_backend: bool = True) -> List[str]:
+    """
+    Serializes each row of a DataFrame to a JSON object string.
+
+    Each column is converted to native Python values in one pass, with
+    missing values (NaN, None, NA) as None, and the rows are then assembled
+    from the column lists. This avoids building a Series and a dict per row
+    through `DataFrame.apply`. Keys keep the column order of the DataFrame.
+    Dates and timestamps (e.g. the date cells of a workbook) are written as
+    ISO 8601 strings. When orjson is installed it is used to encode the rows;
+    the documents are the same, only the whitespace and escaping of the text
+    differ.
+
+    Args:
+        df (pd.DataFrame): The raw data.
+        use_fast_backend (bool): Use orjson if it is available.
+
+    Returns:
+        List[str]: One JSON object string per row.
+    """
+    keys = df.columns.tolist()
+    column_values = []
+    for position in range(df.shape[1]):
+        column = df.iloc[:, position]
+        missing = column.isna()
+        if missing.any():
+            column = column.astype(object).where(~missing, None)
+        column_values.append(column.tolist())
+
+    rows = (dict(zip(keys, values)) for values in zip(*column_values))
+    if use_fast_backend and orjson is not None:
+        return [
+            orjson.dumps(row, default=_json_default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+            for row in rows
+        ]
+    return [json.dumps(row, default=_json_default) for row in rows]
+
+class PromotionPlan(NamedTuple):
+    """
+    The promotion rules of a profile resolved against one header layout.
+
+    `source_positions` holds, for each target column, the positions of its
+    source columns in the header, in priority order. Source columns missing
+    from the header are left out.
+    """
+    profile_name: str
+    target_columns: List[str]
+    source_positions: List[List[int]]
+
+# Compiled plans, keyed by (profile name, header fingerprint)
+_PLAN_CACHE: Dict[Tuple[str, str], PromotionPlan] = {}
+
+def header_fingerprint(columns: List[str]) -> str:
+    """
+    Creates a stable hash of a list of column names.
+
+    This is the same hash as `contact_profiles.profile_hash` when given the
+    sorted JSON keys. Given the columns in file order, it identifies a
+    header layout including column positions.
+    """
+    m = hashlib.md5()
+    m.update(str(list(columns)).encode('utf-8'))
+    return m.hexdigest()
+
+def resolve_profile(file_path: str, json_keys: List[str], config: Dict) -> str:
+    """
+    Identifies the data source profile for a file.
+
+    A profile listing the file's header fingerprint (the profile hash of its
+    sorted column names) in `header_fingerprints` wins. Otherwise the first
+    profile whose `file_name_contains` occurs in the file name is used.
+
+    Args:
+        file_path (str): The name of the source file.
+        json_keys (List[str]): The sorted column names of the file.
+        config (Dict): The pipeline configuration.
+
+    Returns:
+        str: The profile name, or "default" if no profile matches.
+    """
+    source_profiles = config.get("data_source_profiles", {})
+    fingerprint = header_fingerprint(json_keys)
+    for name, profile_data in source_profiles.items():
+        if fingerprint in (profile_data.get("header_fingerprints") or []):
+            return name
+
+    for name, profile_data in source_profiles.items():
+        if profile_data.get("file_name_contains", "") in file_path:
+            return name
+    return "default"
+
+def get_promotion_plan(profile_name: str, columns: List[str], config: Dict) -> PromotionPlan:
+    """
+    Returns the compiled promotion plan for a profile and header layout.
+
+    Plans are cached per (profile, header fingerprint), so files (or chunks)
+    with a known layout skip planning entirely.
+
+    Args:
+        profile_name (str): The resolved profile name.
+        columns (List[str]): The column names of the file, in file order.
+        config (Dict): The pipeline configuration.
+
+    Returns:
+        PromotionPlan: The compiled plan.
+    """
+    cache_key = (profile_name, header_fingerprint(columns))
+    plan = _PLAN_CACHE.get(cache_key)
+    if plan is not None:
+        return plan
+
+    rules = config.get("data_source_profiles", {}).get(profile_name, {}).get("promotion_rules", {})
+    positions_by_column = {}
+    for position, column in enumerate(columns):
+        positions_by_column.setdefault(column, position)
+
+    target_columns = list(rules.keys())
+    source_positions = [
+        [positions_by_column[source_col] for source_col in source_options if source_col in positions_by_column]
+        for source_options in rules.values()
+    ]
+    plan = PromotionPlan(profile_name, target_columns, source_positions)
+    _PLAN_CACHE[cache_key] = plan
+    logger.debug(f"Compiled promotion plan for profile '{profile_name}' and header {cache_key[1]}.")
+    return plan
+
+def apply_promotion_plan(df: pd.DataFrame, plan: PromotionPlan) -> Dict[str, np.ndarray]:
+    """
+    Coalesces the source columns of each target column in one vectorized pass.
+
+    The source columns are read into a single object array, and for each
+    target the first non-missing value across its sources is picked per row.
+    Rows where all sources are missing get NaN.
+
+    Args:
+        df (pd.DataFrame): The raw data, with the columns the plan was compiled for.
+        plan (PromotionPlan): The compiled promotion plan.
+
+    Returns:
+        Dict[str, np.ndarray]: The promoted values for each target column.
+    """
+    row_count = len(df)
+    used_positions = sorted({position for positions in plan.source_positions for position in positions})
+    block = df.iloc[:, used_positions].to_numpy(dtype=object) if used_positions else np.empty((row_count, 0), dtype=object)
+    present = ~pd.isna(block)
+    block_column = {position: i for i, position in enumerate(used_positions)}
+    rows = np.arange(row_count)
+
+    promoted = {}
+    for target, positions in zip(plan.target_columns, plan.source_positions):
+        values = np.full(row_count, np.nan, dtype=object)
+        if positions:
+            columns = [block_column[position] for position in positions]
+            candidates_present = present[:, columns]
+            first_present = candidates_present.argmax(axis=1)
+            has_value = candidates_present[rows, first_present]
+            values[has_value] = block[:, columns][rows, first_present][has_value]
+        promoted[target] = values
+    return promoted
 
 def apply_transformations(df: pd.DataFrame, file_path: str, config: Dict) -> tuple[pd.DataFrame, List[str]]:
     """
@@ -21,31 +197,20 @@ def apply_transformations(df: pd.DataFrame, file_path: str, config: Dict) -> tup
     # --- Tier 1: Preserve raw data and get keys for profiling ---
     # Get the list of all original columns to be used for profiling
     json_keys = sorted(df.columns.tolist())
-    # Create a copy of the raw data with NaNs handled for later JSON conversion
-    raw_json_df = df.replace({np.nan: None})
+    # Serialize the raw data before promotion modifies any of its columns
+    logger.debug("Serializing raw rows for 'additional_info'...")
+    additional_info = serialize_rows_to_json(df)
 
     # --- Tier 2: Promote best data to structured columns ---
-    # Identify the correct profile based on the filename
-    source_profiles = config.get("data_source_profiles", {})
-    profile_name = "default"
-    for name, profile_data in source_profiles.items():
-        if profile_data.get("file_name_contains", "") in file_path:
-            profile_name = name
-            break
-    
+    # Identify the correct profile based on the header and filename
+    profile_name = resolve_profile(file_path, json_keys, config)
+    plan = get_promotion_plan(profile_name, df.columns.tolist(), config)
     logger.info(f"Applying promotion rules for profile: '{profile_name}'")
-    rules = source_profiles.get(profile_name, {}).get("promotion_rules", {})
-
-    # Create the new structured columns based on promotion rules
-    for db_col, source_options in rules.items():
-        # Create a new series to hold the promoted data for this column
-        new_col_series = pd.Series(index=df.index, dtype=object)
-        for source_col in source_options:
-            if source_col in df.columns:
-                # Coalesce values into the new series from the original df
-                new_col_series = new_col_series.where(new_col_series.notna(), df[source_col])
-        # Assign the completed series to the DataFrame, overwriting or creating the column
-        df[db_col] = new_col_series
+
+    # Create the new structured columns based on promotion rules. All values
+    # are taken from the original columns before any of them is replaced.
+    for db_col, values in apply_promotion_plan(df, plan).items():
+        df[db_col] = values
 
     # --- Data Cleaning for Promoted Columns ---
     if 'is_b2b' in df.columns:
@@ -76,12 +241,10 @@ def apply_transformations(df: pd.DataFrame, file_path: str, config: Dict) -> tup
     else:
         df['tags'] = [[] for _ in range(len(df))] # Ensure the column exists with an empty list
 
-    # Create the additional_info column from the preserved raw data
-    logger.debug("Creating 'additional_info' from raw_json_df...")
-    # For each row, create a dictionary and then convert it to a JSON string.
-    # This ensures each row's additional_info contains only that row's data.
-    df['additional_info'] = raw_json_df.apply(lambda row: row.to_dict(), axis=1).apply(json.dumps)
-    logger.debug(f"Type of 'additional_info' column after json.dumps: {type(df['additional_info'].iloc[0])}")
+    # Create the additional_info column from the preserved raw data.
+    # Each row's additional_info contains only that row's data.
+    df['additional_info'] = additional_info
+    logger.debug(f"Type of 'additional_info' column after serialization: {type(df['additional_info'].iloc[0])}")
     logger.debug(f"Sample additional_info value: {df['additional_info'].iloc[0]}")
 
     # Select only the final structured columns + the JSONB field
@@ -99,12 +262,42 @@ def apply_transformations(df: pd.DataFrame, file_path: str, config: Dict) -> tup
 
     return final_df, json_keys
 
-def clean_data(df: pd.DataFrame) -> pd.DataFrame:
+def _save_rejected_rows(df: pd.DataFrame, directory: str, prefix: str, source_name: Optional[str]) -> str:
+    """
+    Saves rejected rows for review and returns the file path.
+
+    Without a source name, each call writes a new timestamped file. With one,
+    rows are appended to a single file per source, so the chunks of a
+    streamed file end up in the same place.
+    """
+    os.makedirs(directory, exist_ok=True)
+    if source_name is None:
+        timestamp = pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(directory, f"{prefix}_{timestamp}.csv")
+        df.to_csv(path, index=False)
+    else:
+        path = os.path.join(directory, f"{prefix}_{source_name}.csv")
+        df.to_csv(path, index=False, mode='a', header=not os.path.exists(path))
+    return path
+
+def clean_data(
+    df: pd.DataFrame,
+    seen_phones: Optional[Set] = None,
+    source_name: Optional[str] = None,
+    phone_settings: Optional[Dict] = None,
+) -> pd.DataFrame:
     """
     Performs various data cleaning operations.
 
     Args:
         df (pd.DataFrame): The DataFrame to clean.
+        seen_phones (Optional[Set]): Phone numbers already kept from earlier
+            chunks of the same file. When given, rows repeating one of them are
+            dropped as duplicates and the set is updated with this chunk's phones.
+        source_name (Optional[str]): Name used for the rejected-rows files.
+            When given, rejected rows are appended to one file per source.
+        phone_settings (Optional[Dict]): The 'phone_normalization' section of
+            config.yaml, passed on to `normalize_phone_numbers`.
 
     Returns:
         pd.DataFrame: The cleaned DataFrame.
@@ -154,11 +347,7 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
         invalid_df = df[invalid_rows_mask]
 
         if not invalid_df.empty:
-            invalid_dir = "etl/invalid_records"
-            os.makedirs(invalid_dir, exist_ok=True)
-            timestamp = pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')
-            invalid_path = os.path.join(invalid_dir, f"missing_company_name_{timestamp}.csv")
-            invalid_df.to_csv(invalid_path, index=False)
+            invalid_path = _save_rejected_rows(invalid_df, "etl/invalid_records", "missing_company_name", source_name)
             logger.warning(f"Saved {len(invalid_df)} rows with missing company name to {invalid_path}")
 
             # Remove any remaining invalid rows from the main dataframe
@@ -166,17 +355,7 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
 
     # Clean phone numbers: remove common characters and whitespace
     if "phone_number" in df.columns:
-        # Define a function to clean each phone number individually.
-        def clean_phone(phone):
-            if pd.isna(phone):
-                return None
-            # Convert to string, remove unwanted characters, and handle empty strings.
-            cleaned = str(phone).replace('nan', '').replace('None', '')
-            cleaned = pd.Series(cleaned).str.replace(r"[()\-\s]", "", regex=True).iloc[0]
-            return cleaned if cleaned else None
-
-        # Apply the cleaning function to the phone_number column.
-        df['phone_number'] = df['phone_number'].apply(clean_phone)
+        df['phone_number'] = normalize_phone_numbers(df['phone_number'], phone_settings)
         logger.info("Cleaned 'phone_number' column, converting blanks to NULL.")
 
     # Trim whitespace from all object (string) columns, EXCLUDING specific columns
@@ -186,21 +365,22 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
         
     # Drop duplicates within the dataframe based on phone number
     pre_dedupe_rows = len(df)
-    # Identify duplicates, keeping the first occurrence
-    duplicates = df[df.duplicated(subset=['phone_number'], keep='first')]
+    # Identify duplicates, keeping the first occurrence. Missing phones are
+    # replaced by a marker so that they compare equal across chunks as well.
+    phone_keys = df['phone_number'].where(df['phone_number'].notna(), _MISSING_PHONE)
+    duplicate_mask = phone_keys.duplicated(keep='first')
+    if seen_phones is not None:
+        duplicate_mask |= phone_keys.isin(seen_phones)
+        seen_phones.update(phone_keys[~duplicate_mask])
+    duplicates = df[duplicate_mask]
     
     if not duplicates.empty:
         # Save duplicates to a file for review
-        dropped_dir = "etl/dropped_duplicates"
-        os.makedirs(dropped_dir, exist_ok=True)
-        # Use a more descriptive filename, perhaps with a timestamp
-        timestamp = pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')
-        dropped_path = os.path.join(dropped_dir, f"duplicates_{timestamp}.csv")
-        duplicates.to_csv(dropped_path, index=False)
+        dropped_path = _save_rejected_rows(duplicates, "etl/dropped_duplicates", "duplicates", source_name)
         logger.info(f"Saved {len(duplicates)} duplicate rows to {dropped_path}")
 
     # Drop the identified duplicates from the main dataframe
-    df.drop_duplicates(subset=['phone_number'], keep='first', inplace=True)
+    df = df[~duplicate_mask]
     rows_after_dedupe = len(df)
     if pre_dedupe_rows > rows_after_dedupe:
         logger.info(f"Removed {pre_dedupe_rows - rows_after_dedupe} duplicate phone numbers from the source file.")
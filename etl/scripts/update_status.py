@@ -2,8 +2,6 @@ import logging
 import os
 import sys
 from datetime import datetime
-import pandas as pd
-from sqlalchemy import text
 import click
 
 # Add project root to the Python path
@@ -11,83 +9,80 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from etl.scripts.load import get_db_engine
-from etl.scripts.utils import setup_logging
+from etl.scripts.database import get_db_engine
+from etl.scripts.phones import normalize_phone_numbers
+from etl.scripts.status_updates import iter_line_batches, mark_used
+from etl.scripts.utils import load_config, setup_logging
 
-# --- Configuration ---
-setup_logging("etl/logs/update_status.log")
 logger = logging.getLogger(__name__)
 
-def clean_phone_number(phone):
-    """Removes common characters and whitespace from a phone number."""
-    if not isinstance(phone, str):
-        return None
-    return phone.replace(" ", "").replace("(", "").replace(")", "").replace("-", "")
-
 @click.command()
 @click.argument('input_file', type=click.Path(exists=True))
-def update_contacts(input_file):
+@click.option('--batch-size', type=click.IntRange(min=1), default=50_000, help="Phone numbers updated and committed per transaction.")
+@click.option('--unmatched-output', type=click.Path(dir_okay=False), default=None, help="Write the phone numbers not found in the database to this file.")
+def update_contacts(input_file, batch_size, unmatched_output):
     """
     Updates the status of contacts in the database based on a list of phone numbers.
 
     This script will:
     - Set the status to 'used'.
-    - Set the last_used timestamp to the current time.
-    - Add a 'used' tag to the tags array.
+    - Record a 'used' event with the current time (the contact's last_used).
+    - Add a 'used' tag.
+
+    The input file is read in batches. Each batch is copied into a temporary
+    table and applied with a single UPDATE ... FROM join, then committed, so
+    no transaction spans the whole file.
     """
+    setup_logging("etl/logs/update_status.log")
     logger.info(f"--- Starting Contact Status Update from file: {input_file} ---")
-    
-    # Read and clean phone numbers from the input file
-    try:
-        with open(input_file, 'r') as f:
-            raw_phones = [line.strip() for line in f if line.strip()]
-        
-        cleaned_phones = [clean_phone_number(p) for p in raw_phones]
-        # Filter out any None values that may result from cleaning
-        phones_to_update = [p for p in cleaned_phones if p]
-        
-        if not phones_to_update:
-            logger.warning("No valid phone numbers found in the input file.")
-            return
-            
-        logger.info(f"Found {len(phones_to_update)} unique phone numbers to process.")
-
-    except Exception as e:
-        logger.critical(f"Failed to read or process input file: {e}")
-        return
 
+    phone_settings = load_config().get("phone_normalization")
     engine = get_db_engine()
-    updated_count = 0
-    
-    # Using a transaction ensures that all updates succeed or none do.
-    with engine.connect() as connection:
-        with connection.begin(): # Starts a transaction
-            try:
-                # SQL statement to update status, timestamp, and append a tag if not present
-                update_sql = text("""
-                    UPDATE contacts
-                    SET 
-                        status = 'used',
-                        last_used = :current_time,
-                        tags = array_append(tags, 'used')
-                    WHERE phone_number = :phone AND NOT ('used' = ANY(tags));
-                """)
+    used_at = datetime.now()
+    seen = set()
+    input_lines = matched = updated = unmatched_count = 0
+    unmatched_file = open(unmatched_output, "w", encoding="utf-8") if unmatched_output else None
 
-                for phone in phones_to_update:
-                    result = connection.execute(
-                        update_sql,
-                        {"current_time": datetime.now(), "phone": phone}
-                    )
-                    if result.rowcount > 0:
-                        updated_count += result.rowcount
-                        logger.info(f"Successfully updated contact with phone: {phone}")
+    try:
+        for lines in iter_line_batches(input_file, batch_size):
+            input_lines += len(lines)
+            # Filter out any None values that may result from cleaning, and
+            # numbers already handled by an earlier batch.
+            cleaned_phones = normalize_phone_numbers(lines, phone_settings).dropna().unique()
+            phones = [phone for phone in cleaned_phones if phone not in seen]
+            seen.update(phones)
 
-            except Exception as e:
-                logger.error(f"An error occurred during the database update. Rolling back changes. Error: {e}")
-                # The 'with' block will automatically handle the rollback on exception
-                raise
+            result = mark_used(engine, phones, used_at=used_at)
+            matched += result.matched
+            updated += result.updated
+            unmatched_count += len(result.unmatched)
+            if unmatched_file is not None:
+                unmatched_file.writelines(f"{phone}\n" for phone in result.unmatched)
+            logger.info(
+                f"Committed a batch of {len(phones)} phone numbers: {result.matched} matched, "
+                f"{result.updated} updated, {len(result.unmatched)} unmatched."
+            )
+    except Exception as e:
+        logger.error(
+            f"An error occurred during the database update. Batches committed so far are kept "
+            f"({updated} contacts updated); re-running the file is safe. Error: {e}"
+        )
+        raise
+    finally:
+        if unmatched_file is not None:
+            unmatched_file.close()
+
+    if not seen:
+        logger.warning("No valid phone numbers found in the input file.")
+        return
 
-    logger.info(f"--- Update process finished. Successfully updated {updated_count} contacts. ---")
+    logger.info(
+        f"Read {input_lines} lines with {len(seen)} unique phone numbers: {matched} matched "
+        f"({updated} updated, {matched - updated} already used), {unmatched_count} unmatched."
+    )
+    if unmatched_file is not None:
+        logger.info(f"Wrote {unmatched_count} unmatched phone numbers to {unmatched_output}.")
+    logger.info(f"--- Update process finished. Successfully updated {updated} contacts. ---")
 
 if __name__ == "__main__":
-    update_contacts()
\ No newline at end of file
+    update_contacts()
@@ -1,12 +1,41 @@
+import copy
 import logging
+import os
 import sys
+from functools import lru_cache
 from pathlib import Path
 from logging.handlers import RotatingFileHandler
+from typing import Dict
+
+import yaml
+
+@lru_cache(maxsize=None)
+def _read_config(config_path: str) -> Dict:
+    with open(config_path, "r") as f:
+        return yaml.safe_load(f) or {}
+
+def load_config(config_path: str = "config.yaml") -> Dict:
+    """
+    Reads the pipeline configuration.
+
+    Each file is parsed once per process. Callers get their own copy, so
+    they can adjust it without affecting later calls.
+
+    Args:
+        config_path (str): The path to the YAML configuration file.
+
+    Returns:
+        Dict: The parsed configuration.
+    """
+    return copy.deepcopy(_read_config(os.path.abspath(config_path)))
 
 def setup_logging(log_path: str):
     """
     Set up a standardized logger for the ETL pipeline.
 
+    Safe to call more than once: the console handler is only added once,
+    and each log file only gets one handler.
+
     Args:
         log_path (str): The file path for the log file.
     """
@@ -23,11 +52,15 @@ def setup_logging(log_path: str):
     logger.setLevel(logging.INFO)
 
     # Console handler
-    stdout_handler = logging.StreamHandler(sys.stdout)
-    stdout_handler.setFormatter(log_format)
-    logger.addHandler(stdout_handler)
+    if not any(getattr(handler, "stream", None) is sys.stdout for handler in logger.handlers):
+        stdout_handler = logging.StreamHandler(sys.stdout)
+        stdout_handler.setFormatter(log_format)
+        logger.addHandler(stdout_handler)
 
     # File handler (with rotation)
+    log_file = os.path.abspath(log_path)
+    if any(getattr(handler, "baseFilename", None) == log_file for handler in logger.handlers):
+        return logger
     file_handler = RotatingFileHandler(
         log_path, maxBytes=5 * 1024 * 1024, backupCount=3, encoding='utf-8'
     )
@@ -0,0 +1,171 @@
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import pandas as pd
+
+from etl.scripts.manifest import compute_file_hash
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; without it workbooks are parsed on every run
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+
+class XlsxCache:
+    """
+    A cache of XLSX workbooks converted to Parquet.
+
+    Parsing a large workbook is slow, so each workbook is converted once and
+    stored as `<content hash>.parquet`. Later runs, including dry runs, read
+    the columnar copy instead. Because entries are keyed by content, a
+    renamed workbook still hits the cache and an edited one does not.
+
+    Entries are evicted least recently used first once the cache exceeds
+    `max_size_mb`, and when they have not been used for `max_age_days`.
+    """
+
+    def __init__(self, directory: str, max_size_mb: float = 2048, max_age_days: float = 30):
+        self.directory = Path(directory)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional["XlsxCache"]:
+        """
+        Opens the cache configured under 'extract.xlsx_cache' in config.yaml.
+
+        Returns:
+            Optional[XlsxCache]: The cache, or None if it is disabled or
+            pyarrow is not installed.
+        """
+        cache_config = (config.get("extract", {}) or {}).get("xlsx_cache", {}) or {}
+        if not cache_config.get("enabled", False):
+            return None
+        if pq is None:
+            logger.warning("The XLSX cache requires the 'pyarrow' package. Workbooks will be parsed on every run.")
+            return None
+        return cls(
+            cache_config.get("directory", "etl/cache/xlsx"),
+            max_size_mb=cache_config.get("max_size_mb", 2048),
+            max_age_days=cache_config.get("max_age_days", 30),
+        )
+
+    def key(self, file_path: Path, content_hash: Optional[str] = None) -> str:
+        """
+        Returns the cache key of a workbook: the hash of its content. Pass
+        `content_hash` if it is already known, e.g. from the ingestion
+        manifest, so the workbook is not read an extra time to hash it.
+        """
+        return content_hash or compute_file_hash(file_path)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.parquet"
+
+    def _touch(self, path: Path):
+        """Marks an entry as recently used."""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def read(self, key: str) -> Optional[pd.DataFrame]:
+        """
+        Reads a cached workbook.
+
+        Returns:
+            Optional[pd.DataFrame]: The cached rows, or None on a cache miss.
+        """
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            df = pd.read_parquet(path)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable XLSX cache entry {path.name}: {e}")
+            return None
+        self._touch(path)
+        return df
+
+    def iter_chunks(self, key: str, chunk_size: int) -> Optional[Iterator[pd.DataFrame]]:
+        """
+        Reads a cached workbook as DataFrames of at most `chunk_size` rows.
+
+        Returns:
+            Optional[Iterator[pd.DataFrame]]: The chunks, numbered continuously
+            like `extract.iter_data_chunks`, or None on a cache miss.
+        """
+        path = self._path(key)
+        if not path.exists():
+            return None
+        self._touch(path)
+
+        def chunks() -> Iterator[pd.DataFrame]:
+            start = 0
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+                chunk = batch.to_pandas()
+                chunk.index = pd.RangeIndex(start, start + len(chunk))
+                start += len(chunk)
+                yield chunk
+
+        return chunks()
+
+    def write(self, key: str, df: pd.DataFrame) -> bool:
+        """
+        Stores a parsed workbook. The entry is written to a temporary file
+        and renamed, so concurrent readers never see a partial entry.
+
+        Returns:
+            bool: True if the entry was written. Workbooks with columns that
+            Parquet cannot represent (e.g. numbers and text mixed in one
+            column) are not cached.
+        """
+        path = self._path(key)
+        tmp_path = self.directory / f"{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            df.to_parquet(tmp_path, engine="pyarrow")
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not cache workbook as {path.name}; it will be parsed again next time. Error: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return False
+        logger.info(f"Cached workbook as {path.name}.")
+        self.evict()
+        return True
+
+    def evict(self) -> int:
+        """
+        Removes entries older than the age limit, then the least recently
+        used entries until the cache fits the size limit.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        now = time.time()
+        entries = []
+        for path in self.directory.glob("*.parquet"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        removed = 0
+        total_size = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if now - mtime <= self.max_age_seconds and total_size <= self.max_size_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total_size -= size
+            removed += 1
+
+        if removed:
+            logger.info(f"Evicted {removed} entries from the XLSX cache at {self.directory}.")
+        return removed
@@ -0,0 +1,46 @@
+import os
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def pg_engine():
+    """
+    An engine on a scratch database created next to the PostgreSQL database
+    in TEST_DATABASE_URL (a psycopg2 URL). The database is dropped
+    afterwards. Tests using it are skipped when the variable is not set.
+    """
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from sqlalchemy import create_engine, make_url, text
+
+    database = f"test_{uuid.uuid4().hex[:12]}"
+    admin = create_engine(url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as connection:
+        connection.execute(text(f"CREATE DATABASE {database}"))
+    engine = create_engine(make_url(url).set(database=database))
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.connect() as connection:
+            connection.execute(text(f"DROP DATABASE {database} WITH (FORCE)"))
+        admin.dispose()
+
+
+@pytest.fixture
+def pg_connect(pg_engine):
+    """Opens extra raw psycopg2 connections to the scratch database, e.g. for concurrent writers."""
+    connections = []
+
+    def connect():
+        connection = pg_engine.raw_connection()
+        connections.append(connection)
+        return connection
+
+    yield connect
+    for connection in connections:
+        connection.rollback()
+        connection.close()
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from etl.scripts import csv_reader
+from etl.scripts.transform import serialize_rows_to_json
+
+ENGINES = [
+    "c",
+    pytest.param(
+        "pyarrow", marks=pytest.mark.skipif(csv_reader.pa is None, reason="pyarrow is not installed")
+    ),
+]
+
+
+@pytest.fixture
+def report_csv(tmp_path):
+    path = tmp_path / "SalesOutreachReport.csv"
+    path.write_text(
+        "Company Name,Phone,Created,Calls\n"
+        "Acme GmbH,+4930123456,2024-03-01,3\n"
+        "Beta AG,+4940654321,2024-03-02 14:05:00,\n"
+        "Gamma KG,,,1\n",
+        encoding="utf-8",
+    )
+    return path
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_date_columns_are_read_as_text(report_csv, engine):
+    config = {"extract": {"csv_engine": engine}}
+
+    df = csv_reader.read_csv(report_csv, config=config, dtypes={"Phone": "str"})
+
+    assert df["Created"].tolist()[:2] == ["2024-03-01", "2024-03-02 14:05:00"]
+    assert pd.isna(df["Created"].iloc[2])
+    assert df["Phone"].tolist()[:2] == ["+4930123456", "+4940654321"]
+    rows = [json.loads(row) for row in serialize_rows_to_json(df)]
+    assert rows[0]["Created"] == "2024-03-01"
+    assert rows[2]["Created"] is None
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_engines_agree(report_csv, engine):
+    expected = pd.read_csv(report_csv, dtype={"Phone": "str"})
+
+    df = csv_reader.read_csv(report_csv, config={"extract": {"csv_engine": engine}}, dtypes={"Phone": "str"})
+
+    pd.testing.assert_frame_equal(df, expected)
+
+
+@pytest.mark.parametrize("use_fast_backend", [True, False])
+def test_serialize_rows_writes_timestamps_as_iso_strings(use_fast_backend):
+    df = pd.DataFrame({
+        "Created": pd.to_datetime(["2024-03-01 09:30:00", None]),
+        "Name": ["Acme GmbH", "Beta AG"],
+    })
+
+    rows = [json.loads(row) for row in serialize_rows_to_json(df, use_fast_backend=use_fast_backend)]
+
+    assert rows == [
+        {"Created": "2024-03-01T09:30:00", "Name": "Acme GmbH"},
+        {"Created": None, "Name": "Beta AG"},
+    ]
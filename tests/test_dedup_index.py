@@ -0,0 +1,71 @@
+import pytest
+
+pytest.importorskip("rapidfuzz")
+
+from etl.scripts.dedup_index import CompanyNameIndex, NameMatch, normalize_company_name
+
+
+def test_normalization_makes_punctuation_and_case_irrelevant():
+    assert normalize_company_name("ACME, Inc.") == normalize_company_name("  acme   inc ") == "acme inc"
+    assert normalize_company_name(None) == ""
+    assert normalize_company_name(float("nan")) == ""
+
+    index = CompanyNameIndex()
+    index.add(["ACME, Inc."])
+
+    assert index.match(["acme inc", "Acme-Inc"], threshold=100) == [
+        NameMatch("acme, inc.", 100.0),
+        NameMatch("acme, inc.", 100.0),
+    ]
+
+
+def test_threshold():
+    index = CompanyNameIndex()
+    index.add(["Mueller Maschinenbau GmbH"])
+
+    assert index.match(["Mueller Maschinenbau AG"], threshold=80)[0].company_name == "mueller maschinenbau gmbh"
+    assert index.match(["Mueller Maschinenbau AG"], threshold=95) == [None]
+    assert index.match(["Schmidt Logistik"], threshold=50) == [None]
+
+
+def test_ties_go_to_the_earliest_indexed_name():
+    index = CompanyNameIndex()
+    index.add(["Beta Systems", "Systems Beta", "Gamma Systems"])
+
+    assert index.match(["beta systems"], threshold=90) == [NameMatch("beta systems", 100.0)]
+
+    reversed_index = CompanyNameIndex()
+    reversed_index.add(["Systems Beta", "Beta Systems"])
+    assert reversed_index.match(["beta systems"], threshold=90) == [NameMatch("systems beta", 100.0)]
+
+
+def test_names_without_matches_or_candidates():
+    index = CompanyNameIndex()
+    assert index.match(["Acme"], threshold=90) == [None]
+
+    index.add(["Acme Corp", None, ""])
+    assert len(index) == 1
+    assert index.match(["", None, "Zeta Holding"], threshold=90) == [None, None, None]
+
+
+def test_oversized_blocks_are_skipped():
+    index = CompanyNameIndex(blocking_keys=("token",), max_block_size=2)
+    index.add(["Alpha Solutions", "Beta Solutions", "Gamma Solutions"])
+
+    # "solutions" is shared by three names, so only "alpha" narrows the search.
+    assert index.match(["Alpha Solutions"], threshold=90) == [NameMatch("alpha solutions", 100.0)]
+    assert index.match(["Delta Solutions"], threshold=50) == [None]
+
+
+@pytest.mark.parametrize("batch_size, max_pairs", [(1, 1_000_000), (512, 1), (2, 3)])
+def test_batching_does_not_change_results(batch_size, max_pairs):
+    existing = ["Acme Corp", "Acme Corporation", "Beta Systems", "Gamma Logistics", "Delta Foods"]
+    incoming = ["ACME Corp.", "Beta System", "Omega", "Gamma Logistic", "Delta Food GmbH", "acme corporation"]
+    reference = CompanyNameIndex()
+    reference.add(existing)
+    index = CompanyNameIndex(batch_size=batch_size, max_pairs=max_pairs)
+    index.add(existing)
+
+    expected = reference.match(incoming, threshold=85)
+    assert expected[2] is None and sum(match is not None for match in expected) >= 4
+    assert index.match(incoming, threshold=85) == expected
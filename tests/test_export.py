@@ -0,0 +1,156 @@
+import logging
+import uuid
+from datetime import timedelta
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from sqlalchemy import create_engine, text
+
+from etl.scripts import setup_database
+from etl.scripts.export import export_delta
+from etl.scripts.migrations import run_migrations
+
+
+@pytest.fixture
+def contacts_db(pg_engine):
+    """The full contacts schema, set up the way `setup_database` does."""
+    with pg_engine.begin() as connection:
+        for sql in (
+            setup_database.CREATE_TABLE_SQL,
+            setup_database.CREATE_PROFILES_TABLE_SQL,
+            setup_database.ADD_PROFILE_ID_COLUMN_SQL,
+            setup_database.ADD_CONSTRAINT_SQL,
+            setup_database.CREATE_ETL_RUNS_TABLE_SQL,
+            setup_database.CREATE_FILE_MANIFEST_TABLE_SQL,
+        ):
+            connection.execute(text(sql))
+    run_migrations(pg_engine)
+    return pg_engine
+
+
+def _insert_contact(connection, company_name):
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO contacts (company_name) VALUES (%s) RETURNING id, updated_at", (company_name,))
+    return cursor.fetchone()
+
+
+def _record_event(connection, contact_id):
+    connection.cursor().execute("INSERT INTO contact_events (contact_id, event) VALUES (%s, 'used')", (contact_id,))
+
+
+def _add_contact(engine, company_name):
+    connection = engine.raw_connection()
+    try:
+        row = _insert_contact(connection, company_name)
+        connection.commit()
+        return row
+    finally:
+        connection.close()
+
+
+def _export(engine, tmp_path, consumer="dialer"):
+    path = tmp_path / f"{uuid.uuid4().hex}.csv"
+    result = export_delta(engine, consumer, str(path), "csv")
+    ids = sorted(pd.read_csv(path)["id"]) if result.exported else []
+    return result, ids
+
+
+def test_delta_contains_only_changes_since_the_last_export(tmp_path, contacts_db):
+    first, _ = _add_contact(contacts_db, "Acme")
+    second, second_stamp = _add_contact(contacts_db, "Beta")
+
+    result, ids = _export(contacts_db, tmp_path)
+    assert ids == [first, second]
+    assert result.since is None and result.watermark == second_stamp
+
+    result, ids = _export(contacts_db, tmp_path)
+    assert ids == []
+    assert result.since == result.watermark == second_stamp
+
+    # An event alone makes a contact part of the next delta.
+    connection = contacts_db.raw_connection()
+    _record_event(connection, first)
+    connection.commit()
+    connection.close()
+    result, ids = _export(contacts_db, tmp_path)
+    assert ids == [first]
+    assert result.watermark > second_stamp
+
+
+def test_open_writer_holds_the_watermark_before_its_start(tmp_path, contacts_db, pg_connect):
+    used, _ = _add_contact(contacts_db, "Acme")
+    _export(contacts_db, tmp_path)
+
+    # Concurrent contact inserts wait for each other on the contact_stats
+    # rows, so the open writer records an event.
+    writer = pg_connect()
+    _record_event(writer, used)
+    cursor = writer.cursor()
+    cursor.execute("SELECT NOW()::timestamp")
+    writer_start = cursor.fetchone()[0]
+    committed, committed_stamp = _add_contact(contacts_db, "Committed")
+    assert committed_stamp > writer_start
+
+    result, ids = _export(contacts_db, tmp_path)
+    assert ids == [committed]
+    assert result.watermark == writer_start - timedelta(microseconds=1)
+
+    writer.commit()
+    result, ids = _export(contacts_db, tmp_path)
+    # The committed contact is exported again, the late one is not missed.
+    assert ids == [used, committed]
+    assert result.watermark == committed_stamp
+
+
+@pytest.fixture
+def role_engines(contacts_db):
+    """Engines for two roles without pg_read_all_stats: an exporter and a loader."""
+    suffix = uuid.uuid4().hex[:8]
+    roles = [f"test_exporter_{suffix}", f"test_loader_{suffix}"]
+    with contacts_db.begin() as connection:
+        for role in roles:
+            connection.execute(text(f"CREATE ROLE {role}"))
+            connection.execute(text(f"GRANT ALL ON ALL TABLES IN SCHEMA public TO {role}"))
+            connection.execute(text(f"GRANT ALL ON ALL SEQUENCES IN SCHEMA public TO {role}"))
+    engines = [
+        create_engine(contacts_db.url, connect_args={"options": f"-c role={role}"})
+        for role in roles
+    ]
+    try:
+        yield engines
+    finally:
+        for engine in engines:
+            engine.dispose()
+        with contacts_db.begin() as connection:
+            for role in roles:
+                connection.execute(text(f"DROP OWNED BY {role}"))
+                connection.execute(text(f"DROP ROLE {role}"))
+
+
+def test_writer_of_another_role_keeps_the_watermark(tmp_path, role_engines, caplog):
+    exporter, loader = role_engines
+    used, _ = _add_contact(loader, "Acme")
+    _export(exporter, tmp_path)
+
+    # A session of another role that only reads does not hold the watermark.
+    reader = loader.raw_connection()
+    reader.cursor().execute("SELECT COUNT(*) FROM contacts")
+    _, stamp = _add_contact(loader, "Beta")
+    result, _ = _export(exporter, tmp_path)
+    assert result.watermark == stamp
+
+    writer = loader.raw_connection()
+    try:
+        _record_event(writer, used)
+        committed, _ = _add_contact(loader, "Delta")
+        with caplog.at_level(logging.WARNING, logger="etl.scripts.export"):
+            result, ids = _export(exporter, tmp_path)
+        assert ids == [committed]
+        assert result.watermark == result.since == stamp
+        assert "hide their start time" in caplog.text
+    finally:
+        for connection in (reader, writer):
+            connection.rollback()
+            connection.close()
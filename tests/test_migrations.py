@@ -0,0 +1,95 @@
+import pytest
+from click.testing import CliRunner
+
+from etl.scripts import migrations
+from etl.scripts.migrations import (
+    Migration,
+    _describe_version,
+    _pending_gaps,
+    _schema_version,
+    applied_versions,
+    current_version,
+    pending_gaps,
+    run_migrations,
+)
+
+
+@pytest.fixture
+def fake_migrations(monkeypatch):
+    """Replaces the migrations with four small ones, listed out of order; 2 requires a flag."""
+    calls = []
+    requirement = {"met": False}
+
+    def step(version):
+        def run(connection):
+            calls.append(version)
+        return run
+
+    fake = [
+        Migration(3, "three", [step(3), "CREATE TABLE IF NOT EXISTS three (id INTEGER)"], transactional=False),
+        Migration(1, "one", [step(1), "CREATE TABLE one (id INTEGER)"]),
+        Migration(4, "four", [step(4)]),
+        Migration(2, "two", [step(2)], requires=lambda connection: requirement["met"]),
+    ]
+    monkeypatch.setattr(migrations, "MIGRATIONS", fake)
+    return calls, requirement
+
+
+def test_version_stops_at_the_first_pending_migration(fake_migrations):
+    assert _schema_version([]) == 0
+    assert _schema_version([1, 2, 3, 4]) == 4
+    assert _schema_version([1, 3, 4]) == 1
+    assert _pending_gaps([1, 3, 4]) == [2]
+    assert _pending_gaps([1, 2]) == []
+
+    assert _describe_version([1, 2]) == "version 2"
+    assert _describe_version([1, 3, 4]) == "version 1 (pending: 2; applied past them: 3, 4)"
+
+
+def test_migrations_run_in_version_order_and_skipped_ones_stay_pending(pg_engine, fake_migrations):
+    calls, requirement = fake_migrations
+
+    assert run_migrations(pg_engine, target=3) == [1, 3]
+    assert calls == [1, 3]
+    assert current_version(pg_engine) == 1
+    assert pending_gaps(pg_engine) == [2]
+
+    assert run_migrations(pg_engine) == [4]
+    assert applied_versions(pg_engine) == [1, 3, 4]
+    assert current_version(pg_engine) == 1
+
+    requirement["met"] = True
+    assert run_migrations(pg_engine) == [2]
+    assert calls == [1, 3, 4, 2]
+    assert current_version(pg_engine) == 4
+    assert pending_gaps(pg_engine) == []
+    assert run_migrations(pg_engine) == []
+
+
+def test_failed_transactional_migration_is_not_recorded(pg_engine, monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATIONS", [
+        Migration(1, "one", ["CREATE TABLE one (id INTEGER)"]),
+        Migration(2, "broken", ["CREATE TABLE two (id INTEGER)", "SELECT missing_column FROM two"]),
+        Migration(3, "three", ["CREATE TABLE three (id INTEGER)"]),
+    ])
+
+    with pytest.raises(Exception, match="missing_column"):
+        run_migrations(pg_engine)
+
+    assert applied_versions(pg_engine) == [1]
+    with pg_engine.connect() as connection:
+        tables = connection.exec_driver_sql("SELECT to_regclass('two'), to_regclass('three')").one()
+    assert tables == (None, None)
+
+
+def test_status_reports_pending_gaps(pg_engine, fake_migrations, monkeypatch):
+    monkeypatch.setattr(migrations, "get_db_engine", lambda: pg_engine)
+    monkeypatch.setattr(migrations, "setup_logging", lambda path: None)
+    run_migrations(pg_engine)
+
+    result = CliRunner().invoke(migrations.migrate, ["--status"])
+
+    assert result.exit_code == 0, result.output
+    lines = result.output.splitlines()
+    assert lines[1].split() == ["2", "pending", "two"]
+    assert lines[-1] == "Schema version 1 (pending: 2; applied past them: 3, 4)."
@@ -0,0 +1,160 @@
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+from etl.scripts.phone_index import CREATE_PHONE_CHANGE_LOG_SQL, INVALID_KEY, PhoneIndex, phone_keys
+
+# Too many digits for an int64 key.
+LONG_NUMBER = "+49301234567890123456"
+
+
+def test_phone_keys_ignore_formatting_but_keep_plus_and_leading_zeros():
+    keys = phone_keys(["+41 56 204", "'+4156204", "4156204", "04156204", None, "n/a", LONG_NUMBER])
+
+    assert keys[0] == keys[1]
+    assert len({keys[1], keys[2], keys[3]}) == 3
+    assert list(keys[4:]) == [INVALID_KEY] * 3
+
+
+def test_add_compact_reopen_round_trip(tmp_path):
+    index = PhoneIndex(str(tmp_path))
+    index.add(["+4930111", "+4930222", LONG_NUMBER])
+
+    assert index.contains(["+49 30 111", "+4930333", LONG_NUMBER]).tolist() == [True, False, True]
+    assert (tmp_path / "delta.bin").stat().st_size == 2 * 8
+
+    index.compact()
+    index.add(["+4930333"])
+    assert (tmp_path / "delta.bin").stat().st_size == 8
+
+    reopened = PhoneIndex(str(tmp_path))
+    assert len(reopened) == 4
+    assert reopened.contains(["+4930111", "+4930222", "+4930333", LONG_NUMBER, "+4930444"]).tolist() == [
+        True, True, True, True, False,
+    ]
+
+
+def test_read_only_index_keeps_changes_in_memory(tmp_path):
+    PhoneIndex(str(tmp_path)).add(["+4930111"])
+    before = sorted(path.name for path in tmp_path.iterdir())
+
+    index = PhoneIndex(str(tmp_path), read_only=True)
+    index.add(["+4930222"])
+    index.compact()
+
+    assert index.contains(["+4930111", "+4930222"]).tolist() == [True, True]
+    assert sorted(path.name for path in tmp_path.iterdir()) == before
+    assert PhoneIndex(str(tmp_path)).contains(["+4930222"]).tolist() == [False]
+
+
+@pytest.fixture
+def contacts(pg_engine):
+    from sqlalchemy import text
+
+    with pg_engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE contacts (id SERIAL PRIMARY KEY, phone_number TEXT UNIQUE, status TEXT DEFAULT 'active')"
+        ))
+        for statement in CREATE_PHONE_CHANGE_LOG_SQL:
+            connection.execute(text(statement))
+
+    def execute(sql, params=None):
+        with pg_engine.begin() as connection:
+            return connection.execute(text(sql), params or {})
+
+    return execute
+
+
+def _delta_keys(directory):
+    return np.fromfile(directory / "delta.bin", dtype=np.int64)
+
+
+def test_refresh_reads_new_contacts(tmp_path, pg_engine, contacts):
+    contacts("INSERT INTO contacts (phone_number) VALUES ('+4930111'), ('+4930222'), (NULL)")
+    index = PhoneIndex(str(tmp_path))
+    assert not index.verify(pg_engine)  # a new index is built once from the table
+    assert index.rebuild(pg_engine) == 3
+
+    contacts("INSERT INTO contacts (phone_number) VALUES ('+4930333')")
+    assert index.refresh(pg_engine) == 1
+    assert index.watermark == 4
+    assert index.contains(["+4930111", "+4930333", "+4930444"]).tolist() == [True, True, False]
+    assert json.loads((tmp_path / "meta.json").read_text())["watermark"] == 4
+
+
+def test_held_watermark_does_not_log_rows_again(tmp_path, pg_engine, pg_connect, contacts):
+    index = PhoneIndex(str(tmp_path))
+    index.rebuild(pg_engine)
+
+    # A status update does not hold the watermark back.
+    updater = pg_connect()
+    updater.cursor().execute("UPDATE contacts SET status = 'used'")
+    contacts("INSERT INTO contacts (phone_number) VALUES ('+4930111')")
+    index.refresh(pg_engine)
+    assert index.watermark == 1
+    updater.commit()
+
+    # An open insert holds it below its id; later rows are re-read but logged once.
+    loader = pg_connect()
+    loader.cursor().execute("INSERT INTO contacts (phone_number) VALUES ('+4930222')")
+    contacts("INSERT INTO contacts (phone_number) VALUES ('+4930333')")
+    for _ in range(3):
+        index.refresh(pg_engine)
+    assert (index.watermark, index.logged_id) == (1, 3)
+    assert len(_delta_keys(tmp_path)) == 2
+    assert index.contains(["+4930222", "+4930333"]).tolist() == [False, True]
+
+    loader.commit()
+    index.refresh(pg_engine)
+    index.refresh(pg_engine)
+    assert index.watermark == 3
+    assert len(_delta_keys(tmp_path)) == 3
+    assert index.contains(["+4930222"]).tolist() == [True]
+
+
+def test_verify_applies_deletes_and_changed_numbers(tmp_path, pg_engine, contacts):
+    contacts(f"INSERT INTO contacts (phone_number) VALUES ('+4930111'), ('+4930222'), ('+4930333'), ('{LONG_NUMBER}')")
+    index = PhoneIndex(str(tmp_path))
+    index.rebuild(pg_engine)
+
+    contacts(f"DELETE FROM contacts WHERE phone_number IN ('+4930111', '{LONG_NUMBER}')")
+    contacts("UPDATE contacts SET phone_number = '+4930999' WHERE phone_number = '+4930222'")
+    contacts("UPDATE contacts SET status = 'used'")
+
+    reopened = PhoneIndex(str(tmp_path))
+    assert reopened.verify(pg_engine)
+    expected = [False, False, True, True, False]
+    phones = ["+4930111", "+4930222", "+4930333", "+4930999", LONG_NUMBER]
+    assert reopened.contains(phones).tolist() == expected
+    assert contacts("SELECT COUNT(*) FROM contact_phone_changes").scalar() == 0
+
+    reopened.compact()
+    assert PhoneIndex(str(tmp_path)).contains(phones).tolist() == expected
+
+    # A removed number that is stored again counts again.
+    contacts("INSERT INTO contacts (phone_number) VALUES ('+4930111')")
+    reopened.refresh(pg_engine)
+    assert reopened.contains(["+4930111"]).tolist() == [True]
+
+
+def test_read_only_verify_leaves_the_change_log(tmp_path, pg_engine, contacts):
+    contacts("INSERT INTO contacts (phone_number) VALUES ('+4930111')")
+    PhoneIndex(str(tmp_path)).rebuild(pg_engine)
+    contacts("DELETE FROM contacts")
+
+    index = PhoneIndex(str(tmp_path), read_only=True)
+    assert index.verify(pg_engine)
+    assert index.contains(["+4930111"]).tolist() == [False]
+    assert contacts("SELECT COUNT(*) FROM contact_phone_changes").scalar() == 1
+
+
+def test_truncate_requires_a_rebuild(tmp_path, pg_engine, contacts):
+    contacts("INSERT INTO contacts (phone_number) VALUES ('+4930111')")
+    index = PhoneIndex(str(tmp_path))
+    index.rebuild(pg_engine)
+    contacts("TRUNCATE contacts")
+
+    assert not PhoneIndex(str(tmp_path)).verify(pg_engine)
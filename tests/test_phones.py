@@ -0,0 +1,25 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from etl.scripts.phones import normalize_phone_numbers
+
+
+def test_missing_values_become_none():
+    phones = pd.Series(["", "  ", "nan", None, float("nan"), "+49 (30) 123-456"], index=range(10, 16))
+
+    normalized = normalize_phone_numbers(phones)
+
+    assert normalized.dtype == object
+    assert normalized.index.tolist() == list(range(10, 16))
+    assert normalized.tolist() == [None, None, None, None, None, "+4930123456"]
+
+
+def test_float_form_only_loses_its_fraction():
+    normalized = normalize_phone_numbers(["4955868020.0", 301234567.0, 301234567, "0301234567"])
+
+    assert normalized.tolist() == ["4955868020", "301234567", "301234567", "0301234567"]
+
+
+def test_empty_input():
+    assert normalize_phone_numbers([]).tolist() == []
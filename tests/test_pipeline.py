@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+from etl.scripts.pipeline import END_OF_GROUP, Gate, Pipeline, PipelineStopped, iter_groups
+
+
+def _pipeline_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith("pipeline-")]
+
+
+def _double(items):
+    for item in items:
+        yield item * 2
+
+
+def _add_one(items):
+    for item in items:
+        yield item + 1
+
+
+def test_stages_run_in_order():
+    pipeline = Pipeline(range(10), queue_size=2).add_stage("double", _double).add_stage("add", _add_one)
+
+    assert list(pipeline.run("collect")) == [item * 2 + 1 for item in range(10)]
+    assert [stats.name for stats in pipeline.stats] == ["double", "add", "collect"]
+    assert [stats.items for stats in pipeline.stats] == [10, 10, 10]
+    assert not _pipeline_threads()
+
+
+def test_without_stages_the_consumer_reads_the_source():
+    assert list(Pipeline(iter("abc")).run()) == ["a", "b", "c"]
+
+
+def test_stage_error_is_raised_to_the_consumer_and_stops_all_stages():
+    def failing(items):
+        for item in items:
+            if item == 3:
+                raise ValueError("bad item")
+            yield item
+
+    def endless(_):
+        count = 0
+        while True:
+            yield count
+            count += 1
+
+    # The first stage would never finish on its own.
+    pipeline = Pipeline([None], queue_size=1).add_stage("endless", endless).add_stage("failing", failing)
+    received = []
+    with pytest.raises(ValueError, match="bad item"):
+        for item in pipeline.run():
+            received.append(item)
+
+    assert received == [0, 1, 2]
+    assert pipeline.stopped
+    assert not _pipeline_threads()
+
+
+def test_consumer_stopping_early_shuts_the_pipeline_down():
+    produced = []
+
+    def source_stage(items):
+        for item in items:
+            produced.append(item)
+            yield item
+
+    pipeline = Pipeline(range(1_000), queue_size=2).add_stage("produce", source_stage)
+    output = pipeline.run()
+    assert [next(output) for _ in range(3)] == [0, 1, 2]
+    output.close()
+
+    assert pipeline.stopped
+    assert not _pipeline_threads()
+    # The producer ran at most a few queue lengths ahead before it stopped.
+    assert len(produced) < 20
+
+
+def test_consumer_error_shuts_the_pipeline_down():
+    pipeline = Pipeline(range(1_000), queue_size=2).add_stage("double", _double)
+
+    with pytest.raises(KeyError):
+        for item in pipeline.run():
+            if item == 4:
+                raise KeyError(item)
+
+    assert pipeline.stopped
+    assert not _pipeline_threads()
+
+
+def test_gate_waits_for_count_and_stops_with_the_pipeline():
+    gate = Gate()
+    threading.Timer(0.05, gate.advance).start()
+    started = time.perf_counter()
+    gate.wait_for(1)
+    assert time.perf_counter() - started >= 0.04
+
+    pipeline = Pipeline([])
+    pipeline.stop()
+    with pytest.raises(PipelineStopped):
+        gate.wait_for(2, pipeline)
+
+
+def test_iter_groups_splits_raises_and_skips_unread_items():
+    error = RuntimeError("parse failed")
+    items = [
+        ("a", 1), ("a", 2), ("a", END_OF_GROUP),
+        ("b", 3), ("b", error), ("b", END_OF_GROUP),
+        ("c", 4), ("c", 5), ("c", END_OF_GROUP),
+        ("d", END_OF_GROUP),
+    ]
+    groups = iter_groups(items)
+
+    key, group = next(groups)
+    assert (key, list(group)) == ("a", [1, 2])
+    key, group = next(groups)
+    assert key == "b"
+    with pytest.raises(RuntimeError, match="parse failed"):
+        list(group)
+    key, group = next(groups)
+    assert (key, next(group)) == ("c", 4)
+    # The rest of group "c" is skipped when the next group is requested.
+    key, group = next(groups)
+    assert (key, list(group)) == ("d", [])
+    assert next(groups, None) is None